@@ -1,4 +1,5 @@
 from .sql_client import SQLClient
+from .async_sql_client import AsyncSQLClient
 from .flask_client import FlaskClient
 from .dynamo_db_client import DynamoDBClient
 from .redis_client import RedisClient
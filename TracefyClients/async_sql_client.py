@@ -0,0 +1,214 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+import aiomysql  # type: ignore[import-untyped]
+from dotenv import load_dotenv
+
+from TracefyClients.logging import Logging
+from TracefyClients.sql_client import SQLClient
+from TracefyClients.sql_pool import PoolTimeoutError
+from TracefyClients.sql_profiler import QueryInstrumentation, QueryProfiler
+
+load_dotenv()
+logger = Logging("async_sql_client").get_logger()
+
+
+class AsyncSQLClient:
+    """
+    asyncio counterpart of SQLClient backed by an aiomysql connection pool, configured with the same
+    MYSQL_* environment variables. The pool is opened on first use, with `await client.connect()`
+    or with `async with AsyncSQLClient() as client`.
+    Connections run in autocommit mode, execute_transaction wraps its queries in an explicit transaction.
+    """
+
+    def __init__(self, db_config: dict|None=None):
+
+        if not db_config:
+            db_config = {
+                "database": os.getenv("MYSQL_DATABASE", "api"),
+                "host": os.getenv("MYSQL_HOST", "localhost"),
+                "port": int(os.getenv("MYSQL_PORT", "3306")),
+                "user": os.getenv("MYSQL_USER", "mysql"),
+                "password": os.getenv("MYSQL_PASSWORD", "mysql"),
+            }
+
+        # aiomysql names the database argument db
+        self.db_config = dict(db_config)
+        if "database" in self.db_config:
+            self.db_config["db"] = self.db_config.pop("database")
+
+        self.pool_size = int(os.getenv("MYSQL_POOL_SIZE", "3"))
+        self.max_pool_size = max(int(os.getenv("MYSQL_POOL_MAX_SIZE", str(self.pool_size))), self.pool_size)
+        max_retries = int(os.getenv("MYSQL_POOL_RETRIES", "5"))
+        wait_interval = float(os.getenv("MYSQL_POOL_WAIT_INTERVAL", "0.5"))
+        self.timeout = float(os.getenv("MYSQL_POOL_TIMEOUT", str(max_retries * wait_interval)))
+        self.max_packet_size = int(os.getenv("MYSQL_MAX_PACKET_SIZE", str(16 * 1024 * 1024)))
+
+        self.pool: aiomysql.Pool | None = None
+        # concurrent first queries must not open a pool each
+        self._pool_lock = asyncio.Lock()
+        self.instrumentation = QueryInstrumentation(logger)
+
+    async def connect(self):
+        """
+        Open the connection pool
+        """
+        if self.pool is not None:
+            return
+        async with self._pool_lock:
+            if self.pool is None:
+                self.pool = await aiomysql.create_pool(
+                    minsize=self.pool_size,
+                    maxsize=self.max_pool_size,
+                    autocommit=True,
+                    **self.db_config
+                )
+
+    async def close(self):
+        """
+        Close all connections of the pool
+        """
+        async with self._pool_lock:
+            if self.pool is not None:
+                pool, self.pool = self.pool, None
+                pool.close()
+                await pool.wait_closed()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @asynccontextmanager
+    async def get_connection(self, cursor_class=aiomysql.DictCursor):
+        """
+        Borrow a connection and cursor from the pool, raises a PoolTimeoutError
+        when no connection becomes available within MYSQL_POOL_TIMEOUT seconds
+        """
+        await self.connect()
+        start = time.perf_counter()
+        try:
+            connection = await asyncio.wait_for(self.pool.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeoutError(self.timeout) from None
+        # same attribute as the PooledConnection of the sync client, picked up by log()
+        connection.wait_time = time.perf_counter() - start
+
+        try:
+            async with connection.cursor(cursor_class) as cursor:
+                yield connection, cursor
+        finally:
+            self.pool.release(connection)
+
+    @property
+    def profiler(self) -> QueryProfiler:
+        return self.instrumentation.profiler
+
+    def add_query_hook(self, hook):
+        """
+        Register hook(query, duration, rows, pool_wait_time), called after every query with times in seconds
+        """
+        self.instrumentation.add_hook(hook)
+
+    def top_queries(self, n: int = 10, by: str = "total_time") -> list[dict]:
+        """
+        The n slowest or most frequent normalised queries, see QueryProfiler.top
+        """
+        return self.profiler.top(n, by)
+
+    def log(self, connection: aiomysql.Connection, query: str, start: float, rows: int):
+        """
+        Record a finished query, start is the time.perf_counter() before it was executed
+        """
+        self.instrumentation.record(query, time.perf_counter() - start, rows, connection.wait_time)
+
+    async def update(self, query: str, params: tuple):
+        async with self.get_connection() as (connection, cursor):
+            start = time.perf_counter()
+            await cursor.execute(query, params)
+            self.log(connection, query, start, cursor.rowcount)
+
+    async def execute(self, query: str, params=()):
+        async with self.get_connection() as (connection, cursor):
+            start = time.perf_counter()
+            await cursor.execute(query, params)
+            self.log(connection, query, start, cursor.rowcount)
+
+    async def execute_transaction(self, query_list: list[str], params: list[tuple]):
+        results = []
+        async with self.get_connection() as (connection, cursor):
+            await connection.begin()
+            try:
+                for query, param in zip(query_list, params):
+                    start = time.perf_counter()
+                    results.append(await cursor.execute(query, param))
+                    self.log(connection, query, start, cursor.rowcount)
+                await connection.commit()
+            except Exception:
+                await connection.rollback()
+                raise
+        return results
+
+    async def fetch_all(self, query: str, params=()):
+        async with self.get_connection() as (connection, cursor):
+            start = time.perf_counter()
+            await cursor.execute(query, params)
+            data = await cursor.fetchall()
+            self.log(connection, query, start, len(data))
+            return data
+
+    async def fetch_one(self, query: str, params=()):
+        async with self.get_connection() as (connection, cursor):
+            start = time.perf_counter()
+            await cursor.execute(query, params)
+            data = await cursor.fetchone()
+            self.log(connection, query, start, 1 if data else 0)
+            return data
+
+    async def fetch_iter(self, query: str, params=(), batch_size: int = 1000, as_tuple: bool = False):
+        """
+        Stream the rows of a query with an unbuffered cursor, fetching batch_size rows at a time.
+        Rows are dicts, or plain tuples when as_tuple is set. The connection goes back to the pool
+        once the generator is exhausted or closed.
+        """
+        cursor_class = aiomysql.SSCursor if as_tuple else aiomysql.SSDictCursor
+        async with self.get_connection(cursor_class) as (connection, cursor):
+            start = time.perf_counter()
+            count = 0
+            await cursor.execute(query, params)
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                count += len(rows)
+                for row in rows:
+                    yield row
+            # the time includes the time the caller spent on the rows
+            self.log(connection, query, start, count)
+
+    async def insert(self, keys: tuple, values: tuple, table: str):
+        q = SQLClient._insert_statement(keys, table)
+        async with self.get_connection() as (connection, cursor):
+            start = time.perf_counter()
+            await cursor.execute(q, values)
+            self.log(connection, q, start, cursor.rowcount)
+
+    async def insert_many(self, keys: tuple, rows: list[tuple], table: str, chunk_size: int = 1000,
+                          mode: str = "insert", update_keys: tuple | None = None) -> list[int]:
+        """
+        Insert many rows using multi-row INSERT statements, see SQLClient.insert_many.
+        Returns the affected row count of every chunk.
+        """
+        q = SQLClient._insert_statement(keys, table, mode, update_keys)
+        counts = []
+        async with self.get_connection() as (connection, cursor):
+            for chunk in SQLClient._chunk_rows(rows, chunk_size, self.max_packet_size - len(q)):
+                start = time.perf_counter()
+                counts.append(await cursor.executemany(q, chunk))
+                self.log(connection, q, start, counts[-1])
+
+        return counts
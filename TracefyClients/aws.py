@@ -0,0 +1,134 @@
+import os
+import threading
+from typing import Any
+
+import boto3
+from botocore.client import BaseClient
+from botocore.config import Config
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Process wide boto3 sessions and clients, shared by every client of this package. Creating a client loads the
+# service model and opens a new connection pool, which dominates the start-up time of short-lived workers.
+# boto3 clients are thread safe, resources are not: get_resource returns a new, cheap resource object
+# on top of the shared client. Sessions and clients are kept per credentials, without explicit credentials
+# AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY are read on every call, so changing them (e.g. with
+# secretsmanager.load_dictionary_as_env) gives new clients for the new credentials.
+
+_lock = threading.RLock()
+_sessions: dict[tuple, boto3.Session] = {}
+_clients: dict[tuple, BaseClient] = {}
+_resource_classes: dict[str, type] = {}
+_queue_urls: dict[tuple, str] = {}
+
+
+def get_region_name() -> str:
+    return os.getenv("AWS_REGION", "eu-central-1")
+
+
+def client_config() -> Config:
+    """
+    Connection settings of the shared clients, AWS_MAX_POOL_CONNECTIONS should be at least the number of
+    threads using a client at the same time
+    """
+    return Config(
+        max_pool_connections=int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50")),
+        tcp_keepalive=os.getenv("AWS_TCP_KEEPALIVE", "true").lower() == "true",
+    )
+
+
+def _credentials(aws_access_key_id: str | None, aws_secret_access_key: str | None) -> tuple[str | None, str | None]:
+    if aws_access_key_id is None and aws_secret_access_key is None:
+        return os.getenv("AWS_ACCESS_KEY_ID"), os.getenv("AWS_SECRET_ACCESS_KEY")
+    return aws_access_key_id, aws_secret_access_key
+
+
+def get_session(region_name: str | None = None, aws_access_key_id: str | None = None,
+                aws_secret_access_key: str | None = None) -> boto3.Session:
+    """
+    The shared session per region and credentials, by default the credentials of the environment
+    """
+    region_name = region_name or get_region_name()
+    credentials = _credentials(aws_access_key_id, aws_secret_access_key)
+    key = (region_name, *credentials)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = boto3.Session(
+                    aws_access_key_id=credentials[0],
+                    aws_secret_access_key=credentials[1],
+                    region_name=region_name
+                )
+    return session
+
+
+def get_client(service: str, region_name: str | None = None, endpoint_url: str | None = None,
+               aws_access_key_id: str | None = None, aws_secret_access_key: str | None = None) -> BaseClient:
+    """
+    The shared client of a service per region, endpoint and credentials
+    """
+    region_name = region_name or get_region_name()
+    credentials = _credentials(aws_access_key_id, aws_secret_access_key)
+    key = (service, region_name, endpoint_url, *credentials)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                # sessions are not thread safe, clients are only created under the lock.
+                # the stubs only type literal service names
+                client = _clients[key] = get_session(region_name, *credentials).client(  # type: ignore[call-overload]
+                    service, region_name=region_name, endpoint_url=endpoint_url, config=client_config()
+                )
+    return client
+
+
+def get_resource(service: str, region_name: str | None = None, endpoint_url: str | None = None,
+                 aws_access_key_id: str | None = None, aws_secret_access_key: str | None = None) -> Any:
+    """
+    A resource object of a service using the shared client. Typed as Any like boto3.resource for
+    services without stubs, annotate the result with the service resource type where stubs exist
+    """
+    client = get_client(service, region_name, endpoint_url, aws_access_key_id, aws_secret_access_key)
+    resource_class = _resource_classes.get(service)
+    if resource_class is None:
+        with _lock:
+            resource_class = _resource_classes.get(service)
+            if resource_class is None:
+                # the class only depends on the service, not on the credentials
+                resource = get_session(region_name).resource(  # type: ignore[call-overload]
+                    service, region_name=region_name or get_region_name()
+                )
+                resource_class = _resource_classes[service] = type(resource)
+    return resource_class(client=client)
+
+
+def get_queue_url(queue_name: str, region_name: str | None = None, endpoint_url: str | None = None,
+                  create: bool = False, attributes: dict | None = None) -> str:
+    """
+    URL of a queue, resolved once per process. With create the queue is created when it does not exist
+    """
+    key = (queue_name, region_name or get_region_name(), endpoint_url)
+    url = _queue_urls.get(key)
+    if url is None:
+        client: Any = get_client("sqs", region_name, endpoint_url)
+        if create:
+            url = client.create_queue(QueueName=queue_name, Attributes=attributes or {})["QueueUrl"]
+        else:
+            url = client.get_queue_url(QueueName=queue_name)["QueueUrl"]
+        _queue_urls[key] = url
+    return url
+
+
+def clear():
+    """
+    Forget all sessions, clients and queue URLs, e.g. after changing credentials or in tests
+    """
+    with _lock:
+        _sessions.clear()
+        _clients.clear()
+        _resource_classes.clear()
+        _queue_urls.clear()
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+# returned by LRUCache.get for missing keys, so None can be cached as a value
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional time to live (seconds) per entry.
+    on_evict is called with (key, value) for entries pushed out because the cache is full.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float | None = None, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+
+        self._lock = threading.Lock()
+        self._data: OrderedDict = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._hits += 1
+                    return value
+                del self._data[key]
+            self._misses += 1
+            return default
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        evicted = []
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False))
+                self._evictions += 1
+
+        if self.on_evict:
+            for evicted_key, (evicted_value, _) in evicted:
+                self.on_evict(evicted_key, evicted_value)
+
+    def delete(self, key) -> bool:
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self) -> list:
+        with self._lock:
+            return list(self._data.keys())
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,111 @@
+import os
+import threading
+
+from TracefyClients.cache import LRUCache, MISSING
+
+# cached for keys without item
+NOT_FOUND = object()
+
+
+class _Load:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value = None
+        self.error: BaseException | None = None
+        self.invalidated = False
+
+
+class ItemCache:
+    """
+    In-process read-through cache of DynamoDB items. Items are kept for ttl seconds, keys without item
+    for negative_ttl seconds. Concurrent misses on the same key wait for a single load.
+    Cached items are shared between callers, do not modify them.
+    """
+
+    def __init__(self, maxsize: int | None = None, ttl: float | None = None, negative_ttl: float | None = None):
+        maxsize = maxsize or int(os.getenv("AWS_DYNAMODB_CACHE_SIZE", "10000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("AWS_DYNAMODB_CACHE_TTL", "60"))
+        self.negative_ttl = negative_ttl if negative_ttl is not None else float(os.getenv("AWS_DYNAMODB_CACHE_NEGATIVE_TTL", "5"))
+        self.items = LRUCache(maxsize, self.ttl)
+
+        self._lock = threading.Lock()
+        self._loads: dict[tuple, _Load] = {}
+        self._coalesced = 0
+        self._loaded = 0
+        # bumped by every invalidation, see set
+        self.generation = 0
+
+    def get(self, key: tuple):
+        """
+        The cached item, NOT_FOUND for keys cached as missing or MISSING when the key is not cached
+        """
+        return self.items.get(key)
+
+    def set(self, key: tuple, item: dict | None, generation: int | None = None):
+        """
+        Cache an item, None for a key without item. With the generation read before the item was loaded
+        the item is only cached when nothing was invalidated in between
+        """
+        if generation is not None and generation != self.generation:
+            return
+        if item is None:
+            self.items.set(key, NOT_FOUND, self.negative_ttl)
+        else:
+            self.items.set(key, item)
+
+    def get_or_load(self, key: tuple, loader) -> dict | None:
+        """
+        The cached item of key or the item loader() returns, None when there is no item
+        """
+        value = self.items.get(key)
+        if value is not MISSING:
+            return None if value is NOT_FOUND else value
+
+        with self._lock:
+            existing = self._loads.get(key)
+            leader = existing is None
+            if existing is None:
+                load = self._loads[key] = _Load()
+            else:
+                load = existing
+                self._coalesced += 1
+
+        if not leader:
+            load.done.wait()
+            if load.error is not None:
+                raise load.error
+            return load.value
+
+        try:
+            load.value = loader()
+        except BaseException as e:
+            load.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._loads[key]
+                self._loaded += 1
+                # an item written while it was loaded may be stale
+                if load.error is None and not load.invalidated:
+                    self.set(key, load.value)
+            load.done.set()
+        return load.value
+
+    def invalidate(self, key: tuple):
+        with self._lock:
+            load = self._loads.get(key)
+            if load is not None:
+                load.invalidated = True
+            self.generation += 1
+            self.items.delete(key)
+
+    def clear(self):
+        with self._lock:
+            for load in self._loads.values():
+                load.invalidated = True
+            self.generation += 1
+            self.items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.items.stats(), "loads": self._loaded, "coalesced": self._coalesced}
@@ -1,24 +1,98 @@
 import os
-import logging
-import boto3
-from botocore.exceptions import ClientError
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable
+
+from botocore.exceptions import BotoCoreError, ClientError
 from dotenv import load_dotenv
 
+from TracefyClients import aws
+from TracefyClients.cache import MISSING
+from TracefyClients.dynamo_cache import NOT_FOUND, ItemCache
+from TracefyClients.logging import Logging
+
 load_dotenv()
 
+logger = Logging("dynamo_db_client").get_logger()
+
+# DynamoDB limits of BatchWriteItem and BatchGetItem
+MAX_BATCH_WRITE_ITEMS = 25
+MAX_BATCH_GET_KEYS = 100
+# error codes after which a whole batch request is retried
+RETRYABLE_ERRORS = ("ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded",
+                    "InternalServerError", "ServiceUnavailable")
+
+
+class BatchWriteError(RuntimeError):
+    def __init__(self, failed: list[dict]):
+        self.failed = failed
+        msg = f"{len(failed)} DynamoDB writes failed"
+        return super(BatchWriteError, self).__init__(msg)
+
+
+class BatchGetError(RuntimeError):
+    def __init__(self, keys: list[dict]):
+        self.keys = keys
+        msg = f"{len(keys)} DynamoDB keys could not be read"
+        return super(BatchGetError, self).__init__(msg)
+
+
+def _projection(attributes: list[str] | None) -> dict:
+    """
+    ProjectionExpression parameters for attribute names, through placeholders as many names are reserved words
+    """
+    if not attributes:
+        return {}
+    names = {f"#p{i}": attribute for i, attribute in enumerate(attributes)}
+    return {"ProjectionExpression": ", ".join(names), "ExpressionAttributeNames": names}
+
 
 class DynamoDBClient:
-    def __init__(self):
-        self.table = None
-        self.dynamodb = boto3.resource(
-            'dynamodb',
-            region_name=self.get_aws_region(),
+    def __init__(self, table_name: str | None = None, item_cache: ItemCache | None = None):
+        # the Table resource of the bound table, untyped as there are no DynamoDB stubs
+        self.table: Any = None
+        self.table_name: str | None = None
+        self.key_names: list[str] | None = None
+        # get_item and batch_get read through the item cache when set, or with AWS_DYNAMODB_CACHE=true
+        if item_cache is None and os.getenv("AWS_DYNAMODB_CACHE", "false").lower() == "true":
+            item_cache = ItemCache()
+        self.item_cache = item_cache
+        # locally use http://localhost:8000 as endpoint url
+        self.dynamodb = aws.get_resource(
+            'dynamodb', self.get_aws_region(), self.get_aws_dynamodb_endpoint_url(),
             aws_access_key_id=self.get_aws_access_key_id(),
-            aws_secret_access_key=self.get_aws_secret_access_key(),
-            # locally use http://localhost:8000
-            endpoint_url=self.get_aws_dynamodb_endpoint_url()
+            aws_secret_access_key=self.get_aws_secret_access_key()
         )
 
+        table_name = table_name or os.getenv("AWS_DYNAMODB_TABLE")
+        if table_name:
+            self.bind_table(table_name)
+
+    def bind_table(self, table_name: str, key_names: list[str] | None = None):
+        """
+        Use table_name for all operations. key_names, the partition and sort key, are looked up
+        when they are first needed if not given
+        """
+        self.table = self.dynamodb.Table(table_name)
+        self.table_name = table_name
+        self.key_names = key_names
+
+    def get_key_names(self) -> list[str]:
+        if self.key_names is None:
+            self.key_names = [key["AttributeName"] for key in self.table.key_schema]
+        return self.key_names
+
+    def _cache_key(self, item: dict) -> tuple:
+        return (self.table_name, *(item[name] for name in self.get_key_names()))
+
+    def _invalidate(self, items):
+        if self.item_cache is not None:
+            for item in items:
+                self.item_cache.invalidate(self._cache_key(item))
+
     def get_aws_access_key_id(self) -> str:
         return os.getenv("AWS_ACCESS_KEY_ID")
 
@@ -34,6 +108,195 @@ class DynamoDBClient:
     def put_item(self, item):
         try:
             response = self.table.put_item(Item=item)
-            logging.info(f"PutItem succeeded: {response}")
+            logger.debug(f"PutItem succeeded: {response.get('ResponseMetadata', {}).get('RequestId')}")
         except ClientError as e:
-            logging.error(f"Error putting item: {e}")
+            logger.error(f"Error putting item: {e}")
+            raise
+        finally:
+            self._invalidate([item])
+
+    def get_item(self, key: dict, consistent_read: bool = False) -> dict | None:
+        """
+        The item of key or None, through the item cache unless consistent_read is set
+        """
+        def load():
+            return self.table.get_item(Key=key, ConsistentRead=consistent_read).get("Item")
+
+        if self.item_cache is None or consistent_read:
+            return load()
+        return self.item_cache.get_or_load(self._cache_key(key), load)
+
+    def batch_write(self, items: Iterable[dict] = (), delete_keys: Iterable[dict] = (), workers: int = 1, retries: int = 8,
+                    raise_on_failure: bool = False) -> list[dict]:
+        """
+        Put items and delete keys with BatchWriteItem, 25 writes per request on up to workers threads.
+        Only the last write of a key is sent, DynamoDB rejects batches writing a key twice.
+        Unprocessed and throttled writes and connection errors are retried with jittered exponential backoff.
+        Returns the PutRequest / DeleteRequest entries that failed for good, or raises them
+        as BatchWriteError with raise_on_failure
+        """
+        key_names = self.get_key_names()
+        items, delete_keys = list(items), list(delete_keys)
+        writes = {}
+        for item in items:
+            writes[tuple(item[name] for name in key_names)] = {"PutRequest": {"Item": item}}
+        for key in delete_keys:
+            writes[tuple(key[name] for name in key_names)] = {"DeleteRequest": {"Key": key}}
+
+        requests = list(writes.values())
+        chunks = [requests[i:i + MAX_BATCH_WRITE_ITEMS] for i in range(0, len(requests), MAX_BATCH_WRITE_ITEMS)]
+        try:
+            if workers > 1 and len(chunks) > 1:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    failed = [request for chunk in executor.map(lambda c: self._write_chunk(c, retries), chunks) for request in chunk]
+            else:
+                failed = [request for chunk in chunks for request in self._write_chunk(chunk, retries)]
+        finally:
+            # after the writes, so a read racing them can not cache the old item again
+            self._invalidate(items + delete_keys)
+
+        if failed:
+            logger.error(f"{len(failed)} of {len(requests)} writes to {self.table_name} failed")
+            if raise_on_failure:
+                raise BatchWriteError(failed)
+        return failed
+
+    def _write_chunk(self, chunk: list[dict], retries: int) -> list[dict]:
+        client = self.dynamodb.meta.client
+        for attempt in range(retries):
+            try:
+                response = client.batch_write_item(RequestItems={self.table_name: chunk})
+                chunk = response.get("UnprocessedItems", {}).get(self.table_name, [])
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in RETRYABLE_ERRORS:
+                    logger.error(f"BatchWriteItem on {self.table_name} failed: {e}")
+                    return chunk
+            except BotoCoreError as e:
+                # connection resets and timeouts, the whole chunk is sent again
+                logger.warning(f"BatchWriteItem on {self.table_name} failed, retrying: {e}")
+            if not chunk:
+                return []
+            if attempt < retries - 1:
+                # full jitter backoff
+                time.sleep(random.uniform(0, min(0.05 * 2 ** attempt, 5)))
+        return chunk
+
+    def batch_get(self, keys: list[dict], attributes: list[str] | None = None, consistent_read: bool = False,
+                  retries: int = 8) -> list[dict]:
+        """
+        Read the items of keys with BatchGetItem, 100 keys per request. Unprocessed keys are retried with
+        jittered exponential backoff, keys that could not be read are raised as BatchGetError.
+        Items come back in no particular order, missing items are left out.
+        Full items are read through the item cache
+        """
+        key_names = self.get_key_names()
+        unique = list({tuple(key[name] for name in key_names): key for key in keys}.values())
+        items = []
+        cache = self.item_cache if not attributes and not consistent_read else None
+        if cache is not None:
+            uncached = []
+            for key in unique:
+                item = cache.get(self._cache_key(key))
+                if item is MISSING:
+                    uncached.append(key)
+                elif item is not NOT_FOUND:
+                    items.append(item)
+            generation = cache.generation
+            loaded = self._batch_get(uncached, attributes, consistent_read, retries)
+            found = {self._cache_key(item): item for item in loaded}
+            for key in uncached:
+                cache.set(self._cache_key(key), found.get(self._cache_key(key)), generation)
+            return items + loaded
+        return self._batch_get(unique, attributes, consistent_read, retries)
+
+    def _batch_get(self, keys: list[dict], attributes: list[str] | None, consistent_read: bool,
+                   retries: int) -> list[dict]:
+        client = self.dynamodb.meta.client
+        items = []
+        for start in range(0, len(keys), MAX_BATCH_GET_KEYS):
+            request = {"Keys": keys[start:start + MAX_BATCH_GET_KEYS], "ConsistentRead": consistent_read, **_projection(attributes)}
+            for attempt in range(retries):
+                try:
+                    response = client.batch_get_item(RequestItems={self.table_name: request})
+                    items += response.get("Responses", {}).get(self.table_name, [])
+                    request = response.get("UnprocessedKeys", {}).get(self.table_name)
+                except ClientError as e:
+                    if e.response["Error"]["Code"] not in RETRYABLE_ERRORS:
+                        raise
+                if not request:
+                    break
+                if attempt < retries - 1:
+                    time.sleep(random.uniform(0, min(0.05 * 2 ** attempt, 5)))
+            if request:
+                raise BatchGetError(request["Keys"])
+        return items
+
+    def query(self, **kwargs):
+        """
+        Items matching a query, Query parameters as for Table.query, read page by page
+        """
+        yield from self._paginate("query", kwargs)
+
+    def scan(self, **kwargs):
+        """
+        All items of the table, Scan parameters as for Table.scan, read page by page
+        """
+        yield from self._paginate("scan", kwargs)
+
+    def _paginate(self, operation: str, kwargs: dict):
+        kwargs = {"TableName": self.table_name, **kwargs}
+        call = getattr(self.dynamodb.meta.client, operation)
+        while True:
+            response = call(**kwargs)
+            yield from response.get("Items", [])
+            if "LastEvaluatedKey" not in response:
+                return
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def parallel_scan(self, segments: int = 8, attributes: list[str] | None = None, **kwargs):
+        """
+        All items of the table, read as segments scans on one thread each. Only the given attributes
+        are read when set. Items come in no particular order, at most a few pages per segment are buffered
+        """
+        pages: queue.Queue = queue.Queue(maxsize=segments * 2)
+        stopped = threading.Event()
+        done = object()
+
+        def put(page):
+            while not stopped.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def scan_segment(segment: int):
+            params = {"TableName": self.table_name, "Segment": segment, "TotalSegments": segments,
+                      **_projection(attributes), **kwargs}
+            try:
+                while not stopped.is_set():
+                    response = self.dynamodb.meta.client.scan(**params)
+                    put(response.get("Items", []))
+                    if "LastEvaluatedKey" not in response:
+                        break
+                    params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+            except Exception as e:
+                put(e)
+            put(done)
+
+        executor = ThreadPoolExecutor(max_workers=segments)
+        try:
+            for segment in range(segments):
+                executor.submit(scan_segment, segment)
+            running = segments
+            while running:
+                page = pages.get()
+                if page is done:
+                    running -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+        finally:
+            stopped.set()
+            executor.shutdown(wait=False, cancel_futures=True)
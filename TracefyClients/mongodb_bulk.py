@@ -0,0 +1,128 @@
+import atexit
+import threading
+import time
+
+import bson
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, PyMongoError
+from pymongo.write_concern import WriteConcern
+
+from TracefyClients.logging import Logging
+
+logger = Logging("mongodb_bulk").get_logger()
+
+
+class _Buffer:
+    def __init__(self):
+        self.documents: list[dict] = []
+        self.size = 0
+        self.started = time.monotonic()
+
+
+class MongoBulkWriter:
+    """
+    Buffers documents per collection and inserts them with insert_many(ordered=False) once a collection
+    has max_documents documents or max_bytes of BSON buffered, or its oldest document waited flush_interval
+    seconds. Documents that could not be inserted are passed to on_error(collection_name, failed) and logged,
+    every failure being {"document": ..., "code": ..., "error": ...}.
+    write_concern applies to the inserts, WriteConcern(w=0) for fire-and-forget writes (failures are then
+    not reported). Buffered documents are inserted on close(), which also runs at exit.
+    insert_many adds an _id to documents without one.
+    """
+
+    def __init__(self, mongodb_client, max_documents: int = 1000, max_bytes: int = 8 * 1024 * 1024,
+                 flush_interval: float = 1.0, write_concern: WriteConcern | None = None, on_error=None):
+        self.mongodb_client = mongodb_client
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.write_concern = write_concern
+        self.on_error = on_error
+
+        self._lock = threading.Lock()
+        self._buffers: dict[str, _Buffer] = {}
+        self._collections: dict[str, Collection] = {}
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_old_buffers, daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+        self.inserted = 0
+        self.failed = 0
+
+    def add(self, collection_name: str, document: dict):
+        size = len(bson.encode(document))
+        with self._lock:
+            if self._closed.is_set():
+                raise RuntimeError("MongoDB bulk writer is closed")
+            buffer = self._buffers.get(collection_name)
+            if buffer is None:
+                buffer = self._buffers[collection_name] = _Buffer()
+            buffer.documents.append(document)
+            buffer.size += size
+            full = len(buffer.documents) >= self.max_documents or buffer.size >= self.max_bytes
+            if full:
+                del self._buffers[collection_name]
+        if full:
+            self._insert(collection_name, buffer.documents)
+
+    def flush(self) -> list[dict]:
+        """
+        Insert all buffered documents, returns the failures
+        """
+        with self._lock:
+            buffers, self._buffers = self._buffers, {}
+        failed = []
+        for collection_name, buffer in buffers.items():
+            failed += self._insert(collection_name, buffer.documents)
+        return failed
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._flusher.join()
+        self.flush()
+        atexit.unregister(self.close)
+
+    def _collection(self, collection_name: str):
+        collection = self._collections.get(collection_name)
+        if collection is None:
+            collection = self.mongodb_client.get_db().get_collection(collection_name, write_concern=self.write_concern)
+            self._collections[collection_name] = collection
+        return collection
+
+    def _insert(self, collection_name: str, documents: list[dict]) -> list[dict]:
+        try:
+            self._collection(collection_name).insert_many(documents, ordered=False)
+            failed = []
+        except BulkWriteError as e:
+            failed = [
+                {"document": documents[error["index"]], "code": error.get("code"), "error": error.get("errmsg")}
+                for error in e.details.get("writeErrors", [])
+            ]
+            for error in e.details.get("writeConcernErrors", []):
+                logger.error(f"write concern error on {collection_name}: {error.get('errmsg')}")
+        except PyMongoError as e:
+            failed = [{"document": document, "code": getattr(e, "code", None), "error": str(e)} for document in documents]
+
+        with self._lock:
+            self.inserted += len(documents) - len(failed)
+            self.failed += len(failed)
+        if failed:
+            logger.error(f"{len(failed)} of {len(documents)} documents could not be inserted into {collection_name}")
+            if self.on_error:
+                self.on_error(collection_name, failed)
+        return failed
+
+    def _flush_old_buffers(self):
+        while not self._closed.wait(min(self.flush_interval, 1.0)):
+            now = time.monotonic()
+            with self._lock:
+                old = [name for name, buffer in self._buffers.items() if now - buffer.started >= self.flush_interval]
+                buffers = [(name, self._buffers.pop(name)) for name in old]
+            for collection_name, buffer in buffers:
+                try:
+                    self._insert(collection_name, buffer.documents)
+                except Exception as e:
+                    logger.error(f"flushing {collection_name} failed: {e}")
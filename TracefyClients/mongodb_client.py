@@ -2,6 +2,8 @@ import os
 from abc import ABC
 from pymongo import MongoClient
 
+from TracefyClients.mongodb_bulk import MongoBulkWriter
+
 
 class MongoDBClient(ABC):
     def __init__(self):
@@ -19,6 +21,7 @@ class MongoDBClient(ABC):
         )
 
         self.collection = self.db.get_collection(self.get_collection_name())
+        self.collections = {}
         
     def server_info(self):
         return self.client.server_info()
@@ -54,5 +57,13 @@ class MongoDBClient(ABC):
         return self.client
 
     def add_row(self, key, data):
-        collection = self.db[key]
+        collection = self.collections.get(key)
+        if collection is None:
+            collection = self.collections[key] = self.db[key]
         collection.insert_one(data)
+
+    def bulk_writer(self, **kwargs) -> MongoBulkWriter:
+        """
+        Writer that buffers documents and inserts them in bulk, see MongoBulkWriter
+        """
+        return MongoBulkWriter(self, **kwargs)
@@ -0,0 +1,318 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import math
+import pickle
+import random
+import struct
+import time
+import uuid
+import zlib
+
+import redis
+
+from TracefyClients.logging import Logging
+from TracefyClients.redis_client import RedisClient
+
+logger = Logging("redis_cache").get_logger()
+
+# header of a cached value: compute time and expiry (seconds) followed by a format byte
+_HEADER = struct.Struct("!ddc")
+_PICKLE = b"p"
+_ZLIB = b"z"
+# deletes a lock only when it still holds our token, it may have expired and been taken by another process
+_RELEASE_LOCK = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+# adds a value key to a tag set and keeps the set at least as long as the value, EXPIRE GT / NX need Redis 7
+_TAG_VALUE = """
+redis.call('sadd', KEYS[1], ARGV[2])
+if redis.call('ttl', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('expire', KEYS[1], ARGV[1])
+end
+"""
+# how often callers waiting for another process to compute a value look for it
+_POLL_INTERVAL = 0.05
+
+_default_client: RedisClient | None = None
+
+
+def _redis_client() -> RedisClient:
+    global _default_client
+    if _default_client is None:
+        _default_client = RedisClient()
+    return _default_client
+
+
+def dumps(value, delta: float, expiry: float, compress_threshold: int = 1024) -> bytes:
+    """
+    Serialize a value with its compute time and expiry, zlib compressed from compress_threshold bytes on
+    """
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) >= compress_threshold:
+        return _HEADER.pack(delta, expiry, _ZLIB) + zlib.compress(data)
+    return _HEADER.pack(delta, expiry, _PICKLE) + data
+
+
+def loads(data: bytes) -> tuple:
+    """
+    (value, delta, expiry) of a serialized value
+    """
+    delta, expiry, kind = _HEADER.unpack_from(data)
+    payload = data[_HEADER.size:]
+    if kind == _ZLIB:
+        payload = zlib.decompress(payload)
+    return pickle.loads(payload), delta, expiry
+
+
+def _tag_key(prefix: str, tag: str) -> str:
+    return f"{prefix}:tag:{tag}"
+
+
+def invalidate_tags(*tags: str, redis_client: RedisClient | None = None, prefix: str = "cached") -> int:
+    """
+    Delete all cached values stored with any of the tags, returns the amount of deleted values
+    """
+    client = (redis_client or _redis_client()).get_binary_client()
+    deleted = 0
+    for tag in tags:
+        tag_key = _tag_key(prefix, tag)
+        keys = list(client.smembers(tag_key))
+        for start in range(0, len(keys), 1000):
+            deleted += client.unlink(*keys[start:start + 1000])
+        client.unlink(tag_key)
+    return deleted
+
+
+class _Cached:
+    """
+    Cache logic shared by the sync and async wrappers, see cached
+    """
+
+    def __init__(self, func, ttl: int, key, tags, redis_client: RedisClient | None, lock_timeout: float,
+                 beta: float, compress_threshold: int, prefix: str):
+        self.func = func
+        self.ttl = ttl
+        self.key = key
+        self.tags = tags
+        self.redis_client = redis_client
+        self.lock_timeout = lock_timeout
+        self.beta = beta
+        self.compress_threshold = compress_threshold
+        self.prefix = prefix
+        self.name = f"{func.__module__}.{func.__qualname__}"
+        # the repr of an instance is usually unique to the object, methods share their
+        # values between instances by leaving self or cls out of the default key
+        parameters = list(inspect.signature(func).parameters)
+        self.skip_first = bool(parameters) and parameters[0] in ("self", "cls")
+
+    def key_for(self, args, kwargs) -> str:
+        if callable(self.key):
+            key = self.key(*args, **kwargs)
+        elif isinstance(self.key, str):
+            key = self.key.format(*args, **kwargs)
+        else:
+            hashed = args[1:] if self.skip_first else args
+            key = hashlib.sha1(repr((hashed, sorted(kwargs.items()))).encode()).hexdigest()
+        return f"{self.prefix}:{self.name}:{key}"
+
+    def tags_for(self, args, kwargs) -> list[str]:
+        return list(self.tags(*args, **kwargs) if callable(self.tags) else self.tags)
+
+    def refresh_early(self, delta: float, expiry: float) -> bool:
+        """
+        XFetch: recompute a value before it expires with a probability rising towards its expiry,
+        values that take longer to compute are refreshed earlier
+        """
+        return time.time() - delta * self.beta * math.log(random.random() or 1e-12) >= expiry
+
+    def serialize(self, value, delta: float) -> bytes:
+        return dumps(value, delta, time.time() + self.ttl, self.compress_threshold)
+
+    def store(self, pipeline, key: str, data: bytes, tags: list[str]):
+        pipeline.set(key, data, ex=self.ttl)
+        for tag in tags:
+            pipeline.eval(_TAG_VALUE, 1, _tag_key(self.prefix, tag), self.ttl, key)
+
+    def lock_ms(self) -> int:
+        return int(self.lock_timeout * 1000)
+
+
+def cached(ttl: int, key=None, tags=(), redis_client: RedisClient | None = None, lock_timeout: float = 10,
+           beta: float = 1.0, compress_threshold: int = 1024, prefix: str = "cached"):
+    """
+    Cache the results of a function or coroutine function in Redis for ttl seconds.
+
+    key is a format string ("device:{0}") or a function of the arguments, by default the repr of the arguments
+    is hashed, so their repr must identify them. For methods the default key leaves out self (or cls): the value
+    is shared by all instances. Key functions and format strings get self as their first argument.
+    tags, a list or a function of the arguments returning one, group values for invalidate_tags.
+    When a value is missing only one process computes it while the others wait up to lock_timeout seconds
+    for the result, values are recomputed before they expire with a probability that grows towards their
+    expiry (XFetch, higher beta refreshes earlier). Values are pickled and zlib compressed from
+    compress_threshold bytes on. When Redis is unavailable the function is simply called, errors raised
+    by the function itself are passed on untouched.
+
+    Values are stored with pickle, only use a Redis that is trusted: whoever can write the cache keys
+    can run code in every process reading them.
+
+    The wrapper has invalidate(*args, **kwargs) to delete the value cached for some arguments,
+    the same arguments as the function, self included.
+    """
+
+    def decorator(func):
+        cache = _Cached(func, ttl, key, tags, redis_client, lock_timeout, beta, compress_threshold, prefix)
+        if inspect.iscoroutinefunction(func):
+            wrapper = _async_wrapper(cache)
+        else:
+            wrapper = _sync_wrapper(cache)
+        wrapper.key_for = lambda *args, **kwargs: cache.key_for(args, kwargs)
+        return functools.wraps(func)(wrapper)
+
+    return decorator
+
+
+def _sync_wrapper(cache: _Cached):
+    def client():
+        return (cache.redis_client or _redis_client()).get_binary_client()
+
+    def compute(redis_key: str, args, kwargs):
+        start = time.monotonic()
+        value = cache.func(*args, **kwargs)
+        data = cache.serialize(value, time.monotonic() - start)
+        try:
+            pipeline = client().pipeline(transaction=False)
+            cache.store(pipeline, redis_key, data, cache.tags_for(args, kwargs))
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f"could not cache {redis_key}: {e}")
+        return value
+
+    def release(lock_key: str, token: str):
+        try:
+            client().eval(_RELEASE_LOCK, 1, lock_key, token)
+        except redis.RedisError as e:
+            # the lock expires by itself
+            logger.warning(f"could not release {lock_key}: {e}")
+
+    def find(redis_key: str, lock_key: str, token: str) -> tuple[tuple | None, bool]:
+        """
+        Look up a value, only Redis is called: ((value,), False) for a usable value, (None, True) when
+        this call took the lock to compute it and (None, False) when waiting for another process timed out
+        """
+        data = client().get(redis_key)
+        stale = None
+        if data is not None:
+            value, delta, expiry = loads(data)
+            if not cache.refresh_early(delta, expiry):
+                return (value,), False
+            stale = (value,)
+
+        if client().set(lock_key, token, nx=True, px=cache.lock_ms()):
+            return None, True
+        if stale is not None:
+            # someone else is refreshing the value
+            return stale, False
+
+        deadline = time.monotonic() + cache.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(_POLL_INTERVAL)
+            data = client().get(redis_key)
+            if data is not None:
+                return (loads(data)[0],), False
+        return None, False
+
+    def wrapper(*args, **kwargs):
+        redis_key = cache.key_for(args, kwargs)
+        lock_key, token = redis_key + ":lock", uuid.uuid4().hex
+        try:
+            found, locked = find(redis_key, lock_key, token)
+        except redis.RedisError as e:
+            logger.warning(f"redis cache unavailable for {redis_key}: {e}")
+            return cache.func(*args, **kwargs)
+
+        if found is not None:
+            return found[0]
+        if not locked:
+            logger.warning(f"waiting for {redis_key} timed out, computing it")
+        try:
+            return compute(redis_key, args, kwargs)
+        finally:
+            if locked:
+                release(lock_key, token)
+
+    def invalidate(*args, **kwargs):
+        client().unlink(cache.key_for(args, kwargs))
+
+    wrapper.invalidate = invalidate  # type: ignore[attr-defined]
+    return wrapper
+
+
+def _async_wrapper(cache: _Cached):
+    def client():
+        return (cache.redis_client or _redis_client()).get_async_binary_client()
+
+    async def compute(redis_key: str, args, kwargs):
+        start = time.monotonic()
+        value = await cache.func(*args, **kwargs)
+        data = cache.serialize(value, time.monotonic() - start)
+        try:
+            pipeline = client().pipeline(transaction=False)
+            cache.store(pipeline, redis_key, data, cache.tags_for(args, kwargs))
+            await pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f"could not cache {redis_key}: {e}")
+        return value
+
+    async def release(lock_key: str, token: str):
+        try:
+            await client().eval(_RELEASE_LOCK, 1, lock_key, token)
+        except redis.RedisError as e:
+            logger.warning(f"could not release {lock_key}: {e}")
+
+    async def find(redis_key: str, lock_key: str, token: str) -> tuple[tuple | None, bool]:
+        # see find of _sync_wrapper
+        data = await client().get(redis_key)
+        stale = None
+        if data is not None:
+            value, delta, expiry = loads(data)
+            if not cache.refresh_early(delta, expiry):
+                return (value,), False
+            stale = (value,)
+
+        if await client().set(lock_key, token, nx=True, px=cache.lock_ms()):
+            return None, True
+        if stale is not None:
+            return stale, False
+
+        deadline = time.monotonic() + cache.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(_POLL_INTERVAL)
+            data = await client().get(redis_key)
+            if data is not None:
+                return (loads(data)[0],), False
+        return None, False
+
+    async def wrapper(*args, **kwargs):
+        redis_key = cache.key_for(args, kwargs)
+        lock_key, token = redis_key + ":lock", uuid.uuid4().hex
+        try:
+            found, locked = await find(redis_key, lock_key, token)
+        except redis.RedisError as e:
+            logger.warning(f"redis cache unavailable for {redis_key}: {e}")
+            return await cache.func(*args, **kwargs)
+
+        if found is not None:
+            return found[0]
+        if not locked:
+            logger.warning(f"waiting for {redis_key} timed out, computing it")
+        try:
+            return await compute(redis_key, args, kwargs)
+        finally:
+            if locked:
+                await release(lock_key, token)
+
+    async def invalidate(*args, **kwargs):
+        await client().unlink(cache.key_for(args, kwargs))
+
+    wrapper.invalidate = invalidate  # type: ignore[attr-defined]
+    return wrapper
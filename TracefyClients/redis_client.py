@@ -1,20 +1,53 @@
 import os
+from itertools import islice
+
 from dotenv import load_dotenv
 import redis
+import redis.asyncio
+
+from TracefyClients.redis_near_cache import NearCache
 
 load_dotenv()
 
 
+def _chunks(iterable, size: int):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
 class RedisClient:
 
     def __init__(self):
-        self.client = redis.StrictRedis(
-            self.get_host(),
-            self.get_port(),
+        self.pipeline_chunk_size = int(os.getenv("REDIS_PIPELINE_CHUNK_SIZE", "1000"))
+        self.client = redis.StrictRedis(connection_pool=self._create_pool(decode_responses=True))
+        self.binary_client = None
+        self.async_binary_client = None
+        self.near_cache = None
+
+    def _create_pool(self, decode_responses: bool) -> redis.ConnectionPool:
+        """
+        Connection pool with the REDIS_* settings, callers wait up to REDIS_POOL_TIMEOUT seconds
+        for a free connection once REDIS_MAX_CONNECTIONS are in use
+        """
+        return redis.BlockingConnectionPool(**self._pool_kwargs(decode_responses))
+
+    def _pool_kwargs(self, decode_responses: bool) -> dict:
+        socket_timeout = os.getenv("REDIS_SOCKET_TIMEOUT")
+        return dict(
+            host=self.get_host(),
+            port=self.get_port(),
             username=self.get_username(),
             password=self.get_password(),
-            charset="utf-8",
-            decode_responses=True
+            # the charset the client used to be created with, passed as its current name
+            encoding=os.getenv("REDIS_CHARSET", "utf-8"),
+            decode_responses=decode_responses,
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+            timeout=float(os.getenv("REDIS_POOL_TIMEOUT", "20")),
+            socket_timeout=float(socket_timeout) if socket_timeout else None,
+            socket_connect_timeout=float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT", "5")),
+            socket_keepalive=os.getenv("REDIS_SOCKET_KEEPALIVE", "true").lower() == "true",
+            health_check_interval=int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30")),
         )
 
     def get_host(self) -> str:
@@ -31,3 +64,77 @@ class RedisClient:
 
     def get_client(self):
         return self.client
+
+    def get_binary_client(self):
+        """
+        Client that returns raw bytes instead of decoded strings, for binary values
+        """
+        if self.binary_client is None:
+            self.binary_client = redis.StrictRedis(connection_pool=self._create_pool(decode_responses=False))
+        return self.binary_client
+
+    def get_async_binary_client(self):
+        """
+        asyncio client that returns raw bytes, for use from coroutines
+        """
+        if self.async_binary_client is None:
+            self.async_binary_client = redis.asyncio.StrictRedis(
+                connection_pool=redis.asyncio.BlockingConnectionPool(**self._pool_kwargs(decode_responses=False))
+            )
+        return self.async_binary_client
+
+    def get_near_cache(self, prefixes: list[str] | None = None, **kwargs):
+        """
+        In-process cache of the keys with the given prefixes, invalidated by Redis, see NearCache
+        """
+        if self.near_cache is None:
+            self.near_cache = NearCache(self, prefixes, **kwargs)
+        return self.near_cache
+
+    def mget_many(self, keys: list, client=None) -> list:
+        """
+        Values of many keys, None for missing keys, with one MGET per chunk of keys in one pipeline
+        """
+        pipeline = (client or self.client).pipeline(transaction=False)
+        for chunk in _chunks(keys, self.pipeline_chunk_size):
+            pipeline.mget(chunk)
+        return [value for values in pipeline.execute() for value in values]
+
+    def mset_many(self, mapping: dict, ttl: int | None = None, client=None):
+        """
+        Set many keys, expiring after ttl seconds when given, pipelined in chunks
+        """
+        client = client or self.client
+        for chunk in _chunks(mapping.items(), self.pipeline_chunk_size):
+            pipeline = client.pipeline(transaction=False)
+            if ttl is None:
+                pipeline.mset(dict(chunk))
+            else:
+                for key, value in chunk:
+                    pipeline.set(key, value, ex=ttl)
+            pipeline.execute()
+
+    def hgetall_many(self, keys: list, client=None) -> list[dict]:
+        """
+        All fields of many hashes, an empty dict for missing keys, pipelined in chunks
+        """
+        client = client or self.client
+        result = []
+        for chunk in _chunks(keys, self.pipeline_chunk_size):
+            pipeline = client.pipeline(transaction=False)
+            for key in chunk:
+                pipeline.hgetall(key)
+            result += pipeline.execute()
+        return result
+
+    def delete_pattern(self, pattern: str, client=None) -> int:
+        """
+        Delete the keys matching a pattern, found with SCAN and removed with UNLINK in chunks.
+        Returns the amount of deleted keys
+        """
+        client = client or self.client
+        deleted = 0
+        keys = client.scan_iter(match=pattern, count=self.pipeline_chunk_size)
+        for chunk in _chunks(keys, self.pipeline_chunk_size):
+            deleted += client.unlink(*chunk)
+        return deleted
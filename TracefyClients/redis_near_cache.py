@@ -0,0 +1,183 @@
+import threading
+
+import redis
+
+from TracefyClients.cache import LRUCache, MISSING
+from TracefyClients.logging import Logging
+
+logger = Logging("redis_near_cache").get_logger()
+
+INVALIDATE_CHANNEL = "__redis__:invalidate"
+
+
+class NearCache:
+    """
+    In-process LRU of Redis string values kept consistent with server-assisted client side caching:
+    a listener connection enables CLIENT TRACKING in broadcast mode for the key prefixes and receives
+    an invalidation message for every key with such a prefix that changes. Cached values are dropped as
+    soon as their key changes and kept for at most ttl seconds. Keys outside the prefixes get no invalidations,
+    they are kept for fallback_ttl seconds like without tracking.
+    When tracking is not available (Redis < 6, CLIENT disabled) or the listener connection fails, values are
+    kept for fallback_ttl seconds only until tracking works again.
+    """
+
+    def __init__(self, redis_client, prefixes: list[str] | None = None, maxsize: int = 10000, ttl: float = 300,
+                 fallback_ttl: float = 5, tracking: bool = True, reconnect_interval: float = 5):
+        self.redis_client = redis_client
+        self.client = redis_client.get_client()
+        self.prefixes = prefixes or []
+        # no prefixes tracks every key
+        self._tracked_prefixes = tuple(self.prefixes) or ("",)
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.reconnect_interval = reconnect_interval
+        self.values = LRUCache(maxsize)
+
+        self._lock = threading.Lock()
+        # token per key being read, an invalidation while the read is in flight removes it
+        self._pending: dict[str, object] = {}
+        self._tracking = threading.Event()
+        self._stopped = threading.Event()
+        self._pubsub = None
+        self._listener = None
+        self.invalidations = 0
+        if tracking:
+            self._listener = threading.Thread(target=self._listen, daemon=True)
+            self._listener.start()
+            # give the listener a moment so the first reads are already tracked
+            self._tracking.wait(1)
+
+    @property
+    def tracking(self) -> bool:
+        return self._tracking.is_set()
+
+    def ttl_for(self, key: str) -> float:
+        if self.tracking and key.startswith(self._tracked_prefixes):
+            return self.ttl
+        return self.fallback_ttl
+
+    def get(self, key: str):
+        value = self.values.get(key)
+        if value is not MISSING:
+            return value
+
+        token = object()
+        with self._lock:
+            self._pending[key] = token
+        try:
+            value = self.client.get(key)
+        finally:
+            with self._lock:
+                # only cache when the key did not change while it was read
+                current = self._pending.pop(key, None) is token
+        if current:
+            self.values.set(key, value, self.ttl_for(key))
+        return value
+
+    def mget(self, keys: list[str]) -> list:
+        values = [self.values.get(key) for key in keys]
+        missing = [key for key, value in zip(keys, values) if value is MISSING]
+        if missing:
+            token = object()
+            with self._lock:
+                for key in missing:
+                    self._pending[key] = token
+            try:
+                loaded = self.client.mget(missing)
+            finally:
+                with self._lock:
+                    current = [self._pending.pop(key, None) is token for key in missing]
+            found = dict(zip(missing, loaded))
+            for key, is_current in zip(missing, current):
+                if is_current:
+                    self.values.set(key, found[key], self.ttl_for(key))
+            values = [found[key] if value is MISSING else value for key, value in zip(keys, values)]
+        return values
+
+    def set(self, key: str, value, ex: int | None = None):
+        self.client.set(key, value, ex=ex)
+        self.invalidate([key])
+
+    def invalidate(self, keys: list[str] | None):
+        """
+        Drop keys from the cache, all keys with None
+        """
+        with self._lock:
+            if keys is None:
+                self._pending.clear()
+            else:
+                for key in keys:
+                    self._pending.pop(key, None)
+        if keys is None:
+            self.values.clear()
+        else:
+            for key in keys:
+                self.values.delete(key)
+
+    def stats(self) -> dict:
+        return {**self.values.stats(), "tracking": self.tracking, "invalidations": self.invalidations}
+
+    def close(self):
+        self._stopped.set()
+        if self._listener:
+            self._listener.join()
+
+    def _subscribe(self):
+        """
+        Enable tracking on a dedicated connection, redirected to itself, and subscribe it to the invalidations
+        """
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        connection = self.client.connection_pool.get_connection("pubsub")
+        # no automatic resubscribe on reconnect, tracking would be lost, _listen starts over instead
+        pubsub.connection = connection
+        try:
+            connection.send_command("CLIENT", "ID")
+            client_id = connection.read_response()
+            args = ["CLIENT", "TRACKING", "ON", "REDIRECT", client_id, "BCAST"]
+            for prefix in self.prefixes:
+                args += ["PREFIX", prefix]
+            connection.send_command(*args)
+            connection.read_response()
+            pubsub.subscribe(INVALIDATE_CHANNEL)
+        except Exception:
+            pubsub.reset()
+            raise
+        return pubsub
+
+    def _listen(self):
+        warned = False
+        while not self._stopped.is_set():
+            try:
+                self._pubsub = self._subscribe()
+            except redis.RedisError as e:
+                if not warned:
+                    logger.warning(f"client tracking unavailable, caching values for {self.fallback_ttl}s: {e}")
+                    warned = True
+                self._stopped.wait(self.reconnect_interval)
+                continue
+            warned = False
+
+            # values cached without tracking may be stale
+            self.invalidate(None)
+            self._tracking.set()
+            try:
+                while not self._stopped.is_set():
+                    message = self._pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        self._invalidated(message["data"])
+            except redis.RedisError as e:
+                logger.warning(f"invalidation listener failed: {e}")
+            finally:
+                self._tracking.clear()
+                # invalidations may have been missed
+                self.invalidate(None)
+                self._pubsub.reset()
+                self._pubsub = None
+            self._stopped.wait(self.reconnect_interval)
+
+    def _invalidated(self, keys):
+        self.invalidations += 1
+        if keys is None:
+            self.invalidate(None)
+        else:
+            self.invalidate([keys] if isinstance(keys, str) else keys)
@@ -1,35 +1,51 @@
 import datetime
+import io
 import json
 import os
-import boto3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import BotoCoreError, ClientError
 from dotenv import load_dotenv
 
+from TracefyClients import aws
+from TracefyClients.logging import Logging
+
 load_dotenv()
 
+logger = Logging("s3_client").get_logger()
+
 
 class S3Client:
     def __init__(self):
         self.s3_bucket = self.get_bucket()
-        session = boto3.Session(
+        self.s3 = aws.get_client(
+            's3', self.get_region_name(),
             aws_access_key_id=self.get_aws_access_key_id(),
-            aws_secret_access_key=self.get_aws_secret_access_key(),
-            region_name=self.get_region_name()
+            aws_secret_access_key=self.get_aws_secret_access_key()
+        )
+        # the uploads share the connection pool of the client, see AWS_MAX_POOL_CONNECTIONS
+        self.upload_workers = int(os.getenv("S3_UPLOAD_WORKERS", "16"))
+        self.transfer_config = TransferConfig(
+            multipart_threshold=int(os.getenv("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024))),
+            max_concurrency=int(os.getenv("S3_MULTIPART_CONCURRENCY", "4"))
         )
-        self.s3 = session.client('s3')
 
     def _add_to_bucket(self, key, data, prefix: str = ""):
-        current_date = datetime.datetime.now()
-        year = current_date.year
-        month = current_date.month
-        day = current_date.day
-        formatted_path = prefix + self.get_formatted_path(year, month, day, key)
+        formatted_path = self._dated_path(key, prefix)
 
         self.s3.put_object(
             Bucket=self.s3_bucket,
             Key=formatted_path,
             Body=json.dumps(data)
         )
-        print("{} : row processed".format(key))
+        logger.debug("{} : row processed".format(key))
+
+    def _dated_path(self, key, prefix: str = "") -> str:
+        current_date = datetime.datetime.now()
+        return prefix + self.get_formatted_path(current_date.year, current_date.month, current_date.day, key)
 
     def add_to_bucket(self, key, data):
         self._add_to_bucket(
@@ -44,8 +60,54 @@ class S3Client:
             prefix=perfix
         )
 
-    def get_formatted_path(self, year, month, day, key):
-        return f"{year}/{month:02d}/{day:02d}/{key}.json"
+    def add_many_to_bucket(self, items: dict | list[tuple], prefix: str = "", retries: int = 3) -> dict:
+        """
+        Upload many {key: data} items (or (key, data) pairs) to today's path in parallel on
+        S3_UPLOAD_WORKERS threads, bodies from S3_MULTIPART_THRESHOLD on as multipart uploads.
+        Failed uploads are retried, every upload is tried at least once.
+        Returns {"succeeded": count, "failed": {path: error}}
+        """
+        pairs = items.items() if isinstance(items, dict) else items
+        uploads = [(self._dated_path(key, prefix), data) for key, data in pairs]
+
+        failed = {}
+        with ThreadPoolExecutor(max_workers=self.upload_workers) as executor:
+            for path, error in executor.map(lambda upload: self._upload(upload[0], upload[1], retries), uploads):
+                if error is not None:
+                    failed[path] = error
+
+        if failed:
+            logger.error(f"{len(failed)} of {len(uploads)} uploads to {self.s3_bucket} failed")
+        return {"succeeded": len(uploads) - len(failed), "failed": failed}
+
+    def _upload(self, path: str, data, retries: int) -> tuple[str, str | None]:
+        body = json.dumps(data).encode("utf-8")
+        error = None
+        for attempt in range(max(retries, 1)):
+            try:
+                if len(body) < self.transfer_config.multipart_threshold:
+                    # one request, without the thread and buffer overhead of the transfer manager
+                    self.s3.put_object(Bucket=self.s3_bucket, Key=path, Body=body)
+                else:
+                    self.s3.upload_fileobj(io.BytesIO(body), self.s3_bucket, path, Config=self.transfer_config)
+                return path, None
+            except (BotoCoreError, ClientError, S3UploadFailedError) as e:
+                error = str(e)
+                if attempt < retries - 1:
+                    time.sleep(min(0.1 * 2 ** attempt, 2)) # exponential backoff
+        return path, error
+
+    def put_object(self, key: str, body: str | bytes, bucket: str | None = None):
+        self.s3.put_object(Bucket=bucket or self.s3_bucket, Key=key, Body=body)
+
+    def get_object(self, key: str, bucket: str | None = None) -> bytes:
+        return self.s3.get_object(Bucket=bucket or self.s3_bucket, Key=key)["Body"].read()
+
+    def delete_object(self, key: str, bucket: str | None = None):
+        self.s3.delete_object(Bucket=bucket or self.s3_bucket, Key=key)
+
+    def get_formatted_path(self, year, month, day, key, extension: str = ".json"):
+        return f"{year}/{month:02d}/{day:02d}/{key}{extension}"
 
     def get_bucket(self) -> str:
         return os.getenv("S3_BUCKET")
@@ -0,0 +1,150 @@
+import collections
+import datetime
+import gzip
+import io
+import json
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator
+
+import zstandard
+
+from TracefyClients.s3_client import S3Client
+
+# objects up to this size are downloaded ahead completely, larger objects are streamed while they are parsed
+STREAM_THRESHOLD = 8 * 1024 * 1024
+
+
+def _days(start: datetime.date, end: datetime.date) -> Iterator[datetime.date]:
+    day = start
+    while day <= end:
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+class S3ArchiveReader:
+    """
+    Reads the records of a date partitioned archive (YYYY/MM/DD/ under a prefix) as a generator.
+    Partitions are listed by list_workers threads at the same time, at most prefetch objects are downloaded
+    ahead by fetch_workers threads, so memory stays bounded however large the archive is.
+    Reads the <key>.json objects of S3Client.add_to_bucket, every object being one record, and the
+    .ndjson(.gz|.zst) objects of S3NDJSONWriter, every line being one record.
+    Partitions are read in date order, objects in key order within a partition.
+    """
+
+    def __init__(self, s3_client: S3Client, prefix: str = "", list_workers: int = 8, fetch_workers: int = 8,
+                 prefetch: int = 16):
+        self.s3_client = s3_client
+        self.prefix = prefix
+        self.list_workers = list_workers
+        self.fetch_workers = fetch_workers
+        self.prefetch = prefetch
+
+    def read(self, start: datetime.date, end: datetime.date, prefix: str | None = None) -> Iterator:
+        """
+        Records of the partitions from start up to and including end
+        """
+        stopped = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.fetch_workers)
+        pending: collections.deque[tuple[str, Future]] = collections.deque()
+        current: tuple[str, Future] | None = None
+        try:
+            keys = self.keys(start, end, prefix, stopped)
+            for key in keys:
+                pending.append((key, executor.submit(self._fetch, key)))
+                if len(pending) >= self.prefetch:
+                    current = pending.popleft()
+                    yield from self._records(*current)
+            while pending:
+                current = pending.popleft()
+                yield from self._records(*current)
+        finally:
+            stopped.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            # streamed bodies hold a connection of the shared client until they are closed, also the ones
+            # still being fetched
+            for _, future in ([current] if current else []) + list(pending):
+                future.add_done_callback(self._close_body)
+
+    def keys(self, start: datetime.date, end: datetime.date, prefix: str | None = None,
+             stopped: threading.Event | None = None) -> Iterator[str]:
+        """
+        Keys of the partitions from start up to and including end, listed in parallel
+        """
+        prefix = self.prefix if prefix is None else prefix
+        stopped = stopped or threading.Event()
+        days = list(_days(start, end))
+        # every partition gets a small queue of listing pages, listers of later partitions
+        # wait for the reader to catch up
+        pages: list[queue.Queue] = [queue.Queue(maxsize=2) for _ in days]
+        executor = ThreadPoolExecutor(max_workers=self.list_workers)
+        try:
+            for day, out in zip(days, pages):
+                partition = prefix + f"{day.year}/{day.month:02d}/{day.day:02d}/"
+                executor.submit(self._list, partition, out, stopped)
+            for out in pages:
+                while (page := out.get()) is not None:
+                    if isinstance(page, Exception):
+                        raise page
+                    yield from page
+        finally:
+            stopped.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _list(self, partition: str, out: queue.Queue, stopped: threading.Event):
+        paginator = self.s3_client.s3.get_paginator("list_objects_v2")
+        try:
+            for page in paginator.paginate(Bucket=self.s3_client.s3_bucket, Prefix=partition):
+                if not self._put(out, [item["Key"] for item in page.get("Contents", [])], stopped):
+                    return
+        except Exception as e:
+            self._put(out, e, stopped)
+        self._put(out, None, stopped)
+
+    @staticmethod
+    def _put(out: queue.Queue, item, stopped: threading.Event) -> bool:
+        while not stopped.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch(self, key: str):
+        response = self.s3_client.s3.get_object(Bucket=self.s3_client.s3_bucket, Key=key)
+        if response.get("ContentLength", 0) > STREAM_THRESHOLD:
+            return response["Body"]
+        return response["Body"].read()
+
+    @staticmethod
+    def _close_body(future: Future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        body = future.result()
+        if hasattr(body, "close"):
+            body.close()
+
+    def _records(self, key: str, future) -> Iterator:
+        body = future.result()
+        raw = io.BytesIO(body) if isinstance(body, bytes) else body
+        if key.endswith(".json"):
+            yield json.loads(raw.read())
+            return
+
+        lines: Iterable[bytes]
+        if key.endswith(".gz"):
+            lines = gzip.GzipFile(fileobj=raw)
+        elif key.endswith(".zst"):
+            # the stream reader is a raw stream without readline, the buffered reader splits its lines
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            lines = io.BufferedReader(reader)  # type: ignore[arg-type]
+        elif key.endswith(".ndjson"):
+            lines = raw.iter_lines() if hasattr(raw, "iter_lines") else raw
+        else:
+            # not part of the archive
+            return
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
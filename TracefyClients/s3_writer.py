@@ -0,0 +1,251 @@
+import atexit
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+import zlib
+
+import zstandard
+from botocore.exceptions import BotoCoreError, ClientError
+
+from TracefyClients.logging import Logging
+from TracefyClients.s3_client import S3Client
+
+logger = Logging("s3_writer").get_logger()
+
+EXTENSIONS = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+# S3 rejects multipart parts smaller than 5 MB, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def _compressor(compression: str, level: int | None):
+    if compression == "gzip":
+        # wbits 31 writes a gzip header and trailer
+        return zlib.compressobj(level or 6, zlib.DEFLATED, 31)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=level or 3).compressobj()
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+class _RollingObject:
+    def __init__(self, key: str, compressor):
+        self.key = key
+        self.compressor = compressor
+        self.buffer = bytearray()
+        self.upload_id: str | None = None
+        self.parts: list[dict] = []
+        # compressed bytes handed to the upload thread
+        self.size = 0
+        self.records = 0
+        self.day = datetime.date.today()
+        self.opened_at = time.monotonic()
+        # set once the upload thread gave up on the object
+        self.failed = False
+
+
+class _Upload:
+    """
+    A part of an object, or with last set its final data, queued for the upload thread
+    """
+
+    def __init__(self, current: _RollingObject, body: bytes, last: bool = False):
+        self.object = current
+        self.body = body
+        self.last = last
+
+
+class S3NDJSONWriter:
+    """
+    Appends records as lines to compressed NDJSON objects under the date partitioned layout of S3Client,
+    e.g. waypoints/2024/09/12/<host>-<time>-<id>.ndjson.gz. Objects are rolled once they reach max_object_size
+    compressed bytes, are max_age seconds old or the day changes. Compressed data is uploaded as multipart
+    upload parts of part_size bytes while the object is written, objects that stay smaller than one part are
+    uploaded with a single put, part_size must be at least 5 MB.
+
+    Uploads run on a background thread, writers only compress. Failed uploads are retried until they succeed,
+    with up to max_pending_parts parts waiting writers block until S3 catches up. Once the writer is closed an
+    upload is given up after retries attempts, the object is logged and counted in objects_failed.
+    Records still buffered are uploaded on close(), which also runs at exit.
+    """
+
+    def __init__(self, s3_client: S3Client, prefix: str = "", compression: str | None = None,
+                 level: int | None = None, max_object_size: int | None = None, max_age: float | None = None,
+                 part_size: int = MIN_PART_SIZE, max_pending_parts: int = 8, retries: int = 5,
+                 retry_interval: float = 0.5):
+        self.s3_client = s3_client
+        self.prefix = prefix
+        self.compression = compression or os.getenv("S3_WRITER_COMPRESSION") or "gzip"
+        self.level = level
+        self.max_object_size = max_object_size or int(os.getenv("S3_WRITER_MAX_OBJECT_SIZE", str(128 * 1024 * 1024)))
+        self.max_age = max_age or float(os.getenv("S3_WRITER_MAX_AGE", "300"))
+        self.part_size = part_size
+        self.retries = retries
+        self.retry_interval = retry_interval
+        if self.compression not in EXTENSIONS:
+            raise ValueError(f"Unknown compression: {self.compression}")
+
+        self.objects_written = 0
+        self.objects_failed = 0
+
+        self._lock = threading.Lock()
+        self._object: _RollingObject | None = None
+        self._closed = threading.Event()
+        self._uploads: queue.Queue[_Upload | None] = queue.Queue(max_pending_parts)
+        self._uploader = threading.Thread(target=self._upload, daemon=True)
+        self._uploader.start()
+        self._roller = threading.Thread(target=self._roll_old_objects, daemon=True)
+        self._roller.start()
+        atexit.register(self.close)
+
+    def write(self, record):
+        self.write_many([record])
+
+    def write_many(self, records: list):
+        lines = b"".join(json.dumps(record).encode("utf-8") + b"\n" for record in records)
+        with self._lock:
+            if self._closed.is_set():
+                raise RuntimeError("S3 writer is closed")
+            current = self._object
+            if current is not None and current.day != datetime.date.today():
+                self._roll()
+            current = self._open()
+            current.buffer += current.compressor.compress(lines)
+            current.records += len(records)
+            if len(current.buffer) >= self.part_size:
+                self._queue_part(current)
+            if current.size + len(current.buffer) >= self.max_object_size:
+                self._roll()
+
+    def flush(self):
+        """
+        Finish the current object, the next record starts a new one. Blocks until every
+        queued upload is done
+        """
+        with self._lock:
+            self._roll()
+        self._uploads.join()
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._roller.join()
+        self.flush()
+        self._uploads.put(None)
+        self._uploader.join()
+        atexit.unregister(self.close)
+
+    def _open(self) -> _RollingObject:
+        if self._object is None:
+            now = datetime.datetime.now()
+            name = f"{os.getenv('HOSTNAME', 'writer')}-{now:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+            key = self.prefix + self.s3_client.get_formatted_path(
+                now.year, now.month, now.day, name, EXTENSIONS[self.compression]
+            )
+            self._object = _RollingObject(key, _compressor(self.compression, self.level))
+        return self._object
+
+    def _queue_part(self, current: _RollingObject):
+        """
+        Hand the buffered data of the object to the upload thread, called with the lock held
+        so parts are queued in order
+        """
+        body = bytes(current.buffer)
+        current.buffer.clear()
+        current.size += len(body)
+        self._uploads.put(_Upload(current, body))
+
+    def _roll(self):
+        """
+        Finish the current object and queue its upload, called with the lock held
+        """
+        current, self._object = self._object, None
+        if current is None:
+            return
+        current.buffer += current.compressor.flush()
+        body = bytes(current.buffer)
+        current.buffer.clear()
+        self._uploads.put(_Upload(current, body, last=True))
+
+    def _upload(self):
+        while True:
+            upload = self._uploads.get()
+            try:
+                if upload is None:
+                    return
+                self._send(upload)
+            except Exception as e:
+                logger.exception(f"upload to {upload.object.key if upload else None} failed: {e}")
+            finally:
+                self._uploads.task_done()
+
+    def _send(self, upload: _Upload):
+        """
+        Upload a part or finish an object, retrying until it succeeds or, once the writer is closed,
+        retries attempts failed
+        """
+        current = upload.object
+        attempt = 0
+        while not current.failed:
+            try:
+                if upload.last:
+                    self._finish(current, upload)
+                else:
+                    self._upload_part(current, upload.body)
+                return
+            except (BotoCoreError, ClientError) as e:
+                attempt += 1
+                if self._closed.is_set() and attempt >= self.retries:
+                    logger.error(f"writing {current.records} records to {current.key} failed, giving up: {e}")
+                    self._abort(current)
+                    return
+                logger.warning(f"upload to {current.key} failed (attempt {attempt}), retrying: {e}")
+                time.sleep(min(self.retry_interval * 2 ** (attempt - 1), 30))
+
+    def _upload_part(self, current: _RollingObject, body: bytes):
+        s3, bucket = self.s3_client.s3, self.s3_client.s3_bucket
+        if current.upload_id is None:
+            current.upload_id = s3.create_multipart_upload(Bucket=bucket, Key=current.key)["UploadId"]
+        # a part is only counted once uploaded, so a retry reuses its number
+        number = len(current.parts) + 1
+        response = s3.upload_part(Bucket=bucket, Key=current.key, UploadId=current.upload_id, PartNumber=number, Body=body)
+        current.parts.append({"PartNumber": number, "ETag": response["ETag"]})
+
+    def _finish(self, current: _RollingObject, upload: _Upload):
+        s3, bucket = self.s3_client.s3, self.s3_client.s3_bucket
+        if current.upload_id is None:
+            s3.put_object(Bucket=bucket, Key=current.key, Body=upload.body)
+        else:
+            if upload.body:
+                self._upload_part(current, upload.body)
+                # do not upload the last part again when completing fails
+                upload.body = b""
+            s3.complete_multipart_upload(
+                Bucket=bucket, Key=current.key, UploadId=current.upload_id, MultipartUpload={"Parts": current.parts}
+            )
+        self.objects_written += 1
+
+    def _abort(self, current: _RollingObject):
+        current.failed = True
+        self.objects_failed += 1
+        if current.upload_id is None:
+            return
+        try:
+            self.s3_client.s3.abort_multipart_upload(
+                Bucket=self.s3_client.s3_bucket, Key=current.key, UploadId=current.upload_id
+            )
+        except (BotoCoreError, ClientError) as e:
+            logger.error(f"aborting the upload of {current.key} failed: {e}")
+
+    def _roll_old_objects(self):
+        while not self._closed.wait(1):
+            with self._lock:
+                current = self._object
+                if current is None:
+                    continue
+                if time.monotonic() - current.opened_at < self.max_age and current.day == datetime.date.today():
+                    continue
+                self._roll()
@@ -0,0 +1,219 @@
+import hashlib
+import math
+import pickle
+import re
+import threading
+
+import redis
+
+from TracefyClients.cache import LRUCache, MISSING
+from TracefyClients.logging import Logging
+from TracefyClients.redis_client import RedisClient
+
+logger = Logging("sql_cache").get_logger()
+
+# words that end a table reference instead of being its alias
+CLAUSE_KEYWORDS = (
+    "WHERE", "ON", "USING", "JOIN", "INNER", "LEFT", "RIGHT", "OUTER", "CROSS", "NATURAL", "STRAIGHT_JOIN",
+    "GROUP", "ORDER", "HAVING", "LIMIT", "UNION", "EXCEPT", "INTERSECT", "WINDOW", "FOR", "LOCK", "SET",
+    "VALUES", "VALUE", "SELECT", "PARTITION", "USE", "IGNORE", "FORCE", "INTO", "WITH", "RETURNING",
+)
+TABLE_KEYWORD = re.compile(r"\b(?:FROM|JOIN|INTO|UPDATE|TABLE)\s+", re.IGNORECASE)
+# a table name, optionally qualified by its database and followed by an alias
+TABLE_REFERENCE = re.compile(
+    r"\s*(?:`?\w+`?\.)?`?(\w+)`?(?:\s+(?:AS\s+)?(?!(?:%s)\b)`?\w+`?)?\s*" % "|".join(CLAUSE_KEYWORDS),
+    re.IGNORECASE,
+)
+
+
+def tables_in_query(query: str, strict: bool = False) -> frozenset[str] | None:
+    """
+    Names of the tables a query reads from or writes to, lower cased. Comma separated
+    table lists are followed. With strict set, None is returned when a FROM, JOIN, INTO
+    or UPDATE is not followed by a table name (e.g. a derived table), as the query may
+    read tables that are not found
+    """
+    tables = set()
+    for keyword in TABLE_KEYWORD.finditer(query):
+        position = keyword.end()
+        while True:
+            reference = TABLE_REFERENCE.match(query, position)
+            if not reference:
+                if strict:
+                    return None
+                break
+            tables.add(reference.group(1).lower())
+            position = reference.end()
+            if not query.startswith(",", position):
+                break
+            position += 1
+    return frozenset(tables)
+
+
+class QueryCache:
+    """
+    Read-through cache for query results, keyed by query text and params.
+
+    Every table has a version that is part of the cache key, a write to a table bumps its version
+    so all cached results reading that table are missed from then on and age out of the cache.
+    With a RedisClient the results and table versions are shared between processes, otherwise
+    they live in this process only. Restrict caching to slowly changing tables with tables.
+    Queries whose tables can not all be found (e.g. derived tables) are not cached.
+
+    Shared table versions are read from Redis at most once per version_ttl seconds, so writes made
+    by other processes are seen up to version_ttl seconds late. Writes through this cache are seen
+    right away.
+
+    Shared results are stored with pickle, only use a Redis that is trusted: whoever can write
+    the cache keys can run code in every process reading them.
+
+    Cached rows are shared between callers, do not modify them.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60, redis_client: RedisClient | None = None,
+                 redis_ttl: int | None = None, tables: set[str] | None = None, prefix: str = "sqlcache",
+                 version_ttl: float = 1.0):
+        self.local = LRUCache(maxsize, ttl)
+        self.redis = redis_client.get_binary_client() if redis_client else None
+        # Redis expiries are whole seconds, at least one
+        self.redis_ttl = redis_ttl or max(1, math.ceil(ttl))
+        self.tables = frozenset(table.lower() for table in tables) if tables else None
+        self.prefix = prefix
+        self.version_ttl = version_ttl
+        # shared table versions read from redis, kept for version_ttl seconds
+        self._shared_versions = LRUCache(4096, version_ttl)
+
+        self._lock = threading.Lock()
+        self._versions: dict[str, int] = {}
+        self._shared_hits = 0
+        self._shared_misses = 0
+
+    def get_or_load(self, query: str, params, loader, kind: str = ""):
+        """
+        Return the cached result of the query or call loader() and cache what it returns,
+        kind separates results of the same query loaded in different ways (e.g. one row or all rows)
+        """
+        tables = tables_in_query(query, strict=True)
+        if not tables or (self.tables is not None and not tables <= self.tables):
+            return loader()
+
+        try:
+            key = self._key(kind, query, params, tables)
+        except redis.RedisError as e:
+            logger.warning(f"query cache unavailable: {e}")
+            return loader()
+
+        value = self.local.get(key)
+        if value is not MISSING:
+            return value
+
+        if self.redis:
+            value = self._get_shared(key)
+            if value is not MISSING:
+                self.local.set(key, value)
+                return value
+
+        value = loader()
+        self.local.set(key, value)
+        if self.redis:
+            self._set_shared(key, value)
+        return value
+
+    def invalidate(self, tables):
+        """
+        Invalidate all cached results reading any of the tables
+        """
+        tables = [table.lower() for table in tables]
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+        if self.redis and tables:
+            try:
+                pipeline = self.redis.pipeline(transaction=False)
+                for table in tables:
+                    pipeline.incr(self._version_key(table))
+                pipeline.execute()
+            except redis.RedisError as e:
+                logger.error(f"could not invalidate shared query cache for {tables}: {e}")
+            for table in tables:
+                # read the bumped shared version on the next lookup
+                self._shared_versions.delete(table)
+
+    def invalidate_query(self, query: str):
+        """
+        Invalidate all cached results reading a table the (write) query touches
+        """
+        self.invalidate(tables_in_query(query) or ())
+
+    def stats(self) -> dict:
+        stats = {"local": self.local.stats()}
+        hits = stats["local"]["hits"]
+        if self.redis:
+            lookups = self._shared_hits + self._shared_misses
+            stats["shared"] = {
+                "hits": self._shared_hits,
+                "misses": self._shared_misses,
+                "hit_ratio": self._shared_hits / lookups if lookups else 0.0,
+            }
+            hits += self._shared_hits
+
+        # every lookup starts in the local tier
+        lookups = stats["local"]["hits"] + stats["local"]["misses"]
+        stats["hit_ratio"] = hits / lookups if lookups else 0.0
+        return stats
+
+    def _key(self, kind: str, query: str, params, tables: frozenset[str]) -> str:
+        names = sorted(tables)
+        if self.redis:
+            versions = self._get_shared_versions(names)
+        else:
+            with self._lock:
+                versions = [self._versions.get(table, 0) for table in names]
+
+        digest = hashlib.sha1(f"{kind}\0{query}\0{params!r}\0{versions!r}".encode()).hexdigest()
+        return f"{self.prefix}:{digest}"
+
+    def _get_shared_versions(self, tables: list[str]) -> list[int]:
+        """
+        Shared versions of the tables, only the ones not read within version_ttl seconds come from redis
+        """
+        versions = {}
+        missing = []
+        for table in tables:
+            version = self._shared_versions.get(table) if self.version_ttl > 0 else MISSING
+            if version is MISSING:
+                missing.append(table)
+            else:
+                versions[table] = version
+
+        if missing:
+            loaded = self.redis.mget([self._version_key(table) for table in missing])
+            for table, version in zip(missing, loaded):
+                versions[table] = int(version or 0)
+                if self.version_ttl > 0:
+                    self._shared_versions.set(table, versions[table])
+        return [versions[table] for table in tables]
+
+    def _version_key(self, table: str) -> str:
+        return f"{self.prefix}:version:{table}"
+
+    def _get_shared(self, key: str):
+        try:
+            data = self.redis.get(key)
+        except redis.RedisError as e:
+            logger.warning(f"could not read shared query cache: {e}")
+            return MISSING
+
+        with self._lock:
+            if data is None:
+                self._shared_misses += 1
+                return MISSING
+            self._shared_hits += 1
+        return pickle.loads(data)
+
+    def _set_shared(self, key: str, value):
+        try:
+            self.redis.set(key, pickle.dumps(value), ex=self.redis_ttl)
+        except redis.RedisError as e:
+            logger.warning(f"could not write shared query cache: {e}")
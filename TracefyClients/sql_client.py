@@ -1,20 +1,29 @@
 import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dotenv import load_dotenv
 import mysql.connector
 from mysql.connector.abstracts import MySQLCursorAbstract
-import random
-import time
 
-from mysql.connector.pooling import PooledMySQLConnection
 from TracefyClients.logging import Logging
+from TracefyClients.sql_cache import QueryCache
+from TracefyClients.sql_pool import BlockingConnectionPool, PooledConnection
+from TracefyClients.sql_profiler import QueryInstrumentation, QueryProfiler
+from TracefyClients.sql_replicas import Replica, ReplicaSet
+from TracefyClients.sql_schema import SchemaIntrospector
 
 load_dotenv()
 logger = Logging("sql_client").get_logger()
 
+# depth of nested read_your_writes blocks in the current thread or task
+_pin_primary: ContextVar[int] = ContextVar("pin_primary", default=0)
+
 
 class SQLClient:
 
-    def __init__(self, db_config: dict|None=None):
+    def __init__(self, db_config: dict|None=None, query_cache: QueryCache|None=None,
+                 replica_configs: list[dict]|None=None):
 
         if not db_config: 
             db_config = {
@@ -25,35 +34,85 @@ class SQLClient:
                 "password": os.getenv("MYSQL_PASSWORD", "mysql"),
             }
 
-        pool_name = f"pool_{random.randint(1,100)}" # get a random name
-
-        self.pool = mysql.connector.pooling.MySQLConnectionPool(
-            pool_name=pool_name,
-            pool_size=int(os.getenv("MYSQL_POOL_SIZE", "3")),
-            **db_config
+        self.pool_size = int(os.getenv("MYSQL_POOL_SIZE", "3"))
+        self.max_pool_size = int(os.getenv("MYSQL_POOL_MAX_SIZE", str(self.pool_size)))
+        # the timeout defaults to the time the old retry loop would wait before giving up
+        max_retries = int(os.getenv("MYSQL_POOL_RETRIES", "5"))
+        wait_interval = float(os.getenv("MYSQL_POOL_WAIT_INTERVAL", "0.5"))
+        self.pool_timeout = float(os.getenv("MYSQL_POOL_TIMEOUT", str(max_retries * wait_interval)))
+
+        # prepared statements are deallocated by a session reset, so sessions are kept between checkouts
+        self.prepared_statements = os.getenv("MYSQL_PREPARED_STATEMENTS", "false").lower() in ("1", "true")
+        self.statement_cache_size = int(os.getenv("MYSQL_PREPARED_STATEMENT_CACHE_SIZE", "100"))
+
+        self.pool = self._create_pool(db_config, self.pool_size)
+
+        # reads go to the replicas when configured, writes and transactions stay on the primary pool above
+        if replica_configs is None:
+            replica_configs = self._replica_configs_from_env(db_config)
+        self.replicas = None
+        if replica_configs:
+            self.replicas = ReplicaSet(
+                [
+                    # replica connections are opened on demand, so an unavailable replica does not stop the client
+                    Replica(f"{config['host']}:{config.get('port', 3306)}", self._create_pool(config, 0))
+                    for config in replica_configs
+                ],
+                selection=os.getenv("MYSQL_REPLICA_SELECTION", "round_robin"),
+                max_failures=int(os.getenv("MYSQL_REPLICA_MAX_FAILURES", "3")),
+                health_check_interval=float(os.getenv("MYSQL_REPLICA_HEALTH_CHECK_INTERVAL", "10")),
+                checkout_timeout=float(os.getenv("MYSQL_REPLICA_CHECKOUT_TIMEOUT", "0.05")),
+            )
+            self.replicas.start()
+
+        # results of fetch_one and fetch_all are cached when a QueryCache is given, writes invalidate them
+        self.query_cache = query_cache
+
+        self.instrumentation = QueryInstrumentation(logger)
+        self.schema = SchemaIntrospector(self, db_config.get("database"))
+
+        # keep well below the server max_allowed_packet (MySQL 8 default is 64MB)
+        self.max_packet_size = int(os.getenv("MYSQL_MAX_PACKET_SIZE", str(16 * 1024 * 1024)))
+    
+    def _create_pool(self, db_config: dict, pool_size: int) -> BlockingConnectionPool:
+        return BlockingConnectionPool(
+            db_config,
+            pool_size=pool_size,
+            max_size=self.max_pool_size,
+            timeout=self.pool_timeout,
+            reset_session=not self.prepared_statements,
+            statement_cache_size=self.statement_cache_size,
         )
 
-        self.max_retries = int(os.getenv("MYSQL_POOL_RETRIES", "5"))
-        self.wait_interval = float(os.getenv("MYSQL_POOL_WAIT_INTERVAL", "0.5"))
-    
-    def get_connection(self):
+    def _replica_configs_from_env(self, db_config: dict) -> list[dict]:
         """
-        Get a connection from the connection pool
+        Replica configs from the comma separated host[:port] list in MYSQL_REPLICA_HOSTS,
+        the other settings are the same as the primary
         """
-        retries = 0
-        while retries < self.max_retries:
-            try:
-                connection = self.pool.get_connection()
-                break
-            except mysql.connector.errors.PoolError:
-                retries += 1
-                time.sleep(self.wait_interval)
-                print(f"connection pool exhausted! Retries: {retries} with timeout: {self.wait_interval} sec")
-
-        cursor: MySQLCursorAbstract = connection.cursor(buffered=True, dictionary=True)
+        configs = []
+        for host in os.getenv("MYSQL_REPLICA_HOSTS", "").split(","):
+            host = host.strip()
+            if not host:
+                continue
+            host, _, port = host.partition(":")
+            configs.append({**db_config, "host": host, "port": int(port or db_config.get("port", 3306))})
+        return configs
+
+    def get_connection(self, buffered: bool = True, dictionary: bool = True, read_only: bool = False):
+        """
+        Get a connection from the connection pool, raises a PoolTimeoutError
+        when no connection becomes available within MYSQL_POOL_TIMEOUT seconds.
+        With read_only set the connection comes from a replica when available
+        """
+        connection = None
+        if read_only and self.replicas and not _pin_primary.get():
+            connection = self.replicas.get_connection()
+        if connection is None:
+            connection = self.pool.get_connection()
+        cursor: MySQLCursorAbstract = connection.cursor(buffered=buffered, dictionary=dictionary)
         return connection, cursor
 
-    def close_connection(self, connection: PooledMySQLConnection, cursor: MySQLCursorAbstract):
+    def close_connection(self, connection: PooledConnection, cursor: MySQLCursorAbstract):
         """
         Give back the cursor and connection tool the pool
         """
@@ -62,72 +121,264 @@ class SQLClient:
         connection.close()
 
 
-    def log(self, cursor: MySQLCursorAbstract):
-        logger.info("Query {}".format(cursor.statement))
-        logger.info("Affected rows: {}".format(cursor.rowcount))
+    @contextmanager
+    def read_your_writes(self):
+        """
+        Send the reads within this block to the primary, so they see the writes made before
+        """
+        token = _pin_primary.set(_pin_primary.get() + 1)
+        try:
+            yield
+        finally:
+            _pin_primary.reset(token)
 
-    def update(self, query: str, params: tuple):
-        connection, cursor = self.get_connection()
+    def _report_read(self, connection: PooledConnection, error: Exception | None = None):
+        """
+        Count the outcome of a read toward the health of the replica it ran on
+        """
+        if self.replicas and connection.replica is not None:
+            self.replicas.report(connection.replica, error)
+
+    def pool_stats(self) -> dict:
+        """
+        Live statistics of the connection pool, see BlockingConnectionPool.stats
+        """
+        stats = self.pool.stats()
+        if self.replicas:
+            stats["replicas"] = self.replicas.stats()
+        return stats
 
+    def _execute(self, connection: PooledConnection, cursor: MySQLCursorAbstract, query: str, params=()):
+        """
+        Execute a query, through a cached prepared statement when MYSQL_PREPARED_STATEMENTS is enabled.
+        Returns the cursor holding the result
+        """
+        if self.prepared_statements:
+            return connection.execute_prepared(query, params)
         cursor.execute(query, params)
-        connection.commit()
-        self.log(cursor)
+        return cursor
 
-        self.close_connection(connection, cursor)
+    def _invalidate(self, query: str):
+        if self.query_cache:
+            self.query_cache.invalidate_query(query)
 
-    def execute(self, query: str, params=(), multi=False):
-        connection, cursor = self.get_connection()
+    @property
+    def profiler(self) -> QueryProfiler:
+        return self.instrumentation.profiler
 
-        cursor.execute(query, params=params, multi=multi)
-        connection.commit()
-        self.log(cursor)
+    def add_query_hook(self, hook):
+        """
+        Register hook(query, duration, rows, pool_wait_time), called after every query with times in seconds
+        """
+        self.instrumentation.add_hook(hook)
 
-        self.close_connection(connection, cursor)
+    def top_queries(self, n: int = 10, by: str = "total_time") -> list[dict]:
+        """
+        The n slowest or most frequent normalised queries, see QueryProfiler.top
+        """
+        return self.profiler.top(n, by)
+
+    def log(self, connection: PooledConnection, query: str, start: float, rows: int):
+        """
+        Record a finished query, start is the time.perf_counter() before it was executed
+        """
+        self.instrumentation.record(query, time.perf_counter() - start, rows, connection.wait_time)
+
+    def update(self, query: str, params: tuple):
+        connection, cursor = self.get_connection()
+        try:
+            start = time.perf_counter()
+            result = self._execute(connection, cursor, query, params)
+            connection.commit()
+            self.log(connection, query, start, result.rowcount)
+        finally:
+            self.close_connection(connection, cursor)
+        self._invalidate(query)
+
+    def execute(self, query: str, params=(), multi=False):
+        connection, cursor = self.get_connection()
+        try:
+            start = time.perf_counter()
+            cursor.execute(query, params=params, multi=multi)
+            connection.commit()
+            self.log(connection, query, start, cursor.rowcount)
+        finally:
+            self.close_connection(connection, cursor)
+        self._invalidate(query)
 
     def execute_transaction(self, query_list: list[str], params: list[tuple]):
         connection, cursor = self.get_connection()
         results = []
         try:
             for query, param in zip(query_list, params):
+                start = time.perf_counter()
                 result = cursor.execute(query, param)
                 results.append(result)
+                self.log(connection, query, start, cursor.rowcount)
             connection.commit()
-            self.log(cursor)
         except mysql.connector.Error as e:
             connection.rollback()
             raise e
         finally:
             self.close_connection(connection, cursor)
+        for query in query_list:
+            self._invalidate(query)
         return results
 
-    def fetch_all(self, query: str, params=()):
-        connection, cursor = self.get_connection()
-
-        cursor.execute(query, params)
-        data = cursor.fetchall()
+    def fetch_all(self, query: str, params=(), cache: bool = True):
+        """
+        Fetch all rows of a query, served from the query cache when configured and cache is set
+        """
+        if self.query_cache and cache:
+            return self.query_cache.get_or_load(query, params, lambda: self._fetch_all(query, params), "all")
+        return self._fetch_all(query, params)
 
-        self.close_connection(connection, cursor)
+    def _fetch_all(self, query: str, params=()):
+        connection, cursor = self.get_connection(read_only=True)
+        try:
+            start = time.perf_counter()
+            result = self._execute(connection, cursor, query, params)
+            data = result.fetchall()
+            self.log(connection, query, start, len(data))
+        except mysql.connector.Error as e:
+            self._report_read(connection, e)
+            raise
+        finally:
+            self.close_connection(connection, cursor)
+        self._report_read(connection)
         return data
 
+    def fetch_iter(self, query: str, params=(), batch_size: int = 1000, as_tuple: bool = False):
+        """
+        Stream the rows of a query with an unbuffered cursor, fetching batch_size rows at a time.
+        Rows are dicts, or plain tuples when as_tuple is set. The connection goes back to the pool
+        once the generator is exhausted or closed.
+        """
+        connection, cursor = self.get_connection(buffered=False, dictionary=not as_tuple, read_only=True)
+        start = time.perf_counter()
+        count = 0
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                count += len(rows)
+                yield from rows
+            # the time includes the time the caller spent on the rows
+            self.log(connection, query, start, count)
+        except mysql.connector.Error as e:
+            self._report_read(connection, e)
+            raise
+        else:
+            self._report_read(connection)
+        finally:
+            # an unbuffered cursor must read the remaining rows before the connection can be reused
+            connection.consume_results()
+            self.close_connection(connection, cursor)
+
     def insert(self, keys: tuple, values: tuple, table: str):
-        key_str = ", ".join([f"`{key}`" for key in keys])  
-        val_str = ", ".join(["%s"] * len(keys))
-        q = f"INSERT INTO {table} ({key_str}) VALUES ({val_str})"
+        q = self._insert_statement(keys, table)
         connection, cursor = self.get_connection()
+        try:
+            start = time.perf_counter()
+            result = self._execute(connection, cursor, q, values)
+            connection.commit()
+            self.log(connection, q, start, result.rowcount)
+        finally:
+            self.close_connection(connection, cursor)
+        self._invalidate(q)
 
-        cursor.execute(q, values)
-        connection.commit()
-        self.log(cursor)
-
-        self.close_connection(connection, cursor)
+    def insert_many(self, keys: tuple, rows: list[tuple], table: str, chunk_size: int = 1000,
+                    mode: str = "insert", update_keys: tuple | None = None) -> list[int]:
+        """
+        Insert many rows using multi-row INSERT statements, committing once per chunk.
+        A chunk is cut at chunk_size rows or when the statement would exceed max_packet_size.
 
-    def fetch_one(self, query: str, params=()):
+        mode "insert" (default) performs a plain INSERT, "ignore" an INSERT IGNORE and "update"
+        an upsert with ON DUPLICATE KEY UPDATE on update_keys (default: all keys).
+        Returns the affected row count of every chunk.
+        """
+        q = self._insert_statement(keys, table, mode, update_keys)
+        counts = []
         connection, cursor = self.get_connection()
-        cursor.execute(query, params)
+        try:
+            for chunk in self._chunk_rows(rows, chunk_size, self.max_packet_size - len(q)):
+                start = time.perf_counter()
+                cursor.executemany(q, chunk)
+                connection.commit()
+                counts.append(cursor.rowcount)
+                self.log(connection, q, start, cursor.rowcount)
+        except mysql.connector.Error as e:
+            connection.rollback()
+            raise e
+        finally:
+            self.close_connection(connection, cursor)
+            # chunks committed before a failure changed the table as well
+            self._invalidate(q)
 
-        data = cursor.fetchone()
+        return counts
 
-        self.close_connection(connection, cursor)
+    @staticmethod
+    def _insert_statement(keys: tuple, table: str, mode: str = "insert",
+                          update_keys: tuple | None = None) -> str:
+        key_str = ", ".join([f"`{key}`" for key in keys])
+        val_str = ", ".join(["%s"] * len(keys))
+
+        if mode == "insert":
+            return f"INSERT INTO {table} ({key_str}) VALUES ({val_str})"
+        if mode == "ignore":
+            return f"INSERT IGNORE INTO {table} ({key_str}) VALUES ({val_str})"
+        if mode == "update":
+            update_str = ", ".join([f"`{key}` = VALUES(`{key}`)" for key in (update_keys or keys)])
+            return f"INSERT INTO {table} ({key_str}) VALUES ({val_str}) ON DUPLICATE KEY UPDATE {update_str}"
+        raise ValueError(f"Unknown insert mode: {mode}")
+
+    @staticmethod
+    def _chunk_rows(rows, chunk_size: int, max_bytes: int):
+        """
+        Split rows into chunks of at most chunk_size rows and roughly max_bytes of values
+        """
+        chunk: list[tuple] = []
+        chunk_bytes = 0
+        for row in rows:
+            # rough size of the row once rendered into the statement, quotes and separators included
+            row_bytes = sum(len(str(value)) + 3 for value in row) + 3
+            if chunk and (len(chunk) >= chunk_size or chunk_bytes + row_bytes > max_bytes):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk.append(row)
+            chunk_bytes += row_bytes
+        if chunk:
+            yield chunk
+
+    def fetch_one(self, query: str, params=(), cache: bool = True):
+        """
+        Fetch the first row of a query, served from the query cache when configured and cache is set
+        """
+        if self.query_cache and cache:
+            return self.query_cache.get_or_load(query, params, lambda: self._fetch_one(query, params), "one")
+        return self._fetch_one(query, params)
+
+    def _fetch_one(self, query: str, params=()):
+        connection, cursor = self.get_connection(read_only=True)
+        try:
+            start = time.perf_counter()
+            result = self._execute(connection, cursor, query, params)
+
+            if self.prepared_statements:
+                # a prepared statement must be read to the end before it can be executed again
+                rows = result.fetchall()
+                data = rows[0] if rows else None
+            else:
+                data = result.fetchone()
+            self.log(connection, query, start, 1 if data else 0)
+        except mysql.connector.Error as e:
+            self._report_read(connection, e)
+            raise
+        finally:
+            self.close_connection(connection, cursor)
+        self._report_read(connection)
         return data
 
 
@@ -135,13 +386,29 @@ class SQLClient:
         connection, cursor = self.get_connection()
 
         cursor.execute("SHOW TABLES")
-        tables = [table['Tables_in_' + os.getenv("REMOTE_MYSQL_DATABASE", "api")] for table in cursor.fetchall()]
+        # the single column is named Tables_in_<database> after the database we are connected to
+        tables = [next(iter(table.values())) for table in cursor.fetchall()]
 
-        tables = [b.decode() for b in tables]
+        tables = [b.decode() if isinstance(b, (bytes, bytearray)) else b for b in tables]
 
         self.close_connection(connection, cursor)
         return tables
 
+    def get_schema(self, refresh: bool = False) -> dict:
+        """
+        Columns, indexes and foreign keys of all tables, loaded in a few information_schema queries
+        and cached until refresh is set, see SchemaIntrospector.get_schema
+        """
+        return self.schema.get_schema(refresh)
+
+    def dump_schema(self, refresh: bool = False, drop: bool = True) -> str:
+        """
+        CREATE TABLE statements, including indexes and foreign keys, of all tables
+        """
+        if refresh:
+            self.schema.refresh()
+        return self.schema.dump(drop)
+
     def get_create_table_sql(self, table_name: str) -> str | None:
         query = f"DESCRIBE {table_name}"
         columns_info = self.fetch_all(query)
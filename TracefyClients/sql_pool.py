@@ -0,0 +1,324 @@
+import re
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING
+
+import mysql.connector
+from mysql.connector.errors import PoolError
+
+from TracefyClients.cache import LRUCache, MISSING
+from TracefyClients.logging import Logging
+
+if TYPE_CHECKING:
+    from TracefyClients.sql_replicas import Replica
+
+logger = Logging("sql_pool").get_logger()
+
+# upper bounds (seconds) of the checkout wait time histogram buckets
+WAIT_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, float("inf"))
+# window (seconds) used to compute the checkouts per second
+RATE_WINDOW = 60
+# %(name)s placeholders, the prepared cursor rewrites them on every execute
+NAMED_PARAM = re.compile(r"%\((.*?)\)s")
+
+
+class PoolTimeoutError(PoolError):
+    def __init__(self, timeout: float):
+        msg = f"no connection available in the pool within {timeout} seconds"
+        return super(PoolTimeoutError, self).__init__(msg)
+
+
+class _Waiter:
+    def __init__(self):
+        self.event = threading.Event()
+        self.connection = None
+
+
+class PooledConnection:
+    """
+    Wraps a MySQL connection checked out from a BlockingConnectionPool,
+    close() gives the connection back to the pool instead of closing it
+    """
+
+    def __init__(self, pool: "BlockingConnectionPool", cnx, wait_time: float = 0.0):
+        self._pool = pool
+        self._cnx = cnx
+        # seconds spent waiting for this connection
+        self.wait_time = wait_time
+        # the replica the connection was checked out from, set by ReplicaSet
+        self.replica: "Replica | None" = None
+
+    def __getattr__(self, attr):
+        return getattr(self._cnx, attr)
+
+    def execute_prepared(self, query: str, params=(), dictionary: bool = True):
+        """
+        Execute query as a server-side prepared statement cached on this connection
+        """
+        return self._pool.execute_prepared(self._cnx, query, params, dictionary)
+
+    def close(self):
+        cnx, self._cnx = self._cnx, None
+        if cnx is not None:
+            self._pool.release(cnx)
+
+
+class BlockingConnectionPool:
+    """
+    MySQL connection pool that blocks until a connection is free instead of raising right away.
+    Waiting threads are served in FIFO order and give up with a PoolTimeoutError once the
+    timeout passes. The pool opens pool_size connections up front and grows on demand up to max_size.
+
+    With statement_cache_size set, every connection keeps an LRU cache of up to that many prepared
+    statements keyed by query text. Resetting the session deallocates prepared statements on the
+    server, so disable reset_session to keep them between checkouts (open transactions are then
+    rolled back on release instead).
+    """
+
+    def __init__(self, db_config: dict, pool_size: int = 5, max_size: int | None = None,
+                 timeout: float = 30.0, reset_session: bool = True, statement_cache_size: int = 0):
+        self.db_config = db_config
+        self.pool_size = pool_size
+        self.max_size = max(max_size or pool_size, pool_size)
+        self.timeout = timeout
+        self.reset_session = reset_session
+        self.statement_cache_size = statement_cache_size
+
+        self._lock = threading.Lock()
+        self._idle: deque = deque()
+        self._waiters: deque[_Waiter] = deque()
+        self._size = 0
+        self._in_use = 0
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_histogram = [0] * len(WAIT_TIME_BUCKETS)
+        self._checkouts_per_second: deque[list] = deque()
+
+        self._statements: dict[int, LRUCache] = {}
+        self._statement_hits = 0
+        self._statement_misses = 0
+        self._statement_evictions = 0
+
+        for _ in range(pool_size):
+            self._idle.append(self._create_connection())
+            self._size += 1
+
+    def _create_connection(self):
+        return mysql.connector.connect(**self.db_config)
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    def get_connection(self, timeout: float | None = None) -> PooledConnection:
+        """
+        Check out a connection, blocking up to timeout seconds (default the pool timeout)
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        cnx, waiter, grow = None, None, False
+
+        with self._lock:
+            if self._idle and not self._waiters:
+                cnx = self._idle.pop()
+            elif self._size < self.max_size:
+                self._size += 1
+                grow = True
+            else:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+
+        if grow:
+            try:
+                cnx = self._create_connection()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                raise
+            logger.info(f"connection pool grown to {self._size} connections")
+
+        if waiter:
+            if not waiter.event.wait(timeout):
+                with self._lock:
+                    if waiter.connection is None:
+                        self._waiters.remove(waiter)
+                        self._timeouts += 1
+                        raise PoolTimeoutError(timeout)
+            cnx = waiter.connection
+
+        try:
+            self._ensure_connected(cnx)
+        except Exception:
+            self._discard(cnx)
+            raise
+
+        wait_time = time.monotonic() - start
+        self._record_checkout(wait_time)
+        return PooledConnection(self, cnx, wait_time)
+
+    def _ensure_connected(self, cnx):
+        if not cnx.is_connected():
+            # prepared statements do not survive a new session
+            self._invalidate_statements(cnx)
+            cnx.reconnect()
+
+    def execute_prepared(self, cnx, query: str, params=(), dictionary: bool = True):
+        statements = self._statements.get(id(cnx))
+        if statements is None:
+            statements = LRUCache(self.statement_cache_size, on_evict=self._close_statement)
+            self._statements[id(cnx)] = statements
+
+        key = (query, dictionary)
+        entry = statements.get(key)
+        if entry is MISSING:
+            with self._lock:
+                self._statement_misses += 1
+            # the cursor only reuses its statement when executed with the very same query object, named
+            # placeholders are turned into positional ones once instead of on every execute
+            names = NAMED_PARAM.findall(query)
+            operation = NAMED_PARAM.sub("%s", query) if names else query
+            entry = (cnx.cursor(prepared=True, dictionary=dictionary), operation, names)
+            statements.set(key, entry)
+        else:
+            with self._lock:
+                self._statement_hits += 1
+
+        cursor, operation, names = entry
+        if isinstance(params, dict):
+            try:
+                params = tuple(params[name] for name in names)
+            except KeyError as e:
+                raise mysql.connector.ProgrammingError(f"parameter {e} of the query is missing") from e
+        cursor.execute(operation, params)
+        return cursor
+
+    def _close_statement(self, key, entry):
+        with self._lock:
+            self._statement_evictions += 1
+        cursor = entry[0]
+        try:
+            cursor.close()
+        except mysql.connector.Error as e:
+            logger.warning(f"could not close prepared statement: {e}")
+
+    def _invalidate_statements(self, cnx):
+        self._statements.pop(id(cnx), None)
+
+    def release(self, cnx):
+        """
+        Give a connection back to the pool, handing it straight to the longest waiting thread
+        """
+        try:
+            if self.reset_session:
+                self._invalidate_statements(cnx)
+                cnx.reset_session()
+            elif cnx.in_transaction:
+                cnx.rollback()
+        except mysql.connector.Error as e:
+            logger.warning(f"discarding broken pool connection: {e}")
+            with self._lock:
+                self._in_use -= 1
+            self._discard(cnx)
+            return
+
+        with self._lock:
+            self._in_use -= 1
+            self._put(cnx)
+
+    def _put(self, cnx):
+        # caller holds the lock
+        if self._waiters:
+            waiter = self._waiters.popleft()
+            waiter.connection = cnx
+            waiter.event.set()
+        else:
+            self._idle.append(cnx)
+
+    def _discard(self, cnx):
+        """
+        Drop a broken connection and open a replacement if threads are waiting for one
+        """
+        self._invalidate_statements(cnx)
+        try:
+            cnx.close()
+        except Exception:
+            pass
+
+        with self._lock:
+            self._size -= 1
+            if not self._waiters:
+                return
+            self._size += 1
+
+        try:
+            replacement = self._create_connection()
+        except Exception as e:
+            logger.warning(f"could not replace pool connection: {e}")
+            with self._lock:
+                self._size -= 1
+            return
+
+        with self._lock:
+            self._put(replacement)
+
+    def _record_checkout(self, wait_time: float):
+        now = int(time.monotonic())
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_time_total += wait_time
+            for i, bound in enumerate(WAIT_TIME_BUCKETS):
+                if wait_time <= bound:
+                    self._wait_time_histogram[i] += 1
+                    break
+
+            if self._checkouts_per_second and self._checkouts_per_second[-1][0] == now:
+                self._checkouts_per_second[-1][1] += 1
+            else:
+                self._checkouts_per_second.append([now, 1])
+            while self._checkouts_per_second[0][0] <= now - RATE_WINDOW:
+                self._checkouts_per_second.popleft()
+
+    def stats(self) -> dict:
+        """
+        Live pool statistics
+        """
+        now = int(time.monotonic())
+        with self._lock:
+            recent = sum(count for second, count in self._checkouts_per_second if second > now - RATE_WINDOW)
+            return {
+                "size": self._size,
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiters": len(self._waiters),
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "checkouts_per_second": recent / RATE_WINDOW,
+                "wait_time_avg": self._wait_time_total / self._checkouts if self._checkouts else 0.0,
+                "wait_time_histogram": {
+                    f"<={bound}": count for bound, count in zip(WAIT_TIME_BUCKETS, self._wait_time_histogram)
+                },
+                "statement_cache": {
+                    "hits": self._statement_hits,
+                    "misses": self._statement_misses,
+                    "evictions": self._statement_evictions,
+                    "size": sum(len(statements) for statements in self._statements.values()),
+                },
+            }
+
+    def close(self):
+        """
+        Close all idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+        for cnx in idle:
+            try:
+                cnx.close()
+            except Exception:
+                pass
@@ -0,0 +1,157 @@
+import logging
+import os
+import random
+import re
+import threading
+
+# upper bounds (milliseconds) of the query latency histogram buckets
+LATENCY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+# queries beyond this many distinct fingerprints are counted together
+OTHER_FINGERPRINT = "<other>"
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"(?<![\w`])-?\d+(?:\.\d+)?(?![\w`])")
+_PARAM = re.compile(r"%\(\w+\)s|%s")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROWS = re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(query: str) -> str:
+    """
+    Normalise a query so queries differing only in literals, parameters or list lengths share a fingerprint
+    """
+    query = _STRING.sub("?", query)
+    query = _NUMBER.sub("?", query)
+    query = _PARAM.sub("?", query)
+    query = _LIST.sub("(?+)", query)
+    query = _ROWS.sub("(?+)", query)
+    return _SPACE.sub(" ", query).strip()
+
+
+class _QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.pool_wait_time = 0.0
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Upper bound (ms) of the histogram bucket holding the given fraction of the queries
+        """
+        threshold = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.histogram):
+            seen += count
+            if seen >= threshold:
+                return bound
+        return LATENCY_BUCKETS[-1]
+
+
+class QueryProfiler:
+    """
+    Query hook aggregating latency histograms, rows and pool wait time per query fingerprint
+    """
+
+    def __init__(self, max_fingerprints: int = 1000):
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._stats: dict[str, _QueryStats] = {}
+        self._fingerprints: dict[str, str] = {}
+
+    def __call__(self, query: str, duration: float, rows: int, pool_wait_time: float):
+        self.record(query, duration, rows, pool_wait_time)
+
+    def record(self, query: str, duration: float, rows: int, pool_wait_time: float = 0.0):
+        """
+        Record one query execution, duration and pool_wait_time in seconds
+        """
+        key = self._fingerprints.get(query)
+        if key is None:
+            key = fingerprint(query)
+            # the same query texts come back over and over, remember their fingerprint
+            if len(self._fingerprints) < self.max_fingerprints * 10:
+                self._fingerprints[query] = key
+
+        duration_ms = duration * 1000
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    key = OTHER_FINGERPRINT
+                stats = self._stats.setdefault(key, _QueryStats())
+
+            stats.count += 1
+            stats.total_time += duration_ms
+            stats.max_time = max(stats.max_time, duration_ms)
+            stats.rows += max(rows, 0)
+            stats.pool_wait_time += pool_wait_time * 1000
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration_ms <= bound:
+                    stats.histogram[i] += 1
+                    break
+
+    def top(self, n: int = 10, by: str = "total_time") -> list[dict]:
+        """
+        The n queries with the highest total_time, count, max_time or avg_time, times in milliseconds
+        """
+        if by not in ("total_time", "count", "max_time", "avg_time"):
+            raise ValueError(f"Unknown sort key: {by}")
+
+        with self._lock:
+            result = [
+                {
+                    "query": key,
+                    "count": stats.count,
+                    "total_time": stats.total_time,
+                    "avg_time": stats.total_time / stats.count,
+                    "max_time": stats.max_time,
+                    "p50_time": stats.percentile(0.5),
+                    "p95_time": stats.percentile(0.95),
+                    "p99_time": stats.percentile(0.99),
+                    "rows": stats.rows,
+                    "avg_pool_wait_time": stats.pool_wait_time / stats.count,
+                    "histogram": {
+                        f"<={bound}": count for bound, count in zip(LATENCY_BUCKETS, stats.histogram)
+                    },
+                }
+                for key, stats in self._stats.items()
+            ]
+        return sorted(result, key=lambda entry: entry[by], reverse=True)[:n]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class QueryInstrumentation:
+    """
+    Passes every query to the registered hooks, the QueryProfiler by default, and logs slow queries
+    (MYSQL_SLOW_QUERY_MS) as warning and a sample (MYSQL_QUERY_LOG_SAMPLE_RATE) of the other queries
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self.slow_query_ms = float(os.getenv("MYSQL_SLOW_QUERY_MS", "1000"))
+        self.sample_rate = float(os.getenv("MYSQL_QUERY_LOG_SAMPLE_RATE", "0"))
+        self.profiler = QueryProfiler()
+        self.hooks = [self.profiler]
+
+    def add_hook(self, hook):
+        """
+        Register hook(query, duration, rows, pool_wait_time), times in seconds
+        """
+        self.hooks.append(hook)
+
+    def record(self, query: str, duration: float, rows: int, pool_wait_time: float = 0.0):
+        for hook in self.hooks:
+            hook(query, duration, rows, pool_wait_time)
+
+        duration_ms = duration * 1000
+        if duration_ms >= self.slow_query_ms:
+            self.logger.warning("Slow query ({:.1f} ms, {} rows): {}".format(duration_ms, rows, query))
+        elif self.sample_rate and random.random() < self.sample_rate:
+            self.logger.info("Query ({:.1f} ms, {} rows): {}".format(duration_ms, rows, query))
@@ -0,0 +1,144 @@
+import itertools
+import threading
+
+import mysql.connector
+
+from TracefyClients.logging import Logging
+from TracefyClients.sql_pool import BlockingConnectionPool, PooledConnection, PoolTimeoutError
+
+logger = Logging("sql_replicas").get_logger()
+
+SELECTION_STRATEGIES = ("round_robin", "least_outstanding")
+# errors of a query that tell the replica is unreachable or failing, not that the query is wrong
+CONNECTION_ERRORS = (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)
+
+
+class Replica:
+    def __init__(self, name: str, pool: BlockingConnectionPool):
+        self.name = name
+        self.pool = pool
+        self.healthy = True
+        self.failures = 0
+
+
+class ReplicaSet:
+    """
+    Connection pools of the read replicas. A replica is ejected after max_failures failed checkouts,
+    queries (connection errors only, see report) or health checks in a row and comes back once a
+    health check passes again. A checkout waits at most checkout_timeout seconds for a busy replica,
+    so the read can fall back to the primary instead of waiting for the full pool timeout.
+    """
+
+    def __init__(self, replicas: list[Replica], selection: str = "round_robin", max_failures: int = 3,
+                 health_check_interval: float = 10, checkout_timeout: float = 0.05):
+        if selection not in SELECTION_STRATEGIES:
+            raise ValueError(f"Unknown replica selection: {selection}")
+
+        self.replicas = replicas
+        self.selection = selection
+        self.max_failures = max_failures
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+
+        self._lock = threading.Lock()
+        self._round_robin = itertools.count()
+        self._stopped = threading.Event()
+        self._health_checker = None
+
+    def choose(self) -> Replica | None:
+        """
+        Pick a healthy replica, None when all replicas are ejected
+        """
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.selection == "least_outstanding":
+            return min(healthy, key=lambda replica: replica.pool.in_use)
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    def get_connection(self) -> PooledConnection | None:
+        """
+        Check out a connection from a healthy replica, None when no replica could serve one.
+        Pass the outcome of the query to report, the connection's replica attribute names the replica
+        """
+        replica = self.choose()
+        if replica is None:
+            return None
+        try:
+            connection = replica.pool.get_connection(timeout=self.checkout_timeout)
+        except PoolTimeoutError:
+            # a busy replica is not an unhealthy one
+            return None
+        except mysql.connector.Error as e:
+            self.mark_failure(replica, e)
+            return None
+        connection.replica = replica
+        return connection
+
+    def report(self, replica: Replica, error: Exception | None = None):
+        """
+        Record the outcome of a query on the replica, a success or a connection error
+        (see CONNECTION_ERRORS) counts toward its health, other errors are ignored
+        """
+        if error is None:
+            self.mark_success(replica)
+        elif isinstance(error, CONNECTION_ERRORS):
+            self.mark_failure(replica, error)
+
+    def mark_failure(self, replica: Replica, error: Exception):
+        with self._lock:
+            replica.failures += 1
+            if replica.healthy and replica.failures >= self.max_failures:
+                replica.healthy = False
+                logger.error(f"replica {replica.name} ejected after {replica.failures} failures: {error}")
+
+    def mark_success(self, replica: Replica):
+        if replica.failures == 0 and replica.healthy:
+            return
+        with self._lock:
+            replica.failures = 0
+            if not replica.healthy:
+                replica.healthy = True
+                logger.info(f"replica {replica.name} is healthy again")
+
+    def check_health(self):
+        """
+        Ping every replica, ejecting the failing ones and restoring the recovered ones
+        """
+        for replica in self.replicas:
+            try:
+                connection = replica.pool.get_connection()
+                try:
+                    connection.ping()
+                finally:
+                    connection.close()
+            except PoolTimeoutError:
+                continue
+            except mysql.connector.Error as e:
+                self.mark_failure(replica, e)
+            else:
+                self.mark_success(replica)
+
+    def start(self):
+        """
+        Run the health checks every health_check_interval seconds in a background thread
+        """
+        if self._health_checker is None:
+            self._health_checker = threading.Thread(target=self._run_health_checks, daemon=True)
+            self._health_checker.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run_health_checks(self):
+        while not self._stopped.wait(self.health_check_interval):
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"replica health check failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            replica.name: {"healthy": replica.healthy, "failures": replica.failures, **replica.pool.stats()}
+            for replica in self.replicas
+        }
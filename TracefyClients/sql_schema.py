@@ -0,0 +1,227 @@
+import threading
+
+TABLES_QUERY = """
+SELECT TABLE_NAME, ENGINE, TABLE_COLLATION, TABLE_COMMENT
+FROM information_schema.TABLES
+WHERE TABLE_SCHEMA = COALESCE(%s, DATABASE()) AND TABLE_TYPE = 'BASE TABLE'
+ORDER BY TABLE_NAME
+"""
+
+COLUMNS_QUERY = """
+SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_DEFAULT, EXTRA,
+       GENERATION_EXPRESSION, CHARACTER_SET_NAME, COLLATION_NAME, COLUMN_COMMENT
+FROM information_schema.COLUMNS
+WHERE TABLE_SCHEMA = COALESCE(%s, DATABASE())
+ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+
+INDEXES_QUERY = """
+SELECT TABLE_NAME, INDEX_NAME, NON_UNIQUE, COLUMN_NAME, SUB_PART, INDEX_TYPE, EXPRESSION
+FROM information_schema.STATISTICS
+WHERE TABLE_SCHEMA = COALESCE(%s, DATABASE())
+ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+"""
+
+FOREIGN_KEYS_QUERY = """
+SELECT k.TABLE_NAME, k.CONSTRAINT_NAME, k.COLUMN_NAME, k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME,
+       r.UPDATE_RULE, r.DELETE_RULE
+FROM information_schema.KEY_COLUMN_USAGE k
+JOIN information_schema.REFERENTIAL_CONSTRAINTS r
+  ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+ AND r.TABLE_NAME = k.TABLE_NAME
+WHERE k.TABLE_SCHEMA = COALESCE(%s, DATABASE())
+ORDER BY k.TABLE_NAME, k.CONSTRAINT_NAME, k.ORDINAL_POSITION
+"""
+
+# EXTRA values that are rendered by other parts of the column definition
+_GENERATED_EXTRA = ("VIRTUAL GENERATED", "STORED GENERATED")
+
+
+def _text(value):
+    """
+    information_schema values come back as bytes on some server versions
+    """
+    return value.decode() if isinstance(value, (bytes, bytearray)) else value
+
+
+def _row(row: dict) -> dict:
+    return {key.upper(): _text(value) for key, value in row.items()}
+
+
+def _quote(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+class SchemaIntrospector:
+    """
+    Reads the columns, indexes and foreign keys of every table of a database in four information_schema
+    queries and keeps the result until refresh() is called. Without a database name the database
+    the connections are using is read. Needs MySQL 8.0.13 or later for the functional key parts of indexes
+    """
+
+    def __init__(self, sql_client, database: str | None):
+        self.sql_client = sql_client
+        self.database = database
+        self._lock = threading.Lock()
+        self._schema: dict | None = None
+
+    def get_schema(self, refresh: bool = False) -> dict:
+        """
+        {table: {"engine", "collation", "comment", "columns": [...], "indexes": {...}, "foreign_keys": {...}}}
+        """
+        with self._lock:
+            if self._schema is None or refresh:
+                self._schema = self._load()
+            return self._schema
+
+    def refresh(self) -> dict:
+        return self.get_schema(refresh=True)
+
+    def _fetch(self, query: str) -> list[dict]:
+        return [_row(row) for row in self.sql_client.fetch_all(query, (self.database,), cache=False)]
+
+    def _load(self) -> dict:
+        schema = {}
+        for row in self._fetch(TABLES_QUERY):
+            schema[row["TABLE_NAME"]] = {
+                "engine": row["ENGINE"],
+                "collation": row["TABLE_COLLATION"],
+                "comment": row["TABLE_COMMENT"],
+                "columns": [],
+                "indexes": {},
+                "foreign_keys": {},
+            }
+
+        for row in self._fetch(COLUMNS_QUERY):
+            table = schema.get(row["TABLE_NAME"])
+            if table is None:
+                # views have columns too
+                continue
+            table["columns"].append({
+                "name": row["COLUMN_NAME"],
+                "type": row["COLUMN_TYPE"],
+                "nullable": row["IS_NULLABLE"] == "YES",
+                "default": row["COLUMN_DEFAULT"],
+                "extra": row["EXTRA"] or "",
+                "generation_expression": row["GENERATION_EXPRESSION"] or "",
+                "charset": row["CHARACTER_SET_NAME"],
+                "collation": row["COLLATION_NAME"],
+                "comment": row["COLUMN_COMMENT"] or "",
+            })
+
+        for row in self._fetch(INDEXES_QUERY):
+            table = schema.get(row["TABLE_NAME"])
+            if table is None:
+                continue
+            index = table["indexes"].setdefault(row["INDEX_NAME"], {
+                "unique": not int(row["NON_UNIQUE"]),
+                "type": row["INDEX_TYPE"],
+                "columns": [],
+            })
+            # functional key parts have an expression instead of a column
+            index["columns"].append({
+                "name": row["COLUMN_NAME"], "sub_part": row["SUB_PART"], "expression": row["EXPRESSION"]
+            })
+
+        for row in self._fetch(FOREIGN_KEYS_QUERY):
+            table = schema.get(row["TABLE_NAME"])
+            if table is None:
+                continue
+            foreign_key = table["foreign_keys"].setdefault(row["CONSTRAINT_NAME"], {
+                "columns": [],
+                "referenced_table": row["REFERENCED_TABLE_NAME"],
+                "referenced_columns": [],
+                "on_update": row["UPDATE_RULE"],
+                "on_delete": row["DELETE_RULE"],
+            })
+            foreign_key["columns"].append(row["COLUMN_NAME"])
+            foreign_key["referenced_columns"].append(row["REFERENCED_COLUMN_NAME"])
+
+        return schema
+
+    def get_create_table_sql(self, table_name: str, drop: bool = True) -> str | None:
+        """
+        Full CREATE TABLE statement of a table including its indexes and foreign keys
+        """
+        table = self.get_schema().get(table_name)
+        if table is None:
+            return None
+        return self._create_table_sql(table_name, table, drop)
+
+    def _create_table_sql(self, table_name: str, table: dict, drop: bool) -> str:
+        definitions = [self._column_sql(column, table["collation"]) for column in table["columns"]]
+        definitions += [self._index_sql(name, index) for name, index in table["indexes"].items()]
+        definitions += [self._foreign_key_sql(name, fk) for name, fk in table["foreign_keys"].items()]
+
+        sql = f"DROP TABLE IF EXISTS {_quote(table_name)};\n" if drop else ""
+        sql += f"CREATE TABLE {_quote(table_name)} (\n  " + ",\n  ".join(definitions) + "\n)"
+        if table["engine"]:
+            sql += f" ENGINE={table['engine']}"
+        if table["collation"]:
+            sql += f" DEFAULT COLLATE={table['collation']}"
+        if table["comment"]:
+            sql += " COMMENT='{}'".format(table["comment"].replace("'", "''"))
+        return sql + ";"
+
+    def dump(self, drop: bool = True) -> str:
+        """
+        CREATE TABLE statements of all tables, in one string
+        """
+        return "\n\n".join(
+            self._create_table_sql(table_name, table, drop) for table_name, table in self.get_schema().items()
+        )
+
+    def _column_sql(self, column: dict, table_collation: str | None) -> str:
+        sql = f"{_quote(column['name'])} {column['type']}"
+        extra = column["extra"]
+        if column["collation"] and column["collation"] != table_collation:
+            sql += f" COLLATE {column['collation']}"
+
+        if extra.upper() in _GENERATED_EXTRA:
+            kind = extra.split()[0].upper()
+            sql += f" GENERATED ALWAYS AS ({column['generation_expression']}) {kind}"
+            if not column["nullable"]:
+                sql += " NOT NULL"
+        else:
+            sql += "" if column["nullable"] else " NOT NULL"
+            default = column["default"]
+            if default is not None:
+                if "DEFAULT_GENERATED" in extra.upper():
+                    # expression default such as CURRENT_TIMESTAMP
+                    sql += f" DEFAULT {default}" if default.upper().startswith("CURRENT_TIMESTAMP") else f" DEFAULT ({default})"
+                else:
+                    sql += " DEFAULT '{}'".format(str(default).replace("'", "''"))
+            elif column["nullable"] and "auto_increment" not in extra.lower():
+                sql += " DEFAULT NULL"
+            remaining = extra.replace("DEFAULT_GENERATED", "").strip()
+            if remaining:
+                sql += f" {remaining.upper()}"
+
+        if column["comment"]:
+            sql += " COMMENT '{}'".format(column["comment"].replace("'", "''"))
+        return sql
+
+    def _index_sql(self, name: str, index: dict) -> str:
+        columns = ",".join(self._key_part_sql(column) for column in index["columns"])
+        if name == "PRIMARY":
+            return f"PRIMARY KEY ({columns})"
+        if index["type"] in ("FULLTEXT", "SPATIAL"):
+            return f"{index['type']} KEY {_quote(name)} ({columns})"
+        kind = "UNIQUE KEY" if index["unique"] else "KEY"
+        return f"{kind} {_quote(name)} ({columns})"
+
+    def _key_part_sql(self, column: dict) -> str:
+        if column["name"] is None:
+            return f"({column['expression']})"
+        return _quote(column["name"]) + (f"({column['sub_part']})" if column["sub_part"] else "")
+
+    def _foreign_key_sql(self, name: str, foreign_key: dict) -> str:
+        columns = ",".join(_quote(column) for column in foreign_key["columns"])
+        referenced = ",".join(_quote(column) for column in foreign_key["referenced_columns"])
+        sql = (f"CONSTRAINT {_quote(name)} FOREIGN KEY ({columns}) "
+               f"REFERENCES {_quote(foreign_key['referenced_table'])} ({referenced})")
+        if foreign_key["on_delete"] and foreign_key["on_delete"] != "NO ACTION":
+            sql += f" ON DELETE {foreign_key['on_delete']}"
+        if foreign_key["on_update"] and foreign_key["on_update"] != "NO ACTION":
+            sql += f" ON UPDATE {foreign_key['on_update']}"
+        return sql
@@ -1,32 +1,114 @@
 import os
-import brotli
-import base64
-import boto3
+import uuid
 import time
-from mypy_boto3_sqs.service_resource import Message, Queue
-from botocore.exceptions import ConnectionClosedError
+from mypy_boto3_sqs.service_resource import Message, Queue, SQSServiceResource
+from mypy_boto3_sqs.type_defs import SendMessageBatchRequestEntryTypeDef
+from botocore.exceptions import BotoCoreError, ClientError, ConnectionClosedError
 from boto3.resources.base import ServiceResource
 import json
 
 from dotenv import load_dotenv
 
+from TracefyClients import aws
+from TracefyClients.logging import Logging
+from TracefyClients.s3_client import S3Client
+from TracefyClients.sqs_codecs import CODEC_ATTRIBUTE, Codec, codec_from_env, decode_body, register_codec
+
 load_dotenv()
 
+# SQS limits for a single message and for all messages of one send_message_batch call together
+MAX_MESSAGE_SIZE = 262144
+MAX_BATCH_ENTRIES = 10
+# message attribute marking a message whose body is a pointer to the payload in S3, its value is the payload size
+S3_PAYLOAD_ATTRIBUTE = "TracefyS3Payload"
+
+logger = Logging("sqs_client").get_logger()
+
 
 class SQSClient:
-    def __init__(self, queue_name: str):
-        self.sqs = boto3.resource(
-            'sqs',
-            endpoint_url=os.getenv("AWS_SQS_ENDPOINT_URL", "https://sqs.eu-central-1.amazonaws.com"),
-            region_name=os.getenv("AWS_REGION", "eu-central-1"),
-            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
+    def __init__(self, queue_name: str, codec: Codec | None = None, s3_client: S3Client | None = None,
+                 offload_threshold: int | None = None, delete_offloaded: bool | None = None,
+                 create_queue: bool = False):
+        self.queue_name = queue_name
+        self.region_name = os.getenv("AWS_REGION", "eu-central-1")
+        self.endpoint_url = os.getenv("AWS_SQS_ENDPOINT_URL", "https://sqs.eu-central-1.amazonaws.com")
+        self.create_queue = create_queue
+        self.sqs: SQSServiceResource = aws.get_resource('sqs', self.region_name, self.endpoint_url)
+        # the queue URL is resolved on first use
+        self._queue: Queue | None = None
+
+        # codec of the compressed messages this client sends, received messages name their own codec
+        self.codec = codec or codec_from_env(
+            os.getenv("SQS_CODEC", "br"),
+            brotli_quality=int(os.getenv("SQS_BROTLI_QUALITY", "5")),
+            level=int(os.getenv("SQS_COMPRESSION_LEVEL", "0")) or None
         )
-        self.queue: Queue = self.sqs.create_queue(QueueName=queue_name, Attributes={"DelaySeconds": "5"})
+        register_codec(self.codec)
+
+        # claim-check: with an s3_client, messages larger than offload_threshold are stored in S3
+        # and a pointer to them is sent instead
+        self.s3_client = s3_client
+        self.offload_threshold = offload_threshold or int(os.getenv("SQS_S3_OFFLOAD_THRESHOLD", str(MAX_MESSAGE_SIZE)))
+        self.offload_prefix = os.getenv("SQS_S3_PREFIX", f"sqs-payloads/{queue_name}/")
+        if delete_offloaded is None:
+            delete_offloaded = os.getenv("SQS_S3_DELETE_PAYLOADS", "false").lower() == "true"
+        self.delete_offloaded = delete_offloaded
+
+    @property
+    def queue(self) -> Queue:
+        if self._queue is None:
+            url = aws.get_queue_url(
+                self.queue_name, self.region_name, self.endpoint_url,
+                create=self.create_queue, attributes={"DelaySeconds": "5"}
+            )
+            self._queue = self.sqs.Queue(url)
+        return self._queue
+
+    @queue.setter
+    def queue(self, queue: Queue):
+        self._queue = queue
 
     def decompress_message(self, message: Message) -> dict:
-        decoded_data = base64.b64decode(message.body)
-        return json.loads(brotli.decompress(decoded_data).decode("utf-8"))
+        """
+        Decode a message body with the codec named in its attributes,
+        messages without one are plain JSON or brotli compressed.
+        Payloads offloaded to S3 are downloaded first
+        """
+        attributes: dict = message.message_attributes or {}
+        codec_name = attributes.get(CODEC_ATTRIBUTE, {}).get("StringValue")
+        body = message.body
+        if S3_PAYLOAD_ATTRIBUTE in attributes:
+            pointer = json.loads(body)
+            body = self._payload_store().get_object(pointer["s3_key"], pointer["s3_bucket"]).decode("utf-8")
+        return decode_body(body, codec_name)
+
+    def delete_message(self, message: Message):
+        """
+        Delete a handled message, and its payload in S3 when delete_offloaded is set
+        """
+        message.delete()
+        self.delete_payloads([message])
+
+    def delete_payloads(self, messages: list[Message]):
+        """
+        Delete the S3 payloads of deleted messages when delete_offloaded is set
+        """
+        if not self.delete_offloaded:
+            return
+        for message in messages:
+            if S3_PAYLOAD_ATTRIBUTE not in (message.message_attributes or {}):
+                continue
+            pointer = json.loads(message.body)
+            try:
+                self._payload_store().delete_object(pointer["s3_key"], pointer["s3_bucket"])
+            except (BotoCoreError, ClientError) as e:
+                logger.error(f"deleting payload {pointer['s3_key']} failed: {e}")
+
+    def _payload_store(self) -> S3Client:
+        # consumers only need an S3Client once they receive an offloaded message
+        if self.s3_client is None:
+            self.s3_client = S3Client()
+        return self.s3_client
 
     def messages_in_queue(self) -> int:
         """
@@ -51,11 +133,13 @@ class SQSClient:
                     raise
 
     def add_to_queue(self, data: dict|list, retries=10):
-        if len(data) > 262144:
-            raise ValueError(f"Message size: {len(data)} exceeds SQS limit even after compression. Consider further data reduction or splitting.")
+        base_data, attributes = self.encode_message(data)
+        size = self.message_size(base_data, attributes)
+        if size > MAX_MESSAGE_SIZE:
+            raise ValueError(f"Message size: {size} exceeds SQS limit. Consider compression, an s3_client to offload large messages or splitting.")
         for attempt in range(retries):
             try:
-                return self.queue.send_message(MessageBody=json.dumps(data))
+                return self.queue.send_message(MessageBody=base_data, MessageAttributes=attributes)
             except ConnectionClosedError:
                 if attempt < retries - 1:
                     time.sleep(0.01 ** attempt) # exponenial bakcoff
@@ -63,16 +147,127 @@ class SQSClient:
                     raise
 
     def add_compressed_to_queue(self, data: dict|list, retries=10):
-        compressed = brotli.compress(json.dumps(data).encode('utf-8'))
-        base_data = base64.b64encode(compressed).decode()
-        if len(base_data) > 262144:
-            raise ValueError(f"Message size: {len(base_data)} exceeds SQS limit even after compression. Consider further data reduction or splitting.")
+        base_data, attributes = self.encode_message(data, compressed=True)
+        size = self.message_size(base_data, attributes)
+        if size > MAX_MESSAGE_SIZE:
+            raise ValueError(f"Message size: {size} exceeds SQS limit even after compression. Consider further data reduction or splitting.")
 
         for attempt in range(retries):
             try:
-                return self.queue.send_message(MessageBody=base_data)
+                return self.queue.send_message(MessageBody=base_data, MessageAttributes=attributes)
             except ConnectionClosedError:
                 if attempt < retries - 1:
                     time.sleep(0.01 ** attempt) # exponenial bakcoff
                 else:
                     raise
+
+    def encode_message(self, data: dict|list, compressed: bool = False) -> tuple[str, dict]:
+        """
+        Message body and attributes for data, encoded with the codec of the client when compressed is set.
+        Bodies over the offload threshold are stored in S3 when the client has an s3_client
+        """
+        if not compressed:
+            body, attributes = json.dumps(data), {}
+        else:
+            attributes = {CODEC_ATTRIBUTE: {"DataType": "String", "StringValue": self.codec.name}}
+            body = self.codec.encode(data)
+
+        if self.s3_client is not None and self.message_size(body, attributes) > self.offload_threshold:
+            return self._offload(body, attributes)
+        return body, attributes
+
+    def _offload(self, body: str, attributes: dict) -> tuple[str, dict]:
+        """
+        Store a message body in S3, returning the pointer message that replaces it
+        """
+        key = f"{self.offload_prefix}{uuid.uuid4()}"
+        payload = body.encode("utf-8")
+        s3_client = self._payload_store()
+        s3_client.put_object(key, payload)
+        pointer = json.dumps({"s3_bucket": s3_client.s3_bucket, "s3_key": key})
+        return pointer, {
+            **attributes,
+            S3_PAYLOAD_ATTRIBUTE: {"DataType": "Number", "StringValue": str(len(payload))}
+        }
+
+    @staticmethod
+    def message_size(body: str, attributes: dict) -> int:
+        """
+        Size of a message as SQS counts it against its limits, attributes included
+        """
+        size = len(body.encode('utf-8'))
+        for name, attribute in attributes.items():
+            size += len(name) + len(attribute["DataType"]) + len(attribute.get("StringValue", "").encode('utf-8'))
+        return size
+
+    def add_many_to_queue(self, items: list, compressed: bool = False, retries=10) -> list[dict]:
+        """
+        Send many messages with send_message_batch, packing up to 10 messages and 256 KB per call.
+        Entries that fail because of SQS are retried, entries rejected because of their content are not.
+        Returns a result per item in the same order: {"success": True, "message_id": ...}
+        or {"success": False, "error": ...}
+        """
+        results: list[dict] = [{} for _ in items]
+        batches = self._pack_batches(
+            [(str(i), *self.encode_message(item, compressed)) for i, item in enumerate(items)],
+            results
+        )
+
+        for batch in batches:
+            self._send_batch(batch, results, retries)
+        return results
+
+    def _pack_batches(self, entries: list[tuple[str, str, dict]],
+                      results: list[dict]) -> list[list[SendMessageBatchRequestEntryTypeDef]]:
+        """
+        Group (id, body, attributes) entries into batches within the SQS entry and size limits,
+        entries that are too large on their own are marked as failed in results
+        """
+        batches: list[list[SendMessageBatchRequestEntryTypeDef]] = []
+        batch: list[SendMessageBatchRequestEntryTypeDef] = []
+        batch_size = 0
+        for entry_id, body, attributes in entries:
+            size = self.message_size(body, attributes)
+            if size > MAX_MESSAGE_SIZE:
+                results[int(entry_id)] = {
+                    "success": False,
+                    "error": f"Message size: {size} exceeds SQS limit even after compression. Consider further data reduction or splitting."
+                }
+                continue
+            if batch and (len(batch) >= MAX_BATCH_ENTRIES or batch_size + size > MAX_MESSAGE_SIZE):
+                batches.append(batch)
+                batch, batch_size = [], 0
+            entry: SendMessageBatchRequestEntryTypeDef = {"Id": entry_id, "MessageBody": body}
+            if attributes:
+                entry["MessageAttributes"] = attributes
+            batch.append(entry)
+            batch_size += size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _send_batch(self, batch: list[SendMessageBatchRequestEntryTypeDef], results: list[dict], retries: int):
+        for attempt in range(retries):
+            try:
+                response = self.queue.send_messages(Entries=batch)
+            except ConnectionClosedError:
+                if attempt < retries - 1:
+                    time.sleep(min(0.01 * 2 ** attempt, 1)) # exponential backoff
+                    continue
+                raise
+
+            for success in response.get("Successful", []):
+                results[int(success["Id"])] = {"success": True, "message_id": success["MessageId"]}
+
+            retry = []
+            for failure in response.get("Failed", []):
+                error = f"{failure['Code']}: {failure.get('Message', '')}"
+                results[int(failure["Id"])] = {"success": False, "error": error}
+                if not failure["SenderFault"]:
+                    retry.append(failure["Id"])
+
+            if not retry:
+                return
+            batch = [entry for entry in batch if entry["Id"] in retry]
+            if attempt < retries - 1:
+                time.sleep(min(0.01 * 2 ** attempt, 1)) # exponential backoff
@@ -0,0 +1,226 @@
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from botocore.exceptions import BotoCoreError, ClientError
+from mypy_boto3_sqs.service_resource import Message
+from mypy_boto3_sqs.type_defs import DeleteMessageBatchRequestEntryTypeDef
+
+from TracefyClients.logging import Logging
+from TracefyClients.sqs_client import MAX_BATCH_ENTRIES, SQSClient
+
+logger = Logging("sqs_consumer").get_logger()
+
+
+class _InFlight:
+    def __init__(self, message: Message, visible_until: float):
+        self.message = message
+        self.visible_until = visible_until
+
+
+class SQSConsumer:
+    """
+    Long-polls a queue for up to 10 messages per call and runs handler(data) for every message on a
+    thread pool, or a process pool with use_processes (the handler must then be picklable).
+    Messages are decoded with SQSClient.decompress_message unless decompress is False, then the handler
+    gets the raw body. Handled messages are deleted in batches, failed messages are left on the queue
+    to be received again, the S3 payloads of deleted messages are removed when the client has delete_offloaded set.
+    Messages still being handled get their visibility timeout extended.
+    At most max_in_flight messages are received and not yet handled at any time.
+    """
+
+    def __init__(self, sqs_client: SQSClient, handler, max_workers: int = 10, use_processes: bool = False,
+                 decompress: bool = True, max_in_flight: int | None = None, wait_time_seconds: int = 20,
+                 visibility_timeout: int = 30, delete_interval: float = 1.0):
+        self.sqs_client = sqs_client
+        self.handler = handler
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.decompress = decompress
+        self.max_in_flight = max_in_flight or max_workers * 2
+        self.wait_time_seconds = wait_time_seconds
+        self.visibility_timeout = visibility_timeout
+        self.delete_interval = delete_interval
+
+        self._executor: Executor | None = None
+        self._stopping = threading.Event()
+        self._lock = threading.Condition()
+        self._in_flight: dict[str, _InFlight] = {}
+        self._done: queue.Queue = queue.Queue()
+        self._poller: threading.Thread | None = None
+        self._acker: threading.Thread | None = None
+
+        self.handled = 0
+        self.failed = 0
+
+    def start(self):
+        """
+        Start polling in background threads
+        """
+        self._stopping.clear()
+        self._executor = ProcessPoolExecutor(self.max_workers) if self.use_processes else ThreadPoolExecutor(self.max_workers)
+        self._poller = threading.Thread(target=self._poll, daemon=True)
+        self._acker = threading.Thread(target=self._ack, daemon=True)
+        self._poller.start()
+        self._acker.start()
+
+    def run(self):
+        """
+        Start polling and block until stop() is called or SIGINT/SIGTERM is received
+        """
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(sig, lambda signum, frame: self._stopping.set())
+
+        self.start()
+        try:
+            while not self._stopping.wait(1):
+                pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        """
+        Stop receiving messages, wait for the running handlers and delete the handled messages.
+        Waits for the current long poll to return first, at most wait_time_seconds
+        """
+        self._stopping.set()
+        with self._lock:
+            self._lock.notify_all()
+        if self._poller:
+            self._poller.join()
+        with self._lock:
+            self._lock.wait_for(lambda: not self._in_flight)
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        if self._acker:
+            self._acker.join()
+        self._poller = self._acker = self._executor = None
+
+    def _poll(self):
+        while not self._stopping.is_set():
+            with self._lock:
+                self._lock.wait_for(lambda: len(self._in_flight) < self.max_in_flight or self._stopping.is_set())
+                free = self.max_in_flight - len(self._in_flight)
+            if self._stopping.is_set():
+                break
+
+            try:
+                messages = self.sqs_client.queue.receive_messages(
+                    MessageAttributeNames=['All'],
+                    MaxNumberOfMessages=min(MAX_BATCH_ENTRIES, free),
+                    WaitTimeSeconds=self.wait_time_seconds,
+                    VisibilityTimeout=self.visibility_timeout,
+                )
+            except (BotoCoreError, ClientError) as e:
+                logger.error(f"receiving messages failed: {e}")
+                time.sleep(1)
+                continue
+
+            for message in messages:
+                self._dispatch(message)
+
+    def _dispatch(self, message: Message):
+        with self._lock:
+            self._in_flight[message.message_id] = _InFlight(message, time.monotonic() + self.visibility_timeout)
+
+        try:
+            if self._executor is None:
+                raise RuntimeError("the consumer is not running")
+            if self.use_processes:
+                # only the decoded data is sent to the worker process
+                future = self._executor.submit(self.handler, self._decode(message))
+            else:
+                future = self._executor.submit(self._handle, message)
+        except Exception as e:
+            logger.exception(f"could not dispatch message {message.message_id}: {e}")
+            self._finish(message)
+            return
+        future.add_done_callback(lambda f: self._done.put((message, f)))
+
+    def _decode(self, message: Message):
+        return self.sqs_client.decompress_message(message) if self.decompress else message.body
+
+    def _handle(self, message: Message):
+        return self.handler(self._decode(message))
+
+    def _finish(self, message: Message):
+        with self._lock:
+            self._in_flight.pop(message.message_id, None)
+            self._lock.notify_all()
+
+    def _ack(self):
+        deletes: list[Message] = []
+        last_delete = time.monotonic()
+        while True:
+            stopped = self._stopping.is_set() and self._poller is not None and not self._poller.is_alive()
+            try:
+                message, future = self._done.get(timeout=0.1)
+                self._completed(message, future, deletes)
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if len(deletes) >= MAX_BATCH_ENTRIES or (deletes and now - last_delete >= self.delete_interval):
+                self._delete(deletes[:MAX_BATCH_ENTRIES])
+                deletes = deletes[MAX_BATCH_ENTRIES:]
+                last_delete = now
+            self._extend_visibility()
+
+            with self._lock:
+                idle = not self._in_flight
+            if stopped and idle and self._done.empty():
+                while deletes:
+                    self._delete(deletes[:MAX_BATCH_ENTRIES])
+                    deletes = deletes[MAX_BATCH_ENTRIES:]
+                return
+
+    def _completed(self, message: Message, future: Future, deletes: list[Message]):
+        error = future.exception()
+        if error is None:
+            self.handled += 1
+            deletes.append(message)
+        else:
+            self.failed += 1
+            logger.error(f"handling message {message.message_id} failed: {error!r}")
+        self._finish(message)
+
+    def _delete(self, messages: list[Message]):
+        entries: list[DeleteMessageBatchRequestEntryTypeDef] = [
+            {"Id": str(i), "ReceiptHandle": message.receipt_handle} for i, message in enumerate(messages)
+        ]
+        try:
+            response = self.sqs_client.queue.delete_messages(Entries=entries)
+        except (BotoCoreError, ClientError) as e:
+            logger.error(f"deleting {len(entries)} messages failed: {e}")
+            return
+        failed = set()
+        for failure in response.get("Failed", []):
+            failed.add(failure["Id"])
+            logger.error(f"deleting message failed: {failure['Code']} {failure.get('Message', '')}")
+        self.sqs_client.delete_payloads([message for i, message in enumerate(messages) if str(i) not in failed])
+
+    def _extend_visibility(self):
+        """
+        Extend the visibility timeout of messages that are still being handled and about to become visible again
+        """
+        now = time.monotonic()
+        with self._lock:
+            expiring = [
+                in_flight for in_flight in self._in_flight.values()
+                if in_flight.visible_until - now < self.visibility_timeout / 3
+            ]
+            for in_flight in expiring:
+                in_flight.visible_until = now + self.visibility_timeout
+
+        for start in range(0, len(expiring), MAX_BATCH_ENTRIES):
+            entries = [
+                {"Id": str(i), "ReceiptHandle": in_flight.message.receipt_handle, "VisibilityTimeout": self.visibility_timeout}
+                for i, in_flight in enumerate(expiring[start:start + MAX_BATCH_ENTRIES])
+            ]
+            try:
+                self.sqs_client.queue.change_message_visibility_batch(Entries=entries)
+            except (BotoCoreError, ClientError) as e:
+                logger.error(f"extending visibility of {len(entries)} messages failed: {e}")
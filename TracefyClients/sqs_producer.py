@@ -0,0 +1,155 @@
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+from TracefyClients.logging import Logging
+from TracefyClients.sqs_client import MAX_BATCH_ENTRIES, MAX_MESSAGE_SIZE, SQSClient
+
+logger = Logging("sqs_producer").get_logger()
+
+
+class BufferFullError(queue.Full):
+    def __init__(self, size: int):
+        msg = f"SQS producer buffer is full ({size} messages)"
+        return super(BufferFullError, self).__init__(msg)
+
+
+class MessageSendError(RuntimeError):
+    pass
+
+
+class SQSProducer:
+    """
+    Sends messages in the background. send() puts a message in a bounded buffer and returns a future of its
+    message id, worker threads encode the messages and send them in batches of up to 10 messages / 256 KB
+    once a batch is full or the oldest message waited linger seconds.
+    When the buffer is full send() blocks for up to put_timeout seconds (forever with None) and then
+    raises BufferFullError. Buffered messages are sent on close(), which also runs at exit.
+    Messages whose future is cancelled before a worker takes them are not sent.
+    """
+
+    def __init__(self, sqs_client: SQSClient, compressed: bool = True, max_buffer: int = 10000,
+                 linger: float = 0.05, workers: int = 2, put_timeout: float | None = None, retries: int = 10):
+        self.sqs_client = sqs_client
+        self.compressed = compressed
+        self.max_buffer = max_buffer
+        self.linger = linger
+        self.put_timeout = put_timeout
+        self.retries = retries
+
+        self._buffer: queue.Queue = queue.Queue(maxsize=max_buffer)
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._workers = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+        atexit.register(self.close)
+
+        self.sent = 0
+        self.failed = 0
+
+    def send(self, data: dict | list) -> Future:
+        """
+        Buffer a message, the future resolves to its message id or raises MessageSendError
+        """
+        if self._stopping.is_set():
+            raise RuntimeError("SQS producer is closed")
+        future: Future = Future()
+        try:
+            self._buffer.put((data, future), timeout=self.put_timeout)
+        except queue.Full:
+            raise BufferFullError(self.max_buffer)
+        return future
+
+    def flush(self):
+        """
+        Block until every buffered message is sent or failed
+        """
+        self._buffer.join()
+
+    def close(self):
+        """
+        Send the buffered messages and stop the workers
+        """
+        if self._stopping.is_set():
+            return
+        self.flush()
+        self._stopping.set()
+        for worker in self._workers:
+            worker.join()
+        atexit.unregister(self.close)
+
+    def stats(self) -> dict:
+        return {"buffered": self._buffer.qsize(), "sent": self.sent, "failed": self.failed}
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                first = self._buffer.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            futures, entries, results = self._collect(first)
+            if futures:
+                self._flush_batch(futures, entries, results)
+
+    def _collect(self, first: tuple) -> tuple[list[Future], list[tuple], list[dict]]:
+        """
+        Encode messages until a batch is full, by count or size, or the first one waited linger seconds
+        """
+        futures: list[Future] = []
+        entries: list[tuple] = []
+        results: list[dict] = []
+        size = 0
+        deadline = time.monotonic() + self.linger
+        item = first
+        while True:
+            data, future = item
+            if not future.set_running_or_notify_cancel():
+                # cancelled by the caller, nothing to send
+                self._buffer.task_done()
+            else:
+                futures.append(future)
+                results.append({})
+                try:
+                    body, attributes = self.sqs_client.encode_message(data, self.compressed)
+                    entries.append((str(len(results) - 1), body, attributes))
+                    size += self.sqs_client.message_size(body, attributes)
+                except Exception as e:
+                    results[-1] = {"success": False, "error": f"encoding message failed: {e!r}"}
+
+            if len(futures) >= MAX_BATCH_ENTRIES or size >= MAX_MESSAGE_SIZE:
+                break
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._buffer.get(timeout=remaining) if remaining > 0 else self._buffer.get_nowait()
+            except queue.Empty:
+                break
+        return futures, entries, results
+
+    def _flush_batch(self, futures: list[Future], entries: list[tuple], results: list[dict]):
+        try:
+            for batch in self.sqs_client._pack_batches(entries, results):
+                self.sqs_client._send_batch(batch, results, self.retries)
+        except Exception as e:
+            logger.error(f"sending {len(futures)} messages failed: {e!r}")
+            for result in results:
+                if not result:
+                    result.update({"success": False, "error": repr(e)})
+
+        for future, result in zip(futures, results):
+            try:
+                if result.get("success"):
+                    future.set_result(result["message_id"])
+                else:
+                    future.set_exception(MessageSendError(result.get("error", "message was not sent")))
+            except InvalidStateError as e:
+                logger.warning(f"could not resolve message future: {e!r}")
+            finally:
+                self._buffer.task_done()
+
+        succeeded = sum(1 for result in results if result.get("success"))
+        with self._lock:
+            self.sent += succeeded
+            self.failed += len(results) - succeeded
@@ -0,0 +1,77 @@
+"""
+Compare the SQS codecs on waypoint-like payloads: compression ratio and encode/decode throughput.
+
+    python -m benchmarks.sqs_codecs
+"""
+import random
+import time
+
+from TracefyClients.sqs_codecs import BrotliCodec, Codec, GzipCodec, ZstdCodec, dumps, train_zstd_dictionary
+
+ROUNDS = 200
+
+
+def waypoint(i: int) -> dict:
+    return {
+        "device_id": f"device-{i % 50:04d}",
+        "trip_id": f"trip-{i // 100:06d}",
+        "timestamp": 1726000000 + i,
+        "lat": round(52.0907 + random.uniform(-0.05, 0.05), 6),
+        "lng": round(5.1214 + random.uniform(-0.05, 0.05), 6),
+        "speed": round(random.uniform(0, 40), 1),
+        "heading": random.randint(0, 359),
+        "accuracy": random.randint(3, 25),
+    }
+
+
+def payloads() -> dict[str, object]:
+    return {
+        "single waypoint": waypoint(1),
+        "batch of 50": [waypoint(i) for i in range(50)],
+        "batch of 1000": [waypoint(i) for i in range(1000)],
+    }
+
+
+def measure(codec: Codec, payload) -> tuple[float, float, float]:
+    raw_size = len(dumps(payload))
+    body = codec.encode(payload)
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        codec.encode(payload)
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        codec.decode(body)
+    decode_time = time.perf_counter() - start
+
+    megabytes = raw_size * ROUNDS / 1024 / 1024
+    return raw_size / len(body), megabytes / encode_time, megabytes / decode_time
+
+
+def main():
+    random.seed(0)
+    dictionary = train_zstd_dictionary([waypoint(i) for i in range(5000)])
+    codecs = [
+        Codec(),
+        BrotliCodec(quality=11),
+        BrotliCodec(quality=5),
+        BrotliCodec(quality=1),
+        GzipCodec(level=6),
+        ZstdCodec(level=3),
+        ZstdCodec(level=3, dictionary=dictionary),
+    ]
+
+    print(f"{'payload':<16} {'codec':<14} {'ratio':>7} {'encode MB/s':>12} {'decode MB/s':>12}")
+    for name, payload in payloads().items():
+        for codec in codecs:
+            ratio, encode_speed, decode_speed = measure(codec, payload)
+            label = codec.name.split(":")[0] + (" dict" if ":" in codec.name else "")
+            if isinstance(codec, BrotliCodec):
+                label += f" q{codec.quality}"
+            print(f"{name:<16} {label:<14} {ratio:>7.2f} {encode_speed:>12.1f} {decode_speed:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import asyncio
+import pytest
+from TracefyClients import async_sql_client
+from TracefyClients.async_sql_client import AsyncSQLClient
+
+
+ROWS = [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    async def execute(self, query, params=()):
+        if query.startswith("BROKEN"):
+            raise RuntimeError("syntax error")
+        self.connection.executed.append((query, params))
+        self.rowcount = 1
+        return 1
+
+    async def fetchall(self):
+        return list(ROWS)
+
+    async def fetchone(self):
+        return ROWS[0]
+
+
+class FakeConnection:
+    def __init__(self):
+        self.executed = []
+        self.events = []
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self)
+
+    async def begin(self):
+        self.events.append("begin")
+
+    async def commit(self):
+        self.events.append("commit")
+
+    async def rollback(self):
+        self.events.append("rollback")
+
+
+class FakePool:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.connection = FakeConnection()
+        self.in_use = 0
+        self.closed = False
+
+    async def acquire(self):
+        self.in_use += 1
+        return self.connection
+
+    def release(self, connection):
+        self.in_use -= 1
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+
+@pytest.fixture
+def pools(monkeypatch) -> list:
+    pools = []
+
+    async def create_pool(**kwargs):
+        # give the other tasks a chance to start connecting as well
+        await asyncio.sleep(0.01)
+        pools.append(FakePool(**kwargs))
+        return pools[-1]
+
+    monkeypatch.setattr(async_sql_client.aiomysql, "create_pool", create_pool)
+    return pools
+
+
+@pytest.fixture
+def client() -> AsyncSQLClient:
+    return AsyncSQLClient({"database": "api", "host": "localhost", "user": "mysql", "password": "mysql"})
+
+
+def test_concurrent_connect_opens_one_pool(pools, client):
+    async def main():
+        return await asyncio.gather(*(client.fetch_one("SELECT * FROM users") for _ in range(5)))
+
+    assert asyncio.run(main()) == [ROWS[0]] * 5
+    assert len(pools) == 1
+    assert pools[0].kwargs["db"] == "api"
+    assert pools[0].kwargs["autocommit"]
+
+
+def test_fetch_one_and_fetch_all(pools, client):
+    async def main():
+        return await client.fetch_one("SELECT * FROM users WHERE id = %s", (1,)), await client.fetch_all("SELECT * FROM users")
+
+    one, rows = asyncio.run(main())
+    assert one == ROWS[0]
+    assert rows == ROWS
+    assert pools[0].connection.executed == [("SELECT * FROM users WHERE id = %s", (1,)), ("SELECT * FROM users", ())]
+    assert pools[0].in_use == 0
+    assert client.profiler.top(1, by="count")[0]["count"] == 1
+
+
+def test_transaction_rollback(pools, client):
+    async def main():
+        await client.execute_transaction(["UPDATE users SET name = %s", "BROKEN"], [("c",), ()])
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+    assert pools[0].connection.events == ["begin", "rollback"]
+    assert pools[0].in_use == 0
+
+
+def test_close(pools, client):
+    async def main():
+        async with client:
+            await client.fetch_all("SELECT * FROM users")
+        await client.close()
+
+    asyncio.run(main())
+    assert pools[0].closed
+    assert client.pool is None
@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+from botocore.stub import Stubber
+
+from TracefyClients import aws
+
+ENDPOINT_URL = "https://sqs.eu-central-1.amazonaws.com"
+QUEUE_URL = "https://sqs.eu-central-1.amazonaws.com/123456789012/test"
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    aws.clear()
+    yield
+    aws.clear()
+
+
+def test_clients_are_shared_per_service_region_and_endpoint():
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(aws.get_client("sqs", "eu-central-1", ENDPOINT_URL)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(client is clients[0] for client in clients)
+    assert aws.get_client("sqs", "eu-west-1") is not clients[0]
+    assert aws.get_resource("sqs", "eu-central-1", ENDPOINT_URL).meta.client is clients[0]
+
+
+def test_client_config_from_env(monkeypatch):
+    monkeypatch.setenv("AWS_MAX_POOL_CONNECTIONS", "7")
+    monkeypatch.setenv("AWS_TCP_KEEPALIVE", "false")
+    config = aws.get_client("s3").meta.config
+    assert config.max_pool_connections == 7
+    assert config.tcp_keepalive is False
+
+
+def test_queue_urls_are_resolved_once():
+    stubber = Stubber(aws.get_client("sqs", "eu-central-1", ENDPOINT_URL))
+    stubber.add_response("get_queue_url", {"QueueUrl": QUEUE_URL}, {"QueueName": "test"})
+    with stubber:
+        assert aws.get_queue_url("test", "eu-central-1", ENDPOINT_URL) == QUEUE_URL
+        assert aws.get_queue_url("test", "eu-central-1", ENDPOINT_URL) == QUEUE_URL
+    stubber.assert_no_pending_responses()
+
+
+def test_queues_are_only_created_when_asked():
+    stubber = Stubber(aws.get_client("sqs", "eu-central-1", ENDPOINT_URL))
+    stubber.add_response("create_queue", {"QueueUrl": QUEUE_URL}, {"QueueName": "test", "Attributes": {"DelaySeconds": "5"}})
+    with stubber:
+        assert aws.get_queue_url("test", "eu-central-1", ENDPOINT_URL, create=True, attributes={"DelaySeconds": "5"}) == QUEUE_URL
+
+
+def test_clients_follow_credential_changes(monkeypatch):
+    client = aws.get_client("s3", "eu-central-1")
+    assert aws.get_client("s3", "eu-central-1") is client
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "rotated")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "rotated")
+    rotated = aws.get_client("s3", "eu-central-1")
+    assert rotated is not client
+    assert rotated._request_signer._credentials.access_key == "rotated"
+
+
+def test_explicit_credentials_are_used():
+    client = aws.get_client("s3", "eu-central-1", aws_access_key_id="other", aws_secret_access_key="secret")
+    assert client is not aws.get_client("s3", "eu-central-1")
+    assert client._request_signer._credentials.access_key == "other"
+    assert aws.get_resource("dynamodb", "eu-central-1", aws_access_key_id="other",
+                            aws_secret_access_key="secret").meta.client._request_signer._credentials.access_key == "other"
@@ -0,0 +1,46 @@
+import threading
+import time
+
+from TracefyClients.cache import MISSING
+from TracefyClients.dynamo_cache import NOT_FOUND, ItemCache
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = ItemCache(maxsize=10, ttl=60, negative_ttl=60)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"id": "a"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load(("t", "a"), loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"id": "a"}] * 8
+    assert cache.get_or_load(("t", "a"), loader) == {"id": "a"}
+    assert cache.stats()["coalesced"] == 7
+
+
+def test_missing_items_are_cached_for_negative_ttl():
+    cache = ItemCache(maxsize=10, ttl=60, negative_ttl=0.1)
+    assert cache.get_or_load(("t", "a"), lambda: None) is None
+    assert cache.get(("t", "a")) is NOT_FOUND
+    time.sleep(0.15)
+    assert cache.get(("t", "a")) is MISSING
+
+
+def test_items_invalidated_while_loading_are_not_cached():
+    cache = ItemCache(maxsize=10, ttl=60)
+
+    def loader():
+        cache.invalidate(("t", "a"))
+        return {"id": "a", "version": 1}
+
+    assert cache.get_or_load(("t", "a"), loader) == {"id": "a", "version": 1}
+    assert cache.get(("t", "a")) is MISSING
@@ -0,0 +1,142 @@
+import pytest
+from botocore.exceptions import EndpointConnectionError, ReadTimeoutError
+from botocore.stub import Stubber
+
+from TracefyClients import aws
+from TracefyClients.cache import MISSING
+from TracefyClients.dynamo_cache import ItemCache
+from TracefyClients.dynamo_db_client import BatchWriteError, DynamoDBClient
+
+
+@pytest.fixture
+def dynamodb(monkeypatch) -> (DynamoDBClient, Stubber):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    aws.clear()
+    client = DynamoDBClient()
+    client.bind_table("waypoints", key_names=["device_id", "timestamp"])
+    yield client, Stubber(client.dynamodb.meta.client)
+    aws.clear()
+
+
+def put(device_id: str, timestamp: int) -> dict:
+    return {"PutRequest": {"Item": {"device_id": device_id, "timestamp": timestamp}}}
+
+
+def test_batch_write_dedupes_chunks_and_retries_unprocessed(dynamodb):
+    (client, stubber) = dynamodb
+    # 25 distinct keys fit in one request once the duplicate is dropped
+    items = [{"device_id": "a", "timestamp": i} for i in range(25)] + [{"device_id": "a", "timestamp": 0, "speed": 1}]
+    stubber.add_response("batch_write_item", {"UnprocessedItems": {"waypoints": [
+        {"PutRequest": {"Item": {"device_id": {"S": "a"}, "timestamp": {"N": "3"}}}}
+    ]}}, None)
+    stubber.add_response("batch_write_item", {"UnprocessedItems": {}}, None)
+
+    with stubber:
+        assert client.batch_write(items) == []
+    stubber.assert_no_pending_responses()
+
+
+def test_batch_write_raises_writes_that_keep_failing(dynamodb):
+    (client, stubber) = dynamodb
+    for _ in range(3):
+        stubber.add_response("batch_write_item", {"UnprocessedItems": {"waypoints": [
+            {"PutRequest": {"Item": {"device_id": {"S": "a"}, "timestamp": {"N": "1"}}}}
+        ]}}, None)
+
+    with stubber, pytest.raises(BatchWriteError) as error:
+        client.batch_write([{"device_id": "a", "timestamp": 1}], retries=3, raise_on_failure=True)
+    assert error.value.failed == [put("a", 1)]
+
+
+def test_batch_write_retries_connection_errors_and_reports_failed_chunks(dynamodb):
+    (client, _) = dynamodb
+    calls = []
+
+    def batch_write_item(RequestItems):
+        chunk = RequestItems["waypoints"]
+        calls.append(chunk[0]["PutRequest"]["Item"]["device_id"])
+        if calls[-1] == "b":
+            raise EndpointConnectionError(endpoint_url="https://dynamodb.eu-central-1.amazonaws.com")
+        if calls.count("a") == 1:
+            raise ReadTimeoutError(endpoint_url="https://dynamodb.eu-central-1.amazonaws.com")
+        return {"UnprocessedItems": {}}
+
+    client.dynamodb.meta.client.batch_write_item = batch_write_item
+    items = [{"device_id": "a", "timestamp": i} for i in range(25)] + [{"device_id": "b", "timestamp": 0}]
+    assert client.batch_write(items, workers=2, retries=3) == [put("b", 0)]
+    assert sorted(calls) == ["a", "a", "b", "b", "b"]
+
+
+def test_put_item_raises_client_errors(dynamodb):
+    (client, stubber) = dynamodb
+    stubber.add_client_error("put_item", "ProvisionedThroughputExceededException")
+    with stubber, pytest.raises(Exception):
+        client.put_item({"device_id": "a", "timestamp": 1})
+
+
+def test_batch_get_retries_unprocessed_keys(dynamodb):
+    (client, stubber) = dynamodb
+    keys = [{"device_id": "a", "timestamp": i} for i in range(150)]
+    typed = lambda i: {"device_id": {"S": "a"}, "timestamp": {"N": str(i)}}
+    stubber.add_response("batch_get_item", {
+        "Responses": {"waypoints": [typed(i) for i in range(99)]},
+        "UnprocessedKeys": {"waypoints": {"Keys": [typed(99)]}},
+    }, None)
+    stubber.add_response("batch_get_item", {"Responses": {"waypoints": [typed(99)]}}, None)
+    stubber.add_response("batch_get_item", {"Responses": {"waypoints": [typed(i) for i in range(100, 150)]}}, None)
+
+    with stubber:
+        items = client.batch_get(keys + keys[:10])
+    assert sorted(item["timestamp"] for item in items) == list(range(150))
+
+
+def test_parallel_scan_reads_all_segments(dynamodb):
+    (client, _) = dynamodb
+    calls = []
+
+    def scan(**params):
+        calls.append(params)
+        segment = params["Segment"]
+        if "ExclusiveStartKey" not in params:
+            return {"Items": [{"segment": segment, "page": 0}], "LastEvaluatedKey": {"device_id": "x"}}
+        return {"Items": [{"segment": segment, "page": 1}]}
+
+    client.dynamodb.meta.client.scan = scan
+    items = list(client.parallel_scan(segments=4, attributes=["segment", "page"]))
+
+    assert sorted((item["segment"], item["page"]) for item in items) == [(s, p) for s in range(4) for p in range(2)]
+    assert all(call["TotalSegments"] == 4 and call["ProjectionExpression"] == "#p0, #p1" for call in calls)
+
+
+def test_get_item_reads_through_cache_and_writes_invalidate(dynamodb):
+    (client, stubber) = dynamodb
+    client.item_cache = ItemCache(maxsize=10, ttl=60)
+    key = {"device_id": "a", "timestamp": 1}
+    item = {"Item": {"device_id": {"S": "a"}, "timestamp": {"N": "1"}}}
+    stubber.add_response("get_item", item, None)
+    stubber.add_response("put_item", {}, None)
+    stubber.add_response("get_item", {"Item": {"device_id": {"S": "a"}, "timestamp": {"N": "1"}, "speed": {"N": "2"}}}, None)
+
+    with stubber:
+        assert client.get_item(key) == key
+        assert client.get_item(key) == key
+        client.put_item({**key, "speed": 2})
+        assert client.get_item(key) == {**key, "speed": 2}
+    stubber.assert_no_pending_responses()
+
+
+def test_batch_write_invalidates_after_the_writes(dynamodb):
+    (client, _) = dynamodb
+    client.item_cache = ItemCache(maxsize=10, ttl=60)
+    key = {"device_id": "a", "timestamp": 1}
+
+    def write_chunk(chunk, retries):
+        # a read racing the write caches the old item
+        client.item_cache.set(client._cache_key(key), key)
+        return []
+
+    client._write_chunk = write_chunk
+    client.batch_write([{**key, "speed": 2}])
+    assert client.item_cache.get(client._cache_key(key)) is MISSING
@@ -0,0 +1,64 @@
+import time
+
+from pymongo.errors import BulkWriteError
+
+from TracefyClients.mongodb_bulk import MongoBulkWriter
+
+
+class FakeCollection:
+    def __init__(self):
+        self.documents = []
+        self.calls = 0
+
+    def insert_many(self, documents, ordered=True):
+        assert ordered is False
+        self.calls += 1
+        errors = [{"index": i, "code": 11000, "errmsg": "duplicate key"}
+                  for i, document in enumerate(documents) if document.get("duplicate")]
+        self.documents += [document for document in documents if not document.get("duplicate")]
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [], "nInserted": len(documents) - len(errors)})
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def get_collection(self, name, write_concern=None):
+        return self.collections.setdefault(name, FakeCollection())
+
+
+class FakeMongoDBClient:
+    def __init__(self):
+        self.db = FakeDatabase()
+
+    def get_db(self):
+        return self.db
+
+
+def test_writer_flushes_by_count_and_reports_failures():
+    client = FakeMongoDBClient()
+    failures = []
+    writer = MongoBulkWriter(client, max_documents=10, flush_interval=60, on_error=lambda name, failed: failures.extend(failed))
+    for i in range(25):
+        writer.add("waypoints", {"i": i, "duplicate": i == 3})
+    writer.add("devices", {"id": 1})
+
+    waypoints = client.db.collections["waypoints"]
+    assert waypoints.calls == 2
+    writer.close()
+
+    assert waypoints.calls == 3
+    assert sorted(document["i"] for document in waypoints.documents) == [i for i in range(25) if i != 3]
+    assert [failure["document"]["i"] for failure in failures] == [3]
+    assert client.db.collections["devices"].documents == [{"id": 1}]
+    assert (writer.inserted, writer.failed) == (25, 1)
+
+
+def test_writer_flushes_by_time():
+    client = FakeMongoDBClient()
+    writer = MongoBulkWriter(client, flush_interval=0.2)
+    writer.add("waypoints", {"i": 1})
+    time.sleep(0.5)
+    assert client.db.collections["waypoints"].documents == [{"i": 1}]
+    writer.close()
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+import pytest
+import redis
+
+from TracefyClients.redis_cache import cached, dumps, invalidate_tags, loads
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def eval(self, script, numkeys, key, *args):
+        with self.lock:
+            if "sadd" in script:
+                # adding a value to a tag set
+                seconds, member = args
+                self.data.setdefault(key, set()).add(member)
+                self.ttls[key] = max(self.ttls.get(key, -1), seconds)
+            elif self.data.get(key) == args[0]:
+                del self.data[key]
+
+    def smembers(self, key):
+        return self.data.get(key, set())
+
+    def unlink(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakeAsyncRedis:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+
+    def __getattr__(self, name):
+        async def call(*args, **kwargs):
+            return getattr(self.redis, name)(*args, **kwargs)
+        return call
+
+    def pipeline(self, transaction=True):
+        redis = self.redis
+
+        class Pipeline(FakePipeline):
+            async def execute(self):
+                return FakePipeline.execute(self)
+
+        return Pipeline(redis)
+
+
+class FakeRedisClient:
+    def __init__(self):
+        self.redis = FakeRedis()
+
+    def get_binary_client(self):
+        return self.redis
+
+    def get_async_binary_client(self):
+        return FakeAsyncRedis(self.redis)
+
+
+def test_serializer_compresses_large_values():
+    small, large = dumps({"a": 1}, 0.5, 100.0), dumps(["x" * 10] * 1000, 0.5, 100.0)
+    assert loads(small) == ({"a": 1}, 0.5, 100.0)
+    assert loads(large)[0] == ["x" * 10] * 1000
+    assert len(large) < 1000
+
+
+def test_concurrent_misses_compute_once():
+    client = FakeRedisClient()
+    calls = []
+
+    @cached(ttl=60, key="device:{0}", redis_client=client)
+    def load(device_id):
+        calls.append(device_id)
+        time.sleep(0.2)
+        return {"id": device_id}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(load("a"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["a"]
+    assert results == [{"id": "a"}] * 5
+    assert load.key_for("a").endswith(":device:a")
+
+
+def test_tags_invalidate_values():
+    client = FakeRedisClient()
+    calls = []
+
+    @cached(ttl=60, tags=lambda device_id: [f"device:{device_id}"], redis_client=client)
+    def load(device_id):
+        calls.append(device_id)
+        return device_id
+
+    load("a"), load("a"), load("b")
+    assert client.redis.ttls == {"cached:tag:device:a": 60, "cached:tag:device:b": 60}
+    assert invalidate_tags("device:a", redis_client=client) == 1
+    load("a"), load("b")
+    assert calls == ["a", "b", "a"]
+
+
+def test_async_functions_are_cached():
+    client = FakeRedisClient()
+    calls = []
+
+    @cached(ttl=60, redis_client=client)
+    async def load(device_id):
+        calls.append(device_id)
+        return device_id
+
+    async def main():
+        return [await load("a"), await load("a")]
+
+    assert asyncio.run(main()) == ["a", "a"]
+    assert calls == ["a"]
+
+
+def test_redis_errors_of_the_function_are_raised_once():
+    client = FakeRedisClient()
+    calls = []
+
+    @cached(ttl=60, redis_client=client)
+    def load(device_id):
+        calls.append(device_id)
+        raise redis.ConnectionError("the function's own redis is down")
+
+    with pytest.raises(redis.ConnectionError):
+        load("a")
+    assert calls == ["a"]
+    assert not any(key.endswith(":lock") for key in client.redis.data)
+
+
+def test_methods_share_values_between_instances():
+    client = FakeRedisClient()
+    calls = []
+
+    class Devices:
+        @cached(ttl=60, redis_client=client)
+        def load(self, device_id):
+            calls.append(device_id)
+            return device_id
+
+    assert Devices().load("a") == Devices().load("a") == "a"
+    assert calls == ["a"]
@@ -0,0 +1,81 @@
+import fnmatch
+
+from TracefyClients.redis_client import RedisClient
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        self.redis.executes += 1
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.executes = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def mset(self, mapping):
+        self.data.update(mapping)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.ttls[key] = ex
+
+    def hgetall(self, key):
+        return self.data.get(key, {})
+
+    def scan_iter(self, match, count):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+    def unlink(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+
+def redis_client(monkeypatch) -> RedisClient:
+    monkeypatch.setenv("REDIS_PIPELINE_CHUNK_SIZE", "10")
+    client = RedisClient()
+    client.client = FakeRedis()
+    return client
+
+
+def test_bulk_helpers_pipeline_in_chunks(monkeypatch):
+    client = redis_client(monkeypatch)
+    client.mset_many({f"device:{i}": str(i) for i in range(25)})
+    client.mset_many({f"session:{i}": "x" for i in range(5)}, ttl=60)
+    assert client.client.executes == 4
+    assert client.client.ttls == {f"session:{i}": 60 for i in range(5)}
+
+    values = client.mget_many([f"device:{i}" for i in range(30)])
+    assert values == [str(i) for i in range(25)] + [None] * 5
+    assert client.client.executes == 5
+
+
+def test_hgetall_many_and_delete_pattern(monkeypatch):
+    client = redis_client(monkeypatch)
+    client.client.data.update({"hash:1": {"a": "1"}, "device:1": "1", "device:2": "2"})
+    assert client.hgetall_many(["hash:1", "hash:2"]) == [{"a": "1"}, {}]
+    assert client.delete_pattern("device:*") == 2
+    assert list(client.client.data) == ["hash:1"]
+
+
+def test_pools_keep_charset_and_bound_connections(monkeypatch):
+    monkeypatch.setenv("REDIS_MAX_CONNECTIONS", "7")
+    client = RedisClient()
+    for pool in (client.client.connection_pool, client.get_binary_client().connection_pool):
+        assert pool.connection_kwargs["encoding"] == "utf-8"
+        assert pool.max_connections == 7
+    assert client.client.connection_pool.connection_kwargs["decode_responses"]
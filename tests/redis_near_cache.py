@@ -0,0 +1,74 @@
+from TracefyClients.cache import MISSING
+from TracefyClients.redis_near_cache import NearCache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.reads = 0
+        self.on_read = None
+
+    def get(self, key):
+        self.reads += 1
+        if self.on_read:
+            self.on_read(key)
+        return self.data.get(key)
+
+    def mget(self, keys):
+        self.reads += 1
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+class FakeRedisClient:
+    def __init__(self):
+        self.client = FakeRedis()
+
+    def get_client(self):
+        return self.client
+
+
+def test_values_are_cached_until_invalidated():
+    redis_client = FakeRedisClient()
+    redis_client.client.data.update({"flag:a": "1", "flag:b": "2"})
+    cache = NearCache(redis_client, prefixes=["flag:"], tracking=False)
+
+    assert cache.get("flag:a") == "1"
+    assert cache.mget(["flag:a", "flag:b", "flag:c"]) == ["1", "2", None]
+    assert redis_client.client.reads == 2
+
+    redis_client.client.data["flag:a"] = "3"
+    cache._invalidated(["flag:a"])
+    assert cache.get("flag:a") == "3"
+    cache._invalidated(None)
+    assert cache.get("flag:b") == "2"
+    assert redis_client.client.reads == 4
+
+
+def test_values_invalidated_while_read_are_not_cached():
+    redis_client = FakeRedisClient()
+    redis_client.client.data["flag:a"] = "1"
+    cache = NearCache(redis_client, tracking=False)
+
+    redis_client.client.on_read = lambda key: cache._invalidated([key])
+    assert cache.get("flag:a") == "1"
+    redis_client.client.on_read = None
+    assert cache.values.get("flag:a") is MISSING
+    assert cache.get("flag:a") == "1"
+    assert redis_client.client.reads == 2
+
+
+def test_keys_outside_the_prefixes_use_the_fallback_ttl():
+    cache = NearCache(FakeRedisClient(), prefixes=["flag:"], ttl=300, fallback_ttl=5, tracking=False)
+    assert cache.ttl_for("flag:a") == 5
+
+    cache._tracking.set()
+    assert cache.ttl_for("flag:a") == 300
+    assert cache.ttl_for("route:a") == 5
+
+    # without prefixes every key is tracked
+    cache = NearCache(FakeRedisClient(), ttl=300, tracking=False)
+    cache._tracking.set()
+    assert cache.ttl_for("route:a") == 300
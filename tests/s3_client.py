@@ -0,0 +1,58 @@
+import datetime
+import json
+
+import pytest
+from botocore.stub import ANY, Stubber
+
+from TracefyClients import aws
+from TracefyClients.s3_client import S3Client
+
+
+@pytest.fixture
+def s3_client(monkeypatch) -> (S3Client, Stubber):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setenv("S3_BUCKET", "archive")
+    monkeypatch.setenv("S3_UPLOAD_WORKERS", "2")
+    aws.clear()
+    client = S3Client()
+    yield client, Stubber(client.s3)
+    aws.clear()
+
+
+def test_add_many_to_bucket_returns_summary(s3_client):
+    (client, stubber) = s3_client
+    today = datetime.datetime.now().strftime("%Y/%m/%d")
+    for _ in range(4):
+        stubber.add_response("put_object", {}, {"Bucket": "archive", "Key": ANY, "Body": ANY})
+    stubber.add_client_error("put_object", "AccessDenied", http_status_code=403)
+
+    with stubber:
+        summary = client.add_many_to_bucket({f"row{i}": {"id": i} for i in range(5)}, prefix="waypoints/", retries=1)
+
+    assert summary["succeeded"] == 4
+    assert len(summary["failed"]) == 1
+    assert all(path.startswith(f"waypoints/{today}/row") for path in summary["failed"])
+
+
+def test_add_many_to_bucket_puts_small_bodies(s3_client):
+    (client, stubber) = s3_client
+    body = json.dumps({"id": 1}).encode("utf-8")
+    # retries=0 still uploads once
+    stubber.add_response("put_object", {}, {"Bucket": "archive", "Key": ANY, "Body": body})
+
+    with stubber:
+        summary = client.add_many_to_bucket({"row": {"id": 1}}, retries=0)
+    stubber.assert_no_pending_responses()
+    assert summary == {"succeeded": 1, "failed": {}}
+
+
+def test_add_many_to_bucket_multipart_large_bodies(s3_client, monkeypatch):
+    (client, _) = s3_client
+    client.transfer_config.multipart_threshold = 10
+    uploads = []
+    monkeypatch.setattr(client.s3, "upload_fileobj", lambda fileobj, bucket, key, Config: uploads.append(key))
+
+    summary = client.add_many_to_bucket({"row": {"id": 1, "name": "a long enough body"}})
+    assert summary["succeeded"] == 1
+    assert len(uploads) == 1
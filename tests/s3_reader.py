@@ -0,0 +1,82 @@
+import datetime
+import gzip
+import io
+import json
+import threading
+import time
+
+import zstandard
+
+from TracefyClients.s3_client import S3Client
+from TracefyClients.s3_reader import S3ArchiveReader
+
+
+class FakePaginator:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, Bucket, Prefix):
+        keys = sorted(key for key in self.s3.objects if key.startswith(Prefix))
+        # pages of two keys
+        for i in range(0, len(keys), 2):
+            with self.s3.lock:
+                self.s3.listed.append(Prefix)
+            yield {"Contents": [{"Key": key} for key in keys[i:i + 2]]}
+
+
+class FakeS3:
+    def __init__(self, objects: dict):
+        self.objects = objects
+        self.listed = []
+        self.bodies = []
+        self.lock = threading.Lock()
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return FakePaginator(self)
+
+    def get_object(self, Bucket, Key):
+        body = io.BytesIO(self.objects[Key])
+        with self.lock:
+            self.bodies.append(body)
+        return {"Body": body, "ContentLength": len(self.objects[Key])}
+
+
+def test_reader_yields_records_of_all_formats_in_date_order():
+    objects = {
+        "waypoints/2024/09/11/a.json": json.dumps({"id": 1}).encode(),
+        "waypoints/2024/09/11/b.json": json.dumps({"id": 2}).encode(),
+        "waypoints/2024/09/11/c.json": json.dumps({"id": 3}).encode(),
+        "waypoints/2024/09/12/x.ndjson.gz": gzip.compress(b'{"id": 4}\n{"id": 5}\n'),
+        "waypoints/2024/09/13/y.ndjson.zst": zstandard.ZstdCompressor().compress(b'{"id": 6}\n{"id": 7}\n'),
+        "waypoints/2024/09/14/z.json": json.dumps({"id": 8}).encode(),
+        "other/2024/09/12/a.json": json.dumps({"id": 9}).encode(),
+    }
+    client = S3Client.__new__(S3Client)
+    client.s3 = FakeS3(objects)
+    client.s3_bucket = "archive"
+    reader = S3ArchiveReader(client, prefix="waypoints/", prefetch=2)
+
+    records = list(reader.read(datetime.date(2024, 9, 10), datetime.date(2024, 9, 13)))
+
+    assert [record["id"] for record in records] == [1, 2, 3, 4, 5, 6, 7]
+    assert set(client.s3.listed) == {"waypoints/2024/09/11/", "waypoints/2024/09/12/", "waypoints/2024/09/13/"}
+
+
+def test_stopping_early_closes_streamed_bodies(monkeypatch):
+    monkeypatch.setattr("TracefyClients.s3_reader.STREAM_THRESHOLD", 0)
+    objects = {f"waypoints/2024/09/11/{i}.ndjson": b'{"id": 1}\n{"id": 2}\n' for i in range(6)}
+    client = S3Client.__new__(S3Client)
+    client.s3 = FakeS3(objects)
+    client.s3_bucket = "archive"
+    reader = S3ArchiveReader(client, prefix="waypoints/", fetch_workers=2, prefetch=4)
+
+    records = reader.read(datetime.date(2024, 9, 11), datetime.date(2024, 9, 11))
+    assert next(records) == {"id": 1}
+    records.close()
+
+    deadline = time.monotonic() + 2
+    while not all(body.closed for body in client.s3.bodies) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.s3.bodies
+    assert all(body.closed for body in client.s3.bodies)
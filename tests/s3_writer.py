@@ -0,0 +1,135 @@
+import gzip
+import json
+import threading
+
+import zstandard
+from botocore.exceptions import ClientError
+
+from TracefyClients.s3_client import S3Client
+from TracefyClients.s3_writer import S3NDJSONWriter
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.uploads[Key] = []
+        return {"UploadId": Key}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId].append(Body)
+        return {"ETag": str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        assert [part["PartNumber"] for part in MultipartUpload["Parts"]] == list(range(1, len(self.uploads[UploadId]) + 1))
+        self.objects[Key] = b"".join(self.uploads.pop(UploadId))
+
+
+class FlakyS3(FakeS3):
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+        self.aborted = []
+
+    def put_object(self, Bucket, Key, Body):
+        if self.failures:
+            self.failures -= 1
+            raise ClientError({"Error": {"Code": "SlowDown", "Message": "slow down"}}, "PutObject")
+        super().put_object(Bucket, Key, Body)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(Key)
+
+
+class BlockingS3(FakeS3):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.blocked = threading.Event()
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.blocked.set()
+        self.release.wait(5)
+        return super().upload_part(Bucket, Key, UploadId, PartNumber, Body)
+
+
+def s3_client(s3=None) -> S3Client:
+    client = S3Client.__new__(S3Client)
+    client.s3 = s3 or FakeS3()
+    client.s3_bucket = "archive"
+    return client
+
+
+def test_writer_rolls_objects_by_size():
+    client = s3_client()
+    writer = S3NDJSONWriter(client, prefix="waypoints/", max_object_size=20000)
+    records = [{"id": i, "lat": i / 3} for i in range(20000)]
+    writer.write_many(records[:10000])
+    for record in records[10000:]:
+        writer.write(record)
+    writer.close()
+
+    assert writer.objects_written == len(client.s3.objects) > 1
+    lines = []
+    for key in sorted(client.s3.objects):
+        assert key.startswith("waypoints/") and key.endswith(".ndjson.gz")
+        lines += gzip.decompress(client.s3.objects[key]).splitlines()
+    assert sorted(json.loads(line)["id"] for line in lines) == list(range(20000))
+
+
+def test_writer_streams_multipart_uploads():
+    client = s3_client()
+    writer = S3NDJSONWriter(client, compression="zstd", part_size=1000)
+    writer.write_many([{"id": i} for i in range(50000)])
+    # parts are uploaded while the object is still open
+    writer._uploads.join()
+    assert client.s3.uploads
+    writer.close()
+
+    [body] = client.s3.objects.values()
+    lines = zstandard.ZstdDecompressor().decompressobj().decompress(body).splitlines()
+    assert [json.loads(line)["id"] for line in lines] == list(range(50000))
+
+
+def test_writer_retries_failed_uploads():
+    client = s3_client(FlakyS3(failures=2))
+    writer = S3NDJSONWriter(client, retry_interval=0.01)
+    writer.write_many([{"id": i} for i in range(10)])
+    writer.close()
+
+    assert writer.objects_written == 1
+    assert writer.objects_failed == 0
+    [body] = client.s3.objects.values()
+    assert len(gzip.decompress(body).splitlines()) == 10
+
+
+def test_writer_gives_up_after_close():
+    client = s3_client(FlakyS3(failures=100))
+    writer = S3NDJSONWriter(client, retries=3, retry_interval=0.01)
+    writer.write({"id": 1})
+    writer.close()
+
+    assert writer.objects_written == 0
+    assert writer.objects_failed == 1
+    assert client.s3.failures == 97
+
+
+def test_writer_uploads_parts_outside_the_lock():
+    client = s3_client(BlockingS3())
+    writer = S3NDJSONWriter(client, compression="zstd", part_size=1000)
+    # the first part blocks in upload_part, writing goes on until the pending parts fill up
+    for i in range(5):
+        writer.write_many([{"id": j} for j in range(i * 10000, (i + 1) * 10000)])
+    assert client.s3.blocked.wait(1)
+    assert not client.s3.objects
+
+    client.s3.release.set()
+    writer.close()
+    [body] = client.s3.objects.values()
+    lines = zstandard.ZstdDecompressor().decompressobj().decompress(body).splitlines()
+    assert len(lines) == 50000
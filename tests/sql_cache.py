@@ -0,0 +1,146 @@
+import time
+from TracefyClients.sql_cache import QueryCache, tables_in_query
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def incr(self, key):
+        self.commands.append(key)
+
+    def execute(self):
+        return [self.redis.incr(key) for key in self.commands]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.expiries = {}
+        self.mgets = 0
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.expiries[key] = ex
+
+    def mget(self, keys):
+        self.mgets += 1
+        return [self.data.get(key) for key in keys]
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakeRedisClient:
+    def __init__(self, redis):
+        self.redis = redis
+
+    def get_binary_client(self):
+        return self.redis
+
+
+def test_tables_in_query():
+    assert tables_in_query("SELECT * FROM users u JOIN `api`.`devices` d ON d.user_id = u.id") == {"users", "devices"}
+    assert tables_in_query("INSERT INTO waypoints (`id`) VALUES (%s)") == {"waypoints"}
+    assert tables_in_query("update Users set name = %s") == {"users"}
+    assert tables_in_query("SELECT 1") == frozenset()
+
+
+def test_tables_in_query_comma_lists():
+    assert tables_in_query("SELECT * FROM users, devices WHERE devices.user_id = users.id") == {"users", "devices"}
+    assert tables_in_query("SELECT * FROM users AS u, `api`.`devices` d, trips WHERE 1") == {"users", "devices", "trips"}
+    assert tables_in_query("SELECT * FROM users u LEFT JOIN devices d ON d.user_id = u.id") == {"users", "devices"}
+
+
+def test_tables_in_query_strict():
+    query = "SELECT * FROM (SELECT user_id FROM devices) d, users WHERE users.id = d.user_id"
+    assert tables_in_query(query) == {"devices"}
+    assert tables_in_query(query, strict=True) is None
+    assert tables_in_query("SELECT * FROM users, devices", strict=True) == {"users", "devices"}
+
+
+def test_query_cache_skips_unparseable_queries():
+    cache = QueryCache()
+    loads = []
+    query = "SELECT * FROM (SELECT id FROM countries) c, regions"
+    for _ in range(2):
+        cache.get_or_load(query, (), lambda: loads.append(1))
+    assert len(loads) == 2
+
+
+def test_query_cache_read_through_and_invalidation():
+    cache = QueryCache()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return [{"id": 1}]
+
+    query = "SELECT * FROM countries WHERE id = %s"
+    assert cache.get_or_load(query, (1,), loader) == [{"id": 1}]
+    assert cache.get_or_load(query, (1,), loader) == [{"id": 1}]
+    assert len(loads) == 1
+
+    cache.get_or_load(query, (2,), loader)
+    assert len(loads) == 2
+
+    cache.invalidate_query("UPDATE countries SET name = %s WHERE id = %s")
+    cache.get_or_load(query, (1,), loader)
+    assert len(loads) == 3
+    assert cache.stats()["hit_ratio"] == 0.25
+
+
+def test_query_cache_only_caches_allowed_tables():
+    cache = QueryCache(tables={"countries"})
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return None
+
+    for _ in range(2):
+        cache.get_or_load("SELECT * FROM users", (), loader)
+        cache.get_or_load("SELECT * FROM countries", (), loader)
+    assert len(loads) == 3
+
+
+def test_query_cache_shared_versions_are_cached_locally():
+    redis = FakeRedis()
+    cache = QueryCache(redis_client=FakeRedisClient(redis), version_ttl=0.2)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return len(loads)
+
+    query = "SELECT * FROM countries"
+    assert cache.get_or_load(query, (), loader) == 1
+    assert cache.get_or_load(query, (), loader) == 1
+    assert redis.mgets == 1
+
+    # an invalidation by this process is seen right away
+    cache.invalidate(["countries"])
+    assert cache.get_or_load(query, (), loader) == 2
+    assert redis.mgets == 2
+
+    # one by another process once the local versions expire
+    redis.incr("sqlcache:version:countries")
+    assert cache.get_or_load(query, (), loader) == 2
+    time.sleep(0.25)
+    assert cache.get_or_load(query, (), loader) == 3
+    assert redis.mgets == 3
+
+
+def test_query_cache_sub_second_ttl_is_shared_for_a_second():
+    redis = FakeRedis()
+    cache = QueryCache(ttl=0.5, redis_client=FakeRedisClient(redis))
+    assert cache.get_or_load("SELECT * FROM countries", (), lambda: [{"id": 1}]) == [{"id": 1}]
+    assert list(redis.expiries.values()) == [1]
@@ -0,0 +1,155 @@
+import logging
+import mysql.connector
+import pytest
+from TracefyClients.sql_client import SQLClient
+from TracefyClients.sql_pool import BlockingConnectionPool
+from TracefyClients.sql_profiler import QueryInstrumentation
+
+
+ROWS = [{"id": i, "name": f"name-{i}"} for i in range(5)]
+
+
+class FakeCursor:
+    def __init__(self, connection, dictionary=True):
+        self.connection = connection
+        self.dictionary = dictionary
+        self.fetches = []
+        self.closed = False
+
+    def execute(self, operation, params=(), multi=False):
+        if operation.startswith("BROKEN"):
+            raise mysql.connector.ProgrammingError("syntax error")
+        self.connection.unread = list(ROWS)
+
+    def fetchmany(self, size=1):
+        rows, self.connection.unread = self.connection.unread[:size], self.connection.unread[size:]
+        self.fetches.append(len(rows))
+        if not self.dictionary:
+            return [tuple(row.values()) for row in rows]
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self):
+        self.in_transaction = False
+        self.unread = []
+        self.cursors = []
+
+    def cursor(self, buffered=True, dictionary=True):
+        cursor = FakeCursor(self, dictionary)
+        self.cursors.append(cursor)
+        return cursor
+
+    def consume_results(self):
+        self.unread = []
+
+    def is_connected(self):
+        return True
+
+    def reset_session(self):
+        pass
+
+
+class FakePool(BlockingConnectionPool):
+    def _create_connection(self):
+        return FakeConnection()
+
+
+@pytest.fixture
+def sql_client() -> SQLClient:
+    # skip __init__, the statement builders do not need a connection pool
+    client = SQLClient.__new__(SQLClient)
+    client.max_packet_size = 16 * 1024 * 1024
+    return client
+
+
+@pytest.fixture
+def pooled_client() -> SQLClient:
+    # a client on a pool of fake connections, without replicas, cache or prepared statements
+    client = SQLClient.__new__(SQLClient)
+    client.pool = FakePool({}, pool_size=1)
+    client.replicas = None
+    client.query_cache = None
+    client.prepared_statements = False
+    client.instrumentation = QueryInstrumentation(logging.getLogger("test"))
+    return client
+
+
+def test_insert_statement_modes(sql_client):
+    keys = ("id", "name")
+    assert sql_client._insert_statement(keys, "users") == "INSERT INTO users (`id`, `name`) VALUES (%s, %s)"
+    assert sql_client._insert_statement(keys, "users", "ignore") == "INSERT IGNORE INTO users (`id`, `name`) VALUES (%s, %s)"
+    assert sql_client._insert_statement(keys, "users", "update", ("name",)) == (
+        "INSERT INTO users (`id`, `name`) VALUES (%s, %s) ON DUPLICATE KEY UPDATE `name` = VALUES(`name`)"
+    )
+    with pytest.raises(ValueError):
+        sql_client._insert_statement(keys, "users", "replace")
+
+
+def test_chunk_rows_by_count(sql_client):
+    rows = [(i, "name") for i in range(25)]
+    chunks = list(sql_client._chunk_rows(rows, 10, 1024 * 1024))
+    assert [len(c) for c in chunks] == [10, 10, 5]
+    assert [r for c in chunks for r in c] == rows
+
+
+def test_chunk_rows_by_size(sql_client):
+    rows = [(i, "x" * 100) for i in range(10)]
+    chunks = list(sql_client._chunk_rows(rows, 1000, 350))
+    assert all(len(c) <= 3 for c in chunks)
+    assert [r for c in chunks for r in c] == rows
+
+
+def test_fetch_iter_batches(pooled_client):
+    rows = list(pooled_client.fetch_iter("SELECT * FROM users", batch_size=2))
+    assert rows == ROWS
+
+    cnx = pooled_client.pool._idle[0]
+    # 2 + 2 + 1 rows, then an empty batch ends the iteration
+    assert cnx.cursors[0].fetches == [2, 2, 1, 0]
+    assert cnx.cursors[0].closed
+    assert pooled_client.pool.in_use == 0
+    assert pooled_client.profiler.top(1)[0]["count"] == 1
+
+
+def test_fetch_iter_as_tuple(pooled_client):
+    rows = list(pooled_client.fetch_iter("SELECT id, name FROM users", as_tuple=True))
+    assert rows == [(row["id"], row["name"]) for row in ROWS]
+
+
+def test_fetch_iter_early_break_releases_connection(pooled_client):
+    rows = pooled_client.fetch_iter("SELECT * FROM users", batch_size=2)
+    assert next(rows) == ROWS[0]
+    assert pooled_client.pool.in_use == 1
+
+    rows.close()
+    cnx = pooled_client.pool._idle[0]
+    # the unread rows are consumed before the connection goes back to the pool
+    assert cnx.unread == []
+    assert pooled_client.pool.in_use == 0
+
+
+def test_fetch_iter_exception_releases_connection(pooled_client):
+    with pytest.raises(RuntimeError):
+        for row in pooled_client.fetch_iter("SELECT * FROM users", batch_size=2):
+            if row["id"] == 1:
+                raise RuntimeError("caller failed")
+
+    cnx = pooled_client.pool._idle[0]
+    assert cnx.unread == []
+    assert pooled_client.pool.in_use == 0
+
+
+@pytest.mark.parametrize("call", [
+    lambda client: client.fetch_one("BROKEN"),
+    lambda client: client.fetch_all("BROKEN"),
+    lambda client: client.update("BROKEN", ()),
+    lambda client: client.execute("BROKEN"),
+])
+def test_failed_query_releases_connection(pooled_client, call):
+    with pytest.raises(mysql.connector.ProgrammingError):
+        call(pooled_client)
+    assert pooled_client.pool.in_use == 0
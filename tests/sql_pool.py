@@ -0,0 +1,140 @@
+import threading
+import time
+import pytest
+from TracefyClients.sql_pool import BlockingConnectionPool, PoolTimeoutError
+
+
+class FakeCursor:
+    def __init__(self):
+        self.executed = []
+        self.closed = False
+
+    def execute(self, operation, params=()):
+        self.executed.append((operation, params))
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self):
+        self.in_transaction = False
+        self.closed = False
+        self.cursors = []
+
+    def cursor(self, **kwargs):
+        cursor = FakeCursor()
+        self.cursors.append(cursor)
+        return cursor
+
+    def is_connected(self):
+        return True
+
+    def reset_session(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(BlockingConnectionPool):
+    def _create_connection(self):
+        return FakeConnection()
+
+
+def test_pool_checkout_and_release():
+    pool = FakePool({}, pool_size=2)
+    first = pool.get_connection()
+    second = pool.get_connection()
+    assert pool.stats()["in_use"] == 2
+    assert pool.stats()["idle"] == 0
+
+    first.close()
+    second.close()
+    stats = pool.stats()
+    assert stats["in_use"] == 0
+    assert stats["idle"] == 2
+    assert stats["checkouts"] == 2
+
+
+def test_pool_timeout():
+    pool = FakePool({}, pool_size=1, timeout=0.05)
+    connection = pool.get_connection()
+    with pytest.raises(PoolTimeoutError):
+        pool.get_connection()
+    assert pool.stats()["timeouts"] == 1
+    assert pool.stats()["waiters"] == 0
+    connection.close()
+
+
+def test_pool_grows_up_to_max_size():
+    pool = FakePool({}, pool_size=1, max_size=2, timeout=0.05)
+    connections = [pool.get_connection(), pool.get_connection()]
+    assert pool.stats()["size"] == 2
+    with pytest.raises(PoolTimeoutError):
+        pool.get_connection()
+    for connection in connections:
+        connection.close()
+
+
+def test_pool_serves_waiters_in_order():
+    pool = FakePool({}, pool_size=1, timeout=5)
+    connection = pool.get_connection()
+    served = []
+
+    def wait(name):
+        connection = pool.get_connection()
+        served.append(name)
+        connection.close()
+
+    threads = []
+    for name in range(3):
+        thread = threading.Thread(target=wait, args=(name,))
+        thread.start()
+        threads.append(thread)
+        # make sure every thread is queued before the next one starts
+        while pool.stats()["waiters"] < name + 1:
+            time.sleep(0.001)
+
+    connection.close()
+    for thread in threads:
+        thread.join()
+    assert served == [0, 1, 2]
+
+
+def test_pool_prepared_statement_cache():
+    pool = FakePool({}, pool_size=1, reset_session=False, statement_cache_size=2)
+    connection = pool.get_connection()
+    first = connection.execute_prepared("SELECT 1", ())
+    assert connection.execute_prepared("SELECT 1", ()) is first
+    connection.execute_prepared("SELECT 2", ())
+    connection.execute_prepared("SELECT 3", ())
+    assert first.closed
+
+    stats = pool.stats()["statement_cache"]
+    assert stats == {"hits": 1, "misses": 3, "evictions": 1, "size": 2}
+    connection.close()
+
+
+def test_pool_prepared_statement_cache_with_named_params():
+    pool = FakePool({}, pool_size=1, reset_session=False, statement_cache_size=2)
+    connection = pool.get_connection()
+    query = "SELECT * FROM users WHERE id = %(id)s AND name = %(name)s"
+    cursor = connection.execute_prepared(query, {"name": "a", "id": 1})
+    assert connection.execute_prepared(query, {"id": 2, "name": "b"}) is cursor
+
+    (first, first_params), (second, second_params) = cursor.executed
+    # the very same query object, the cursor keeps its statement
+    assert second is first
+    assert first == "SELECT * FROM users WHERE id = %s AND name = %s"
+    assert (first_params, second_params) == ((1, "a"), (2, "b"))
+    assert pool.stats()["statement_cache"]["hits"] == 1
+    connection.close()
+
+
+def test_pool_reset_session_invalidates_prepared_statements():
+    pool = FakePool({}, pool_size=1, statement_cache_size=2)
+    connection = pool.get_connection()
+    connection.execute_prepared("SELECT 1", ())
+    connection.close()
+    assert pool.stats()["statement_cache"]["size"] == 0
@@ -0,0 +1,31 @@
+from TracefyClients.sql_profiler import QueryProfiler, fingerprint
+
+
+def test_fingerprint_normalises_literals_and_lists():
+    assert fingerprint("SELECT * FROM users WHERE id = 12 AND name = 'john'") == "SELECT * FROM users WHERE id = ? AND name = ?"
+    assert fingerprint("SELECT * FROM users WHERE id IN (%s, %s, %s)") == fingerprint("SELECT * FROM users WHERE id IN (%s)")
+    assert fingerprint("INSERT INTO t1 (`a`, `b`) VALUES (%s, %s), (%s, %s)") == "INSERT INTO t1 (`a`, `b`) VALUES (?+)"
+
+
+def test_profiler_top_queries():
+    profiler = QueryProfiler()
+    for i in range(3):
+        profiler.record(f"SELECT * FROM users WHERE id = {i}", 0.002, 1, 0.001)
+    profiler.record("SELECT * FROM waypoints", 0.5, 1000)
+
+    by_count = profiler.top(1, by="count")
+    assert by_count[0]["query"] == "SELECT * FROM users WHERE id = ?"
+    assert by_count[0]["count"] == 3
+    assert by_count[0]["rows"] == 3
+    assert by_count[0]["p95_time"] == 2
+
+    by_time = profiler.top(2, by="max_time")
+    assert by_time[0]["query"] == "SELECT * FROM waypoints"
+    assert by_time[0]["max_time"] == 500
+
+
+def test_profiler_limits_fingerprints():
+    profiler = QueryProfiler(max_fingerprints=2)
+    for table in ("a", "b", "c", "d"):
+        profiler.record(f"SELECT * FROM {table}", 0.001, 0)
+    assert {entry["query"] for entry in profiler.top(10)} == {"SELECT * FROM a", "SELECT * FROM b", "<other>"}
@@ -0,0 +1,102 @@
+import mysql.connector
+from TracefyClients.sql_replicas import Replica, ReplicaSet
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def ping(self):
+        if not self.pool.up:
+            raise mysql.connector.errors.OperationalError("replica down")
+
+    def close(self):
+        self.pool.in_use -= 1
+
+
+class FakePool:
+    def __init__(self):
+        self.up = True
+        self.in_use = 0
+
+    def get_connection(self, timeout=None):
+        self.timeout = timeout
+        if not self.up:
+            raise mysql.connector.errors.InterfaceError("replica down")
+        self.in_use += 1
+        return FakeConnection(self)
+
+    def stats(self):
+        return {"in_use": self.in_use}
+
+
+def replica_set(count: int, **kwargs) -> ReplicaSet:
+    return ReplicaSet([Replica(f"replica{i}", FakePool()) for i in range(count)], **kwargs)
+
+
+def test_round_robin_selection():
+    replicas = replica_set(2)
+    names = [replicas.choose().name for _ in range(4)]
+    assert names == ["replica0", "replica1", "replica0", "replica1"]
+
+
+def test_least_outstanding_selection():
+    replicas = replica_set(2, selection="least_outstanding")
+    connection = replicas.replicas[0].pool.get_connection()
+    assert replicas.choose().name == "replica1"
+    connection.close()
+
+
+def test_replica_ejected_and_restored():
+    replicas = replica_set(2, max_failures=2)
+    down = replicas.replicas[0]
+    down.pool.up = False
+
+    replicas.check_health()
+    assert down.healthy
+    replicas.check_health()
+    assert not down.healthy
+    assert {replicas.choose().name for _ in range(4)} == {"replica1"}
+
+    down.pool.up = True
+    replicas.check_health()
+    assert down.healthy
+    assert down.failures == 0
+
+
+def test_no_healthy_replica():
+    replicas = replica_set(1, max_failures=1)
+    replicas.replicas[0].pool.up = False
+    assert replicas.get_connection() is None
+    assert replicas.choose() is None
+
+
+def test_checkout_uses_short_timeout():
+    replicas = replica_set(1, checkout_timeout=0.01)
+    connection = replicas.get_connection()
+    assert replicas.replicas[0].pool.timeout == 0.01
+    assert connection.replica is replicas.replicas[0]
+
+
+def test_query_failures_eject_replica():
+    replicas = replica_set(2, max_failures=2)
+    failing = replicas.replicas[0]
+
+    # a wrong query says nothing about the replica
+    replicas.report(failing, mysql.connector.errors.ProgrammingError("syntax error"))
+    assert failing.failures == 0
+
+    replicas.report(failing, mysql.connector.errors.OperationalError("lost connection"))
+    replicas.report(failing, mysql.connector.errors.OperationalError("lost connection"))
+    assert not failing.healthy
+    assert {replicas.get_connection().replica.name for _ in range(4)} == {"replica1"}
+
+
+def test_query_success_resets_failures():
+    replicas = replica_set(1, max_failures=2)
+    replica = replicas.replicas[0]
+    replicas.report(replica, mysql.connector.errors.OperationalError("lost connection"))
+    replicas.report(replica)
+    replicas.report(replica, mysql.connector.errors.OperationalError("lost connection"))
+    assert replica.healthy
+    assert replica.failures == 1
@@ -0,0 +1,72 @@
+from TracefyClients.sql_schema import SchemaIntrospector, TABLES_QUERY, COLUMNS_QUERY, INDEXES_QUERY, FOREIGN_KEYS_QUERY
+
+
+class FakeSQLClient:
+    def __init__(self):
+        self.queries = []
+        self.results = {
+            TABLES_QUERY: [
+                {"TABLE_NAME": b"devices", "ENGINE": "InnoDB", "TABLE_COLLATION": "utf8mb4_0900_ai_ci", "TABLE_COMMENT": ""},
+            ],
+            COLUMNS_QUERY: [
+                {"TABLE_NAME": "devices", "COLUMN_NAME": "id", "COLUMN_TYPE": "int", "IS_NULLABLE": "NO",
+                 "COLUMN_DEFAULT": None, "EXTRA": "auto_increment", "GENERATION_EXPRESSION": "",
+                 "CHARACTER_SET_NAME": None, "COLLATION_NAME": None, "COLUMN_COMMENT": ""},
+                {"TABLE_NAME": "devices", "COLUMN_NAME": "name", "COLUMN_TYPE": "varchar(64)", "IS_NULLABLE": "YES",
+                 "COLUMN_DEFAULT": None, "EXTRA": "", "GENERATION_EXPRESSION": "",
+                 "CHARACTER_SET_NAME": "utf8mb4", "COLLATION_NAME": "utf8mb4_0900_ai_ci", "COLUMN_COMMENT": ""},
+                {"TABLE_NAME": "devices", "COLUMN_NAME": "user_id", "COLUMN_TYPE": "int", "IS_NULLABLE": "NO",
+                 "COLUMN_DEFAULT": "0", "EXTRA": "", "GENERATION_EXPRESSION": "",
+                 "CHARACTER_SET_NAME": None, "COLLATION_NAME": None, "COLUMN_COMMENT": ""},
+                {"TABLE_NAME": "devices", "COLUMN_NAME": "created_at", "COLUMN_TYPE": "timestamp", "IS_NULLABLE": "NO",
+                 "COLUMN_DEFAULT": "CURRENT_TIMESTAMP", "EXTRA": "DEFAULT_GENERATED", "GENERATION_EXPRESSION": "",
+                 "CHARACTER_SET_NAME": None, "COLLATION_NAME": None, "COLUMN_COMMENT": ""},
+            ],
+            INDEXES_QUERY: [
+                {"TABLE_NAME": "devices", "INDEX_NAME": "PRIMARY", "NON_UNIQUE": 0, "COLUMN_NAME": "id",
+                 "SUB_PART": None, "INDEX_TYPE": "BTREE", "EXPRESSION": None},
+                {"TABLE_NAME": "devices", "INDEX_NAME": "name_user", "NON_UNIQUE": 0, "COLUMN_NAME": "name",
+                 "SUB_PART": 10, "INDEX_TYPE": "BTREE", "EXPRESSION": None},
+                {"TABLE_NAME": "devices", "INDEX_NAME": "name_user", "NON_UNIQUE": 0, "COLUMN_NAME": "user_id",
+                 "SUB_PART": None, "INDEX_TYPE": "BTREE", "EXPRESSION": None},
+                {"TABLE_NAME": "devices", "INDEX_NAME": "lower_name", "NON_UNIQUE": 1, "COLUMN_NAME": None,
+                 "SUB_PART": None, "INDEX_TYPE": "BTREE", "EXPRESSION": b"lower(`name`)"},
+            ],
+            FOREIGN_KEYS_QUERY: [
+                {"TABLE_NAME": "devices", "CONSTRAINT_NAME": "devices_user", "COLUMN_NAME": "user_id",
+                 "REFERENCED_TABLE_NAME": "users", "REFERENCED_COLUMN_NAME": "id",
+                 "UPDATE_RULE": "NO ACTION", "DELETE_RULE": "CASCADE"},
+            ],
+        }
+
+    def fetch_all(self, query, params=(), cache=True):
+        self.queries.append(query)
+        return self.results[query]
+
+
+def test_create_table_sql():
+    introspector = SchemaIntrospector(FakeSQLClient(), "api")
+    assert introspector.get_create_table_sql("devices") == (
+        "DROP TABLE IF EXISTS `devices`;\n"
+        "CREATE TABLE `devices` (\n"
+        "  `id` int NOT NULL AUTO_INCREMENT,\n"
+        "  `name` varchar(64) DEFAULT NULL,\n"
+        "  `user_id` int NOT NULL DEFAULT '0',\n"
+        "  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,\n"
+        "  PRIMARY KEY (`id`),\n"
+        "  UNIQUE KEY `name_user` (`name`(10),`user_id`),\n"
+        "  KEY `lower_name` ((lower(`name`))),\n"
+        "  CONSTRAINT `devices_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE\n"
+        ") ENGINE=InnoDB DEFAULT COLLATE=utf8mb4_0900_ai_ci;"
+    )
+    assert introspector.get_create_table_sql("missing") is None
+
+
+def test_schema_is_cached_until_refresh():
+    client = FakeSQLClient()
+    introspector = SchemaIntrospector(client, "api")
+    introspector.dump()
+    introspector.dump()
+    assert len(client.queries) == 4
+    introspector.refresh()
+    assert len(client.queries) == 8
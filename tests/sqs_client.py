@@ -0,0 +1,118 @@
+import io
+import json
+import boto3
+import pytest
+from botocore.stub import Stubber, ANY
+from TracefyClients.s3_client import S3Client
+from TracefyClients.sqs_client import MAX_MESSAGE_SIZE, S3_PAYLOAD_ATTRIBUTE, SQSClient
+from TracefyClients.sqs_codecs import BrotliCodec
+
+QUEUE_URL = "https://sqs.eu-central-1.amazonaws.com/123456789012/test"
+
+
+@pytest.fixture
+def sqs_client(monkeypatch) -> (SQSClient, Stubber):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_SQS_ENDPOINT_URL", "https://sqs.eu-central-1.amazonaws.com")
+
+    # skip __init__, the stubber needs a client of its own instead of the shared AWS registry client
+    client = SQSClient.__new__(SQSClient)
+    client.codec = BrotliCodec()
+    client.s3_client = None
+    client.offload_threshold = MAX_MESSAGE_SIZE
+    client.offload_prefix = "sqs-payloads/test/"
+    client.delete_offloaded = True
+    client.sqs = boto3.resource("sqs", region_name="eu-central-1")
+    client.queue = client.sqs.Queue(QUEUE_URL)
+    return client, Stubber(client.sqs.meta.client)
+
+
+def test_add_many_to_queue_packs_batches_of_ten(sqs_client):
+    (client, stubber) = sqs_client
+    items = [{"id": i} for i in range(12)]
+    for ids in (range(10), range(10, 12)):
+        entries = [{"Id": str(i), "MessageBody": json.dumps({"id": i})} for i in ids]
+        response = {"Successful": [{"Id": str(i), "MessageId": f"m{i}", "MD5OfMessageBody": "x"} for i in ids], "Failed": []}
+        stubber.add_response("send_message_batch", response, {"QueueUrl": QUEUE_URL, "Entries": entries})
+
+    with stubber:
+        results = client.add_many_to_queue(items)
+
+    assert [r["message_id"] for r in results] == [f"m{i}" for i in range(12)]
+
+
+def test_add_many_to_queue_retries_only_failed_entries(sqs_client):
+    (client, stubber) = sqs_client
+    items = [{"id": 0}, {"id": 1}, {"id": 2}]
+    stubber.add_response("send_message_batch", {
+        "Successful": [{"Id": "0", "MessageId": "m0", "MD5OfMessageBody": "x"}],
+        "Failed": [
+            {"Id": "1", "SenderFault": False, "Code": "InternalError"},
+            {"Id": "2", "SenderFault": True, "Code": "InvalidMessageContents"},
+        ],
+    }, {"QueueUrl": QUEUE_URL, "Entries": ANY})
+    stubber.add_response("send_message_batch", {
+        "Successful": [{"Id": "1", "MessageId": "m1", "MD5OfMessageBody": "x"}],
+        "Failed": [],
+    }, {"QueueUrl": QUEUE_URL, "Entries": [{"Id": "1", "MessageBody": json.dumps({"id": 1})}]})
+
+    with stubber:
+        results = client.add_many_to_queue(items)
+
+    assert results[0] == {"success": True, "message_id": "m0"}
+    assert results[1] == {"success": True, "message_id": "m1"}
+    assert results[2]["success"] is False
+    assert results[2]["error"].startswith("InvalidMessageContents")
+
+
+def test_add_many_to_queue_respects_batch_size(sqs_client):
+    (client, _) = sqs_client
+    body = "x" * 100000
+    results = [{} for _ in range(4)]
+    batches = client._pack_batches([(str(i), body, {}) for i in range(3)] + [("3", "x" * 300000, {})], results)
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert results[3]["success"] is False
+
+
+def test_compressed_messages_round_trip(sqs_client):
+    (client, _) = sqs_client
+
+    class Message:
+        body, message_attributes = client.encode_message({"id": 1}, compressed=True)
+
+    assert client.decompress_message(Message()) == {"id": 1}
+
+
+def test_large_messages_are_offloaded_to_s3(sqs_client, monkeypatch):
+    (client, _) = sqs_client
+    monkeypatch.setenv("S3_BUCKET", "payloads")
+    client.s3_client = S3Client()
+    client.offload_threshold = 1000
+    s3_stubber = Stubber(client.s3_client.s3)
+    data = [{"id": i} for i in range(200)]
+    body = json.dumps(data).encode("utf-8")
+
+    s3_stubber.add_response("put_object", {}, {"Bucket": "payloads", "Key": ANY, "Body": body})
+    with s3_stubber:
+        pointer, attributes = client.encode_message(data)
+    assert attributes[S3_PAYLOAD_ATTRIBUTE]["StringValue"] == str(len(body))
+    key = json.loads(pointer)["s3_key"]
+    assert key.startswith("sqs-payloads/test/")
+
+    class Message:
+        message_attributes = attributes
+
+    Message.body = pointer
+    s3_stubber.add_response("get_object", {"Body": io.BytesIO(body)}, {"Bucket": "payloads", "Key": key})
+    s3_stubber.add_response("delete_object", {}, {"Bucket": "payloads", "Key": key})
+    with s3_stubber:
+        assert client.decompress_message(Message()) == data
+        client.delete_payloads([Message()])
+    s3_stubber.assert_no_pending_responses()
+
+
+def test_add_to_queue_checks_serialized_size(sqs_client):
+    (client, _) = sqs_client
+    with pytest.raises(ValueError):
+        client.add_to_queue(["x" * 300000])
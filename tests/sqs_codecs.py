@@ -0,0 +1,40 @@
+import base64
+import json
+
+import brotli
+import pytest
+
+from TracefyClients.sqs_codecs import (
+    BrotliCodec, Codec, GzipCodec, ZstdCodec, codec_from_env, decode_body, register_codec, train_zstd_dictionary
+)
+
+WAYPOINT = {"device_id": "a1b2c3", "timestamp": 1726000000, "lat": 52.0907, "lng": 5.1214, "speed": 12.5}
+
+
+@pytest.mark.parametrize("codec", [Codec(), BrotliCodec(quality=4), GzipCodec(), ZstdCodec()])
+def test_codecs_round_trip(codec):
+    body = codec.encode([WAYPOINT] * 20)
+    assert decode_body(body, codec.name) == [WAYPOINT] * 20
+
+
+def test_zstd_dictionary_codec_round_trip():
+    samples = [dict(WAYPOINT, timestamp=1726000000 + i, speed=i % 40) for i in range(2000)]
+    codec = ZstdCodec(dictionary=train_zstd_dictionary(samples, size=4096))
+    register_codec(codec)
+
+    assert codec.name.startswith("zstd:")
+    assert decode_body(codec.encode(WAYPOINT), codec.name) == WAYPOINT
+    assert len(codec.encode(WAYPOINT)) < len(ZstdCodec().encode(WAYPOINT))
+
+
+def test_messages_without_codec_are_detected():
+    legacy = base64.b64encode(brotli.compress(json.dumps(WAYPOINT).encode("utf-8"))).decode()
+    assert decode_body(legacy) == WAYPOINT
+    assert decode_body(json.dumps(WAYPOINT)) == WAYPOINT
+
+
+def test_unknown_codecs_are_rejected():
+    with pytest.raises(ValueError):
+        decode_body("{}", "lz4")
+    with pytest.raises(ValueError):
+        codec_from_env("lz4", brotli_quality=11)
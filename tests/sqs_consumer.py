@@ -0,0 +1,77 @@
+import threading
+import time
+from TracefyClients.sqs_consumer import SQSConsumer
+
+
+class FakeMessage:
+    def __init__(self, i: int):
+        self.message_id = f"m{i}"
+        self.receipt_handle = f"r{i}"
+        self.body = str(i)
+
+
+class FakeQueue:
+    def __init__(self, count: int):
+        self.messages = [FakeMessage(i) for i in range(count)]
+        self.deleted = []
+        self.extended = []
+        self.lock = threading.Lock()
+
+    def receive_messages(self, MaxNumberOfMessages, WaitTimeSeconds, **kwargs):
+        with self.lock:
+            messages, self.messages = self.messages[:MaxNumberOfMessages], self.messages[MaxNumberOfMessages:]
+        if not messages:
+            time.sleep(0.01)
+        return messages
+
+    def delete_messages(self, Entries):
+        assert len(Entries) <= 10
+        self.deleted += [entry["ReceiptHandle"] for entry in Entries]
+        return {"Successful": Entries}
+
+    def change_message_visibility_batch(self, Entries):
+        self.extended += [entry["ReceiptHandle"] for entry in Entries]
+
+
+class FakeSQSClient:
+    def __init__(self, count: int):
+        self.queue = FakeQueue(count)
+
+    def decompress_message(self, message):
+        return int(message.body)
+
+    def delete_payloads(self, messages):
+        pass
+
+
+def test_consumer_handles_and_deletes_messages():
+    client = FakeSQSClient(25)
+    handled = []
+
+    def handler(data):
+        if data == 3:
+            raise ValueError("bad message")
+        handled.append(data)
+
+    consumer = SQSConsumer(client, handler, max_workers=4, wait_time_seconds=0)
+    consumer.start()
+    deadline = time.monotonic() + 5
+    while consumer.handled + consumer.failed < 25 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    consumer.stop()
+
+    assert sorted(handled) == [i for i in range(25) if i != 3]
+    assert sorted(client.queue.deleted) == sorted(f"r{i}" for i in range(25) if i != 3)
+    assert consumer.failed == 1
+
+
+def test_consumer_extends_visibility_of_slow_messages():
+    client = FakeSQSClient(1)
+    consumer = SQSConsumer(client, lambda data: time.sleep(0.9), wait_time_seconds=0, visibility_timeout=1)
+    consumer.start()
+    while consumer.handled < 1:
+        time.sleep(0.01)
+    consumer.stop()
+
+    assert client.queue.extended == ["r0"]
+    assert client.queue.deleted == ["r0"]
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+
+import pytest
+
+from TracefyClients.sqs_client import SQSClient
+from TracefyClients.sqs_codecs import BrotliCodec
+from TracefyClients.sqs_producer import BufferFullError, MessageSendError, SQSProducer
+
+
+class FakeQueue:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def send_messages(self, Entries):
+        time.sleep(self.delay)
+        with self.lock:
+            self.batches.append(Entries)
+        return {
+            "Successful": [{"Id": entry["Id"], "MessageId": json.loads(entry["MessageBody"])["id"]}
+                           for entry in Entries if entry["MessageBody"] != '{"id": "bad"}'],
+            "Failed": [{"Id": entry["Id"], "SenderFault": True, "Code": "InvalidMessageContents"}
+                       for entry in Entries if entry["MessageBody"] == '{"id": "bad"}'],
+        }
+
+
+def sqs_client(delay: float = 0.0) -> SQSClient:
+    client = SQSClient.__new__(SQSClient)
+    client.codec = BrotliCodec()
+    client.s3_client = None
+    client.queue = FakeQueue(delay)
+    return client
+
+
+def test_producer_sends_in_batches():
+    client = sqs_client()
+    producer = SQSProducer(client, compressed=False, linger=0.2)
+    futures = [producer.send({"id": str(i)}) for i in range(25)]
+    futures.append(producer.send({"id": "bad"}))
+    producer.close()
+
+    assert [future.result() for future in futures[:25]] == [str(i) for i in range(25)]
+    with pytest.raises(MessageSendError):
+        futures[25].result()
+    assert all(len(batch) <= 10 for batch in client.queue.batches)
+    assert sum(len(batch) for batch in client.queue.batches) == 26
+    assert producer.stats() == {"buffered": 0, "sent": 25, "failed": 1}
+
+
+def test_full_buffer_raises():
+    producer = SQSProducer(sqs_client(delay=0.5), compressed=False, max_buffer=1, workers=1, linger=0, put_timeout=0.05)
+    with pytest.raises(BufferFullError):
+        for i in range(20):
+            producer.send({"id": str(i)})
+    producer.close()
+
+
+def test_cancelled_futures_are_not_sent():
+    client = sqs_client(delay=0.3)
+    producer = SQSProducer(client, compressed=False, linger=0, workers=1)
+    # keep the worker busy sending the first message while the others are cancelled
+    first = producer.send({"id": "first"})
+    time.sleep(0.1)
+    futures = [producer.send({"id": str(i)}) for i in range(5)]
+    assert futures[0].cancel() and futures[3].cancel()
+    producer.close()
+
+    assert first.result() == "first"
+    assert [future.result() for future in futures if not future.cancelled()] == ["1", "2", "4"]
+    assert sum(len(batch) for batch in client.queue.batches) == 4
+    assert producer.stats() == {"buffered": 0, "sent": 4, "failed": 0}